@@ -0,0 +1,72 @@
+"""Recall@k and latency of the IVF index against exact search on synthetic embeddings.
+
+Usage: python benchmarks/ann_recall.py --vectors 100000 --dim 256 --nprobe 1 4 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.embedding_index import EmbeddingIndex  # noqa: E402
+from services.ivf_index import IVFIndex  # noqa: E402
+
+
+def synthetic_embeddings(count: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """Clustered unit vectors, loosely mimicking topic structure in meeting embeddings"""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def timed_search(index, queries, top_k, **params):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append([meeting_id for meeting_id, _ in index.search(query, top_k, **params)])
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return results, elapsed_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = synthetic_embeddings(args.vectors, args.dim, args.clusters, rng)
+    queries = synthetic_embeddings(args.queries, args.dim, args.clusters, rng)
+
+    exact = EmbeddingIndex()
+    # Load everything before the first training run rather than retraining as it grows
+    ivf = IVFIndex(nlist=args.nlist, min_train_size=args.vectors + 1)
+    for meeting_id, vector in enumerate(vectors, start=1):
+        exact.add(meeting_id, vector)
+        ivf.add(meeting_id, vector)
+    ivf.min_train_size = 1
+    start = time.perf_counter()
+    ivf.train()
+    print(f"trained {ivf._centroids.shape[0]} lists on {args.vectors} x {args.dim} in "
+          f"{time.perf_counter() - start:.2f}s")
+
+    truth, exact_ms = timed_search(exact, queries, args.top_k)
+    print(f"{'backend':<12}{'nprobe':>8}{f'recall@{args.top_k}':>12}{'ms/query':>12}")
+    print(f"{'exact':<12}{'-':>8}{1.0:>12.3f}{exact_ms:>12.3f}")
+    for nprobe in args.nprobe:
+        found, ivf_ms = timed_search(ivf, queries, args.top_k, nprobe=nprobe)
+        recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, truth) if b])
+        print(f"{'ivf':<12}{nprobe:>8}{recall:>12.3f}{ivf_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""Concurrent end-to-end load test of the HTTP API with per-endpoint latency percentiles.
+
+Drives uploads, semantic and keyword search, similar meetings, the meeting
+list, meeting details (``meeting``, and ``meeting_revalidate``, which sends
+back the ETag it got) and cross-meeting insights at once for a fixed duration, then reports
+requests per second and p50/p95/p99 latency per endpoint. With ``--baseline``
+the run fails (exit status 1) when an endpoint's p50 or p95 is slower, or its
+throughput lower, than the baseline allows; ``--write-baseline`` records a new
+one. Latency depends on the machine, so record the baseline where the check
+runs, and use ``--rounds`` to compare medians of several runs.
+
+Usage, against a server started with OPENAI_BASE_URL pointing at benchmarks/fake_openai.py:
+    python benchmarks/api_load.py --url http://127.0.0.1:8000 --duration 30 --concurrency 16
+or start the fake server and the app on a seeded database in one go:
+    python benchmarks/seed.py --meetings 10000 --database-url sqlite:///./bench.db --dim 256
+    python benchmarks/api_load.py --spawn --database-url sqlite:///./bench.db --dim 256 \\
+        --rounds 3 --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import FILLER, TOPICS  # noqa: E402
+
+DEFAULT_MIX = "search=4,search_keyword=2,similar=3,list=3,insights=1,upload=1"
+# A run regresses when p50/p95 latency grows, or throughput drops, by more than this share;
+# p99 is reported but too noisy over a short run to gate on
+DEFAULT_TOLERANCE = 0.5
+GATED_LATENCIES = ("p50_ms", "p95_ms")
+# ...or when the error rate rises by more than this many percentage points
+ERROR_RATE_TOLERANCE = 0.01
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = entry.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown endpoint {name!r}; expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def wav_bytes(rng: random.Random, seconds: float = 0.25, rate: int = 8000) -> bytes:
+    """A short, unique WAV file, so every upload is processed rather than deduplicated"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as output:
+        output.setnchannels(1)
+        output.setsampwidth(1)
+        output.setframerate(rate)
+        output.writeframes(rng.randbytes(int(seconds * rate)))
+    return buffer.getvalue()
+
+
+def _query(rng: random.Random) -> str:
+    return " ".join(rng.sample(TOPICS[rng.choice(list(TOPICS))], 2) + rng.sample(FILLER, 2))
+
+
+async def _search(client, rng, ids):
+    return await client.post("/api/meetings/search", json={"query": _query(rng), "top_k": 5})
+
+
+async def _search_keyword(client, rng, ids):
+    return await client.post("/api/meetings/search", json={"query": _query(rng), "top_k": 5, "mode": "keyword"})
+
+
+async def _similar(client, rng, ids):
+    return await client.get(f"/api/meetings/{rng.choice(ids)}/similar")
+
+
+async def _list(client, rng, ids):
+    return await client.get("/api/meetings", params={"limit": 50})
+
+
+async def _meeting(client, rng, ids):
+    return await client.get(f"/api/meetings/{rng.choice(ids)}")
+
+
+async def _meeting_revalidate(client, rng, ids):
+    """A client re-opening meetings it has seen before, sending back the validators it was given"""
+    meeting_id = rng.choice(ids[:20])
+    response = await client.get(f"/api/meetings/{meeting_id}", headers=_validators.get(meeting_id, {}))
+    if response.status_code == 200:
+        _validators[meeting_id] = {name: response.headers[header] for name, header in
+                                   (("If-None-Match", "etag"), ("If-Modified-Since", "last-modified"))
+                                   if header in response.headers}
+    return response
+
+
+async def _insights(client, rng, ids):
+    return await client.post("/api/insights/cross-meeting", json=rng.sample(ids, min(20, len(ids))))
+
+
+async def _upload(client, rng, ids):
+    return await client.post("/api/meetings/upload", data={"title": f"Load test {rng.random():.6f}"},
+                             files={"audio_file": ("load.wav", wav_bytes(rng), "audio/wav")})
+
+
+# Validators of the meetings fetched by the revalidate scenario
+_validators: Dict[int, Dict[str, str]] = {}
+
+SCENARIOS = {
+    "search": _search,
+    "search_keyword": _search_keyword,
+    "similar": _similar,
+    "list": _list,
+    "meeting": _meeting,
+    "meeting_revalidate": _meeting_revalidate,
+    "insights": _insights,
+    "upload": _upload,
+}
+
+
+async def run_load(url: str, mix: Dict[str, float], duration: float, concurrency: int,
+                   seed: int = 0, transport=None, accept_encoding: str = None) -> Dict[str, Dict[str, float]]:
+    """Run ``concurrency`` workers for ``duration`` seconds; returns per-endpoint statistics"""
+    samples: Dict[str, List[Tuple[float, bool]]] = {name: [] for name in mix}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Accept-Encoding": accept_encoding} if accept_encoding else None
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits, transport=transport,
+                                 headers=headers) as client:
+        listed = await client.get("/api/meetings", params={"limit": 200, "fields": "id"})
+        listed.raise_for_status()
+        ids = [meeting["id"] for meeting in listed.json()]
+        if not ids:
+            # Nothing to look up yet; only uploads, searches and listing make sense
+            mix = {name: weight for name, weight in mix.items()
+                   if name not in ("similar", "insights", "meeting", "meeting_revalidate")}
+        names, weights = list(mix), list(mix.values())
+        deadline = time.perf_counter() + duration
+
+        async def worker(number: int):
+            rng = random.Random(seed * 1000 + number)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await SCENARIOS[name](client, rng, ids)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                samples[name].append((time.perf_counter() - started, ok))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(number) for number in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed)
+
+
+def summarize(samples: Dict[str, List[Tuple[float, bool]]], elapsed: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, timings in samples.items():
+        if not timings:
+            continue
+        latencies = np.array([latency for latency, _ in timings]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        errors = sum(1 for _, ok in timings if not ok)
+        results[name] = {
+            "requests": len(timings),
+            "errors": errors,
+            "error_rate": round(errors / len(timings), 4),
+            "rps": round(len(timings) / elapsed, 2),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+        }
+    return results
+
+
+def median_of_rounds(rounds: List[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    """Per-endpoint median of every statistic over several runs; request and error counts are summed"""
+    combined = {}
+    for name in dict.fromkeys(name for results in rounds for name in results):
+        runs = [results[name] for results in rounds if name in results]
+        combined[name] = {
+            metric: sum(run[metric] for run in runs) if metric in ("requests", "errors")
+            else round(statistics.median(run[metric] for run in runs), 4 if metric == "error_rate" else 2)
+            for metric in runs[0]
+        }
+    return combined
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                        tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Human-readable regressions of ``results`` against ``baseline``; empty when within tolerance"""
+    regressions = []
+    for name, expected in baseline.items():
+        actual = results.get(name)
+        if actual is None:
+            regressions.append(f"{name}: no requests were made")
+            continue
+        for metric in GATED_LATENCIES:
+            if actual[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {actual[metric]:.1f} > baseline {expected[metric]:.1f}")
+        if actual["rps"] < expected["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {actual['rps']:.1f} < baseline {expected['rps']:.1f}")
+        if actual["error_rate"] > expected.get("error_rate", 0) + ERROR_RATE_TOLERANCE:
+            regressions.append(f"{name}: error rate {actual['error_rate']:.2%} "
+                               f"> baseline {expected.get('error_rate', 0):.2%}")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]]):
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in results.items():
+        print(f"{name:<16}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>9.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+def _wait_until_up(url: str, path: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            if httpx.get(url + path, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+@contextmanager
+def spawned_servers(database_url: str, app_port: int, fake_port: int, fake_args: List[str]):
+    """Run the fake OpenAI server and the app as subprocesses; yields the app's URL"""
+    fake_url, app_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{app_port}"
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            fake = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "fake_openai.py"),
+                                     "--port", str(fake_port), *fake_args], cwd=ROOT)
+            processes.append(fake)
+            _wait_until_up(fake_url, "/stats", fake)
+            env = {**os.environ, "OPENAI_BASE_URL": f"{fake_url}/v1", "OPENAI_API_KEY": "fake",
+                   "DATABASE_URL": database_url, "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+                   "VECTOR_INDEX_PATH": os.path.join(workdir, "embedding_index.npz")}
+            app = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+                                    "--log-level", "warning"], cwd=ROOT, env=env)
+            processes.append(app)
+            _wait_until_up(app_url, "/api/meetings?limit=1", app, timeout=300)
+            yield app_url
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=1, help="runs whose per-endpoint medians are reported")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accept-encoding", help="e.g. identity to measure without response compression")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="fail if results regress against this file")
+    parser.add_argument("--write-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--spawn", action="store_true", help="start the fake OpenAI server and the app")
+    parser.add_argument("--database-url", default="sqlite:///./bench.db", help="database of the spawned app")
+    parser.add_argument("--app-port", type=int, default=8000)
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--dim", type=int, default=None, help="embedding dimension of the spawned fake server")
+    parser.add_argument("--fake-latency-scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    config = {"duration": args.duration, "concurrency": args.concurrency, "mix": args.mix, "rounds": args.rounds,
+              "host": f"{platform.machine()} x{os.cpu_count()}"}
+
+    def run_rounds(url: str) -> Dict[str, Dict[str, float]]:
+        return median_of_rounds([
+            asyncio.run(run_load(url, mix, args.duration, args.concurrency, args.seed + round_number,
+                                 accept_encoding=args.accept_encoding))
+            for round_number in range(args.rounds)
+        ])
+
+    if args.spawn:
+        fake_args = ["--latency-scale", str(args.fake_latency_scale)]
+        if args.dim:
+            fake_args += ["--dim", str(args.dim)]
+        with spawned_servers(args.database_url, args.app_port, args.fake_port, fake_args) as url:
+            results = run_rounds(url)
+    else:
+        results = run_rounds(args.url)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": config, "endpoints": results}, f, indent=2)
+
+    if args.baseline and args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"config": config, "endpoints": results}, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"warning: baseline was recorded with {baseline.get('config')}, this run used {config}")
+        regressions = compare_to_baseline(results, baseline["endpoints"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Offline stand-in for the OpenAI API, for load tests and benchmarks.
+
+Serves the endpoints OpenAIService uses with configurable lognormal latency,
+injected 429 and 500 responses, and deterministic output: embeddings hash
+each word into a fixed dimension, so texts sharing vocabulary are close and a
+text always maps to the same vector (``benchmarks/seed.py`` stores the same
+vectors for seeded meetings).
+
+Usage: python benchmarks/fake_openai.py --port 8900 --latency embeddings=40:0.3 chat=400:0.5 \\
+           --rate-limit-fraction 0.02
+Then start the app with OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=fake.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+FAKE_EMBEDDING_DIM = 1536
+
+# Median milliseconds and lognormal spread of each endpoint's latency
+DEFAULT_LATENCY = {
+    "embeddings": (40.0, 0.3),
+    "chat": (400.0, 0.5),
+    "transcriptions": (800.0, 0.4),
+    "images": (1500.0, 0.3),
+}
+
+_WORD = re.compile(r"[a-z0-9']+")
+_SENTENCES = [
+    "Let's review the roadmap for the next quarter",
+    "The budget needs another pass before finance signs off",
+    "Customer feedback on onboarding has been mixed",
+    "We agreed to ship the beta to ten design partners",
+    "Hiring for the platform team is behind plan",
+    "Latency on the search service regressed after the release",
+    "Marketing wants the launch date confirmed by Friday",
+    "The vendor contract renews at the end of the month",
+]
+_OWNERS = ["Alice", "Bob", "Carol", "Dan", "Erin", "Farid"]
+
+
+@lru_cache(maxsize=200_000)
+def _feature(word: str, dim: int) -> Tuple[int, float]:
+    value = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def fake_embedding(text: str, dim: int = FAKE_EMBEDDING_DIM) -> np.ndarray:
+    """Unit vector of signed, hashed word counts (the hashing trick)"""
+    counts = Counter(_WORD.findall(text.lower()))
+    vector = np.zeros(dim, dtype=np.float32)
+    if counts:
+        features = [_feature(word, dim) for word in counts]
+        indexes = np.fromiter((index for index, _ in features), dtype=np.int64, count=len(features))
+        weights = np.fromiter((sign * count for (_, sign), count in zip(features, counts.values())),
+                              dtype=np.float32, count=len(features))
+        np.add.at(vector, indexes, weights)
+    norm = float(np.linalg.norm(vector))
+    if norm == 0:
+        vector[0], norm = 1.0, 1.0
+    return vector / norm
+
+
+def fake_png(seed: bytes, size: int = 64) -> bytes:
+    """A small RGB gradient PNG whose colours depend on ``seed``"""
+    digest = hashlib.sha256(seed).digest()
+    rows = b"".join(
+        b"\x00" + bytes(value for x in range(size)
+                        for value in ((digest[0] + 4 * x) % 256, (digest[1] + 4 * y) % 256, digest[2]))
+        for y in range(size)
+    )
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def _tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 4))
+
+
+@dataclass
+class FakeConfig:
+    dim: int = FAKE_EMBEDDING_DIM
+    latency: Dict[str, Tuple[float, float]] = field(default_factory=lambda: dict(DEFAULT_LATENCY))
+    latency_scale: float = 1.0
+    rate_limit_fraction: float = 0.0
+    error_fraction: float = 0.0
+    retry_after_ms: int = 200
+    seed: int = 0
+
+
+def parse_latency(specs: List[str]) -> Dict[str, Tuple[float, float]]:
+    """``["embeddings=40:0.3", "chat=400"]`` -> {endpoint: (median_ms, sigma)} over the defaults"""
+    latency = dict(DEFAULT_LATENCY)
+    for spec in specs:
+        endpoint, _, value = spec.partition("=")
+        median, _, sigma = value.partition(":")
+        if endpoint not in latency:
+            raise ValueError(f"Unknown endpoint {endpoint!r}; expected one of {', '.join(latency)}")
+        latency[endpoint] = (float(median), float(sigma) if sigma else latency[endpoint][1])
+    return latency
+
+
+def create_app(config: FakeConfig = None) -> FastAPI:
+    config = config or FakeConfig()
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Fake OpenAI")
+    app.state.counts = Counter()
+
+    async def respond(endpoint: str, build):
+        """Sleep for the endpoint's latency, then answer with an injected error or ``build()``"""
+        app.state.counts[endpoint] += 1
+        median, sigma = config.latency[endpoint]
+        await asyncio.sleep(median * config.latency_scale * math.exp(sigma * rng.gauss(0, 1)) / 1000)
+        roll = rng.random()
+        if roll < config.rate_limit_fraction:
+            app.state.counts["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after-ms": str(config.retry_after_ms)},
+            )
+        if roll < config.rate_limit_fraction + config.error_fraction:
+            app.state.counts["errors"] += 1
+            return JSONResponse({"error": {"message": "Injected server error", "type": "server_error"}},
+                                status_code=500)
+        return build()
+
+    @app.get("/stats")
+    async def stats():
+        return dict(app.state.counts)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dim = body.get("dimensions") or config.dim
+
+        def build():
+            data = []
+            for index, text in enumerate(inputs):
+                vector = fake_embedding(text, dim)
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": index, "embedding": embedding})
+            tokens = sum(_tokens(text) for text in inputs)
+            return JSONResponse({"object": "list", "model": body["model"], "data": data,
+                                 "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+        return await respond("embeddings", build)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        function = (body.get("function_call") or {}).get("name")
+
+        def build():
+            digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+            message = {"role": "assistant", "content": None}
+            if function == "extract_meeting_insights":
+                arguments = {
+                    "summary": f"Discussion covering: {prompt[-300:].strip()}",
+                    "action_items": [
+                        {"task": _SENTENCES[(digest >> shift) % len(_SENTENCES)],
+                         "owner": _OWNERS[(digest >> (shift + 3)) % len(_OWNERS)], "deadline": "Friday"}
+                        for shift in range(0, 12, 4)
+                    ],
+                    "decisions": [{"decision": _SENTENCES[digest % len(_SENTENCES)], "context": "Agreed by all"}],
+                }
+                message["function_call"] = {"name": function, "arguments": json.dumps(arguments)}
+            elif function == "draft_meeting_summary":
+                arguments = {"summary": prompt[-200:].strip(), "key_points": _SENTENCES[:3]}
+                message["function_call"] = {"name": function, "arguments": json.dumps(arguments)}
+            else:
+                # Translations come back as long as their source
+                message["content"] = prompt
+            completion = _tokens(message["content"] or message["function_call"]["arguments"])
+            prompt_tokens = sum(_tokens(item["content"] or "") for item in body["messages"])
+            return JSONResponse({
+                "id": f"chatcmpl-{digest % 10 ** 12}", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "message": message,
+                             "finish_reason": "function_call" if function else "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion,
+                          "total_tokens": prompt_tokens + completion},
+            })
+
+        return await respond("chat", build)
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        audio = await form["file"].read()
+        digest = hashlib.sha256(audio).digest()
+        sentences = [_SENTENCES[byte % len(_SENTENCES)] for byte in digest[:12]]
+        text = ". ".join(sentences) + "."
+
+        def build():
+            if form.get("response_format") == "verbose_json":
+                segments = [{"id": i, "seek": 0, "start": i * 5.0, "end": (i + 1) * 5.0, "text": f" {sentence}.",
+                             "tokens": [], "temperature": 0.0, "avg_logprob": 0.0, "compression_ratio": 1.0,
+                             "no_speech_prob": 0.0} for i, sentence in enumerate(sentences)]
+                return JSONResponse({"task": "transcribe", "language": "english",
+                                     "duration": len(sentences) * 5.0, "text": text, "segments": segments})
+            return PlainTextResponse(text)
+
+        return await respond("transcriptions", build)
+
+    @app.post("/v1/images/generations")
+    async def images(request: Request):
+        body = await request.json()
+        prompt = body["prompt"].encode("utf-8")
+
+        def build():
+            if body.get("response_format") == "b64_json":
+                image = {"b64_json": base64.b64encode(fake_png(prompt)).decode("ascii")}
+            else:
+                image = {"url": f"https://fake-openai.invalid/images/{hashlib.sha256(prompt).hexdigest()[:16]}.png"}
+            return JSONResponse({"created": int(time.time()), "data": [image]})
+
+        return await respond("images", build)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--dim", type=int, default=FAKE_EMBEDDING_DIM, help="embedding dimension")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="ENDPOINT=MEDIAN_MS[:SIGMA]",
+                        help=f"per-endpoint latency, endpoints: {', '.join(DEFAULT_LATENCY)}")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every latency")
+    parser.add_argument("--rate-limit-fraction", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--error-fraction", type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeConfig(dim=args.dim, latency=parse_latency(args.latency), latency_scale=args.latency_scale,
+                        rate_limit_fraction=args.rate_limit_fraction, error_fraction=args.error_fraction,
+                        retry_after_ms=args.retry_after_ms, seed=args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Fill a database with synthetic, fully processed meetings for load tests.
+
+Meetings are drawn from a handful of topics, so searches and similar-meeting
+lists have real structure, and their embeddings are the ones the fake OpenAI
+server (benchmarks/fake_openai.py) returns for the same text. Rows are written
+in bulk, one transaction per batch.
+
+Usage: python benchmarks/seed.py --meetings 100000 [--database-url sqlite:///./bench.db] [--dim 1536]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from benchmarks.fake_openai import FAKE_EMBEDDING_DIM, fake_embedding  # noqa: E402
+from database import (  # noqa: E402
+    ActionItemRecord, DecisionRecord, Meeting, SessionLocal, action_item_rows, create_db_engine, decision_rows,
+)
+from migrations import run_migrations  # noqa: E402
+from services.neighbors import rebuild_neighbors  # noqa: E402
+from services.pipeline import COMPLETED, EMBEDDING_MAX_CHARS, STAGES, embedding_version  # noqa: E402
+
+TOPICS = {
+    "roadmap": ["roadmap", "quarter", "milestone", "priorities", "scope", "launch", "beta", "timeline"],
+    "budget": ["budget", "forecast", "spend", "finance", "invoice", "headcount", "savings", "vendor"],
+    "hiring": ["hiring", "candidates", "interview", "offer", "recruiter", "onboarding", "referral", "role"],
+    "incident": ["outage", "latency", "rollback", "postmortem", "alert", "database", "deploy", "pager"],
+    "sales": ["pipeline", "customer", "renewal", "discount", "contract", "demo", "churn", "quota"],
+    "design": ["mockups", "prototype", "usability", "accessibility", "research", "palette", "layout", "feedback"],
+}
+FILLER = ["we", "should", "the", "team", "next", "week", "agreed", "review", "update", "plan", "on", "for",
+          "before", "after", "with", "about", "need", "to", "and", "check"]
+OWNERS = ["Alice", "Bob", "Carol", "Dan", "Erin", "Farid", None]
+
+
+def synthetic_meeting(meeting_id: int, rng: random.Random, words: int, now: datetime) -> dict:
+    topic = rng.choice(list(TOPICS))
+    vocabulary = TOPICS[topic]
+    sentences = []
+    for _ in range(max(1, words // 10)):
+        sentence = [rng.choice(vocabulary if rng.random() < 0.4 else FILLER) for _ in range(10)]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    transcription = " ".join(sentences)
+    title = f"{topic.capitalize()} sync {meeting_id}"
+    action_items = [
+        {"task": f"Follow up on {rng.choice(vocabulary)}", "owner": rng.choice(OWNERS),
+         "deadline": rng.choice(["Friday", "Next week", "End of month", None])}
+        for _ in range(rng.randint(0, 4))
+    ]
+    decisions = [{"decision": f"Go ahead with the {rng.choice(vocabulary)} plan", "context": topic}
+                 for _ in range(rng.randint(0, 2))]
+    return {
+        "id": meeting_id,
+        "title": title,
+        "audio_filename": f"seed-{meeting_id}.wav",
+        "transcription": transcription,
+        "summary": f"The team discussed {topic}: {sentences[0]}",
+        "action_items": action_items,
+        "decisions": decisions,
+        "created_at": now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+        "status": COMPLETED,
+        "stages": {name: {"status": COMPLETED, "attempts": 1, "duration_ms": 0, "error": None} for name in STAGES},
+    }
+
+
+def seed(bind, meetings: int, dim: int = FAKE_EMBEDDING_DIM, words: int = 300, batch_size: int = 2000,
+         random_seed: int = 7) -> int:
+    """Insert ``meetings`` synthetic meetings after any existing ones; returns the first new id"""
+    rng = random.Random(random_seed)
+    now, version = datetime.utcnow(), embedding_version()
+    with bind.connect() as connection:
+        first_id = (connection.scalar(select(func.max(Meeting.id))) or 0) + 1
+    for start in range(first_id, first_id + meetings, batch_size):
+        rows = [synthetic_meeting(meeting_id, rng, words, now)
+                for meeting_id in range(start, min(start + batch_size, first_id + meetings))]
+        for row in rows:
+            # The same text the pipeline embeds, so fake-server query vectors share the space
+            text = f"{row['title']}\n{row['transcription'][:EMBEDDING_MAX_CHARS]}"
+            row["embedding"] = fake_embedding(text, dim)
+            row["embedding_version"] = version
+        # Core inserts skip the ORM flush hook, so the item tables are written here
+        with bind.begin() as connection:
+            connection.execute(insert(Meeting), rows)
+            items = [item for row in rows for item in action_item_rows(row["id"], row["action_items"])]
+            if items:
+                connection.execute(insert(ActionItemRecord), items)
+            decisions = [item for row in rows for item in decision_rows(row["id"], row["decisions"])]
+            if decisions:
+                connection.execute(insert(DecisionRecord), decisions)
+    return first_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meetings", type=int, default=1000)
+    parser.add_argument("--database-url", default=None, help="defaults to DATABASE_URL")
+    parser.add_argument("--dim", type=int, default=FAKE_EMBEDDING_DIM, help="must match the fake server's --dim")
+    parser.add_argument("--words", type=int, default=300, help="transcript length per meeting")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--rebuild-neighbors", action="store_true",
+                        help="precompute similar-meeting lists now instead of on first request")
+    args = parser.parse_args()
+
+    if args.database_url:
+        bind = create_db_engine(args.database_url)
+    else:
+        from database import engine as bind
+    run_migrations(bind)
+    started = time.perf_counter()
+    first_id = seed(bind, args.meetings, args.dim, args.words, args.batch_size, args.seed)
+    print(f"seeded meetings {first_id}-{first_id + args.meetings - 1} in {time.perf_counter() - started:.1f}s")
+    if args.rebuild_neighbors:
+        session = SessionLocal(bind=bind)
+        try:
+            print(f"neighbour lists rebuilt: {rebuild_neighbors(session)}")
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,445 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, JSON
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, delete, func, insert, select, text, Column, Integer, String, Text, DateTime, Float, JSON, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+import asyncio
+import json
 import os
+import struct
+import numpy as np
 from dotenv import load_dotenv
 
+from services.metrics import instrument_engine, instrument_orm_loads
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./meeting_intelligence.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite: WAL lets searches read while an upload writes; writers wait instead of failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Server databases (PostgreSQL): connection pool sizing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+# PostgreSQL schema search path, e.g. "meetings,public"
+DATABASE_SCHEMA = os.getenv("DATABASE_SCHEMA")
+# Store embeddings in pgvector columns and search them in the database (PostgreSQL only)
+USE_PGVECTOR = os.getenv("USE_PGVECTOR", "false").lower() in ("1", "true", "yes")
+
+# Embeddings are stored as raw little-endian floats behind a small header:
+# magic, format version, dtype code and dimension (8 bytes, keeps the payload aligned)
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+EMBEDDING_MAGIC = b"EV"
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_HEADER = struct.Struct("<2sBBI")
+EMBEDDING_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+EMBEDDING_DTYPE_CODES = {"float32": 1, "float16": 2}
+
+
+def encode_embedding(embedding, dtype: str = None) -> bytes:
+    """Pack an embedding into the binary storage format"""
+    code = EMBEDDING_DTYPE_CODES[dtype or EMBEDDING_STORAGE_DTYPE]
+    vector = np.asarray(embedding, dtype=EMBEDDING_DTYPES[code]).ravel()
+    header = EMBEDDING_HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_FORMAT_VERSION, code, vector.shape[0])
+    return header + vector.tobytes()
+
+
+def decode_embedding(value):
+    """Unpack a stored embedding into a read-only numpy array without copying.
+
+    Legacy rows holding JSON text (optionally double-encoded) are still understood.
+    """
+    if value is None:
+        return None
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, (bytes, bytearray)) and value[:2] == EMBEDDING_MAGIC:
+        _, version, code, dimension = EMBEDDING_HEADER.unpack_from(value)
+        if version != EMBEDDING_FORMAT_VERSION or code not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding format (version {version}, dtype {code})")
+        return np.frombuffer(value, dtype=EMBEDDING_DTYPES[code], count=dimension, offset=EMBEDDING_HEADER.size)
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    while isinstance(value, str):
+        value = json.loads(value)
+    if value is None:
+        return None
+    return np.asarray(value, dtype=np.float32)
+
+
+def pgvector_enabled(dialect) -> bool:
+    """Whether embeddings are stored as pgvector ``vector`` columns on this dialect"""
+    return USE_PGVECTOR and dialect.name == "postgresql"
+
+
+class EmbeddingType(TypeDecorator):
+    """Binary embedding column accepting lists, arrays or legacy JSON strings.
+
+    With ``USE_PGVECTOR`` on PostgreSQL the column is a pgvector ``vector`` instead.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if pgvector_enabled(dialect):
+            from pgvector.sqlalchemy import Vector
+            return dialect.type_descriptor(Vector())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if pgvector_enabled(dialect):
+            vector = decode_embedding(value) if isinstance(value, (str, bytes, bytearray)) else value
+            return None if vector is None else np.asarray(vector, dtype=np.float32)
+        if isinstance(value, (bytes, bytearray)) and value[:2] == EMBEDDING_MAGIC:
+            return bytes(value)
+        vector = decode_embedding(value) if isinstance(value, (str, bytes, bytearray)) else value
+        if vector is None:
+            return None
+        return encode_embedding(vector)
+
+    def process_result_value(self, value, dialect):
+        return decode_embedding(value)
+
+
+# Drivers used by the async engine for each backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """The same database as ``url``, addressed through its asyncio driver"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or parsed.get_driver_name() == driver:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> dict:
+    """Keyword arguments for ``create_engine`` suited to the database behind ``url``"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        # Sessions are shared with worker threads; busy_timeout below handles lock waits
+        return {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    }
+    if backend == "postgresql" and DATABASE_SCHEMA:
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"search_path": DATABASE_SCHEMA}}
+        else:
+            options["connect_args"] = {"options": f"-csearch_path={DATABASE_SCHEMA}"}
+    return options
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # In-memory databases cannot use WAL and report "memory"; that is harmless
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # Safe with WAL: a crash can lose the last commits but never corrupts the database
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    """Create an engine configured for concurrent use of the given database"""
+    db_engine = create_engine(url, **engine_options(url))
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine, "connect", _configure_sqlite)
+    instrument_engine(db_engine)
+    return db_engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL, **overrides):
+    """Create an asyncio engine for the given database, configured like ``create_db_engine``"""
+    url = async_database_url(url)
+    db_engine = create_async_engine(url, **{**engine_options(url), **overrides})
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", _configure_sqlite)
+    instrument_engine(db_engine.sync_engine)
+    return db_engine
+
+
+engine = create_db_engine()
+# Request handlers use the async engine; the pipeline workers and command-line tools use the sync one
+async_engine = create_async_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit, so response models never trigger a lazy reload
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
+instrument_orm_loads(Base)
 
 
 class Meeting(Base):
     __tablename__ = "meetings"
+    __table_args__ = (
+        # Supports newest-first keyset pagination of the meeting list
+        Index("ix_meetings_created_at_id", "created_at", "id"),
+        # Covers the lookup of neighbour lists a new meeting may enter, without reading meeting rows
+        Index("ix_meetings_neighbor_floor", "neighbor_floor", "neighbors_updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     audio_filename = Column(String)
+    audio_hash = Column(String, index=True)  # SHA-256 of the uploaded audio bytes
     transcription = Column(Text)
+    transcript_segments = Column(JSON)  # [{"start", "end", "text"}] for chunked transcriptions
     summary = Column(Text)
     action_items = Column(JSON)
     decisions = Column(JSON)
     visual_summary_url = Column(String)
-    embedding = Column(JSON)  # Store as JSON array
+    embedding = Column(EmbeddingType)
+    embedding_version = Column(String, index=True)  # "<model>:<text recipe version>" behind the embedding
     created_at = Column(DateTime, default=datetime.utcnow)
     language = Column(String, default="en")
+    status = Column(String, default="pending", index=True)  # pending, processing, completed, failed
+    stages = Column(JSON)  # Per-stage status, attempts, duration and error
+    error = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Raised on every write to the meeting or its translations; HTTP ETags derive from it
+    version = Column(Integer, default=1)
+    # When the stored similar-meeting list was computed; NULL means it is stale
+    neighbors_updated_at = Column(DateTime)
+    # Weakest score in the stored list once it is full; NULL while it has room
+    neighbor_floor = Column(Float)
 
 
 class Translation(Base):
     __tablename__ = "translations"
+    # One stored translation per meeting, language and model, even with concurrent requests
+    __table_args__ = (Index("ix_translations_meeting_language_model", "meeting_id", "target_language", "model",
+                            unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     meeting_id = Column(Integer, index=True)
     target_language = Column(String)
+    model = Column(String)  # Translation model that produced the text
     translated_text = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+class TranslationChunk(Base):
+    """Translated chunk of a transcript, kept until the whole translation is stored"""
+    __tablename__ = "translation_chunks"
+    __table_args__ = (Index("ix_translation_chunks_key", "meeting_id", "target_language", "model", "position",
+                            unique=True),)
 
+    id = Column(Integer, primary_key=True)
+    meeting_id = Column(Integer, nullable=False)
+    target_language = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    source_hash = Column(String, nullable=False)  # SHA-256 of the source chunk; a changed transcript misses
+    translated_text = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+class TranslationSegment(Base):
+    """Translated source chunk shared by every meeting containing the same text"""
+    __tablename__ = "translation_segments"
+    __table_args__ = (UniqueConstraint("target_language", "model", "source_hash"),)
+
+    id = Column(Integer, primary_key=True)
+    target_language = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    source_hash = Column(String, nullable=False)  # SHA-256 of the source chunk
+    translated_text = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TranscriptPassage(Base):
+    """Overlapping window of a meeting transcript with its own embedding"""
+    __tablename__ = "transcript_passages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    meeting_id = Column(Integer, index=True)
+    position = Column(Integer)  # Order of the passage within the transcript
+    start_char = Column(Integer)  # Character offsets into Meeting.transcription
+    end_char = Column(Integer)
+    start_time = Column(Float)  # Seconds into the recording, when segment timings are known
+    end_time = Column(Float)
+    embedding = Column(EmbeddingType)
+    embedding_version = Column(String, index=True)
+
+
+class MeetingNeighbor(Base):
+    """Precomputed similar meeting: one row per (meeting, neighbour) in its top-k list"""
+    __tablename__ = "meeting_neighbors"
+    __table_args__ = (Index("ix_meeting_neighbors_meeting_score", "meeting_id", "score"),)
+
+    id = Column(Integer, primary_key=True)
+    meeting_id = Column(Integer, nullable=False)
+    neighbor_id = Column(Integer, nullable=False, index=True)
+    score = Column(Float, nullable=False)  # Cosine similarity
+
+
+class ActionItemRecord(Base):
+    """One action item of a meeting, mirrored from Meeting.action_items for SQL aggregation"""
+    __tablename__ = "meeting_action_items"
+
+    id = Column(Integer, primary_key=True)
+    meeting_id = Column(Integer, nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    task = Column(Text)
+    owner = Column(String, index=True)
+    deadline = Column(String)
+
+
+class DecisionRecord(Base):
+    """One decision of a meeting, mirrored from Meeting.decisions for SQL aggregation"""
+    __tablename__ = "meeting_decisions"
+
+    id = Column(Integer, primary_key=True)
+    meeting_id = Column(Integer, nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    decision = Column(Text)
+    context = Column(Text)
+
+
+def action_item_rows(meeting_id: int, action_items) -> list:
+    return [
+        {"meeting_id": meeting_id, "position": position, "task": item.get("task"),
+         "owner": item.get("owner"), "deadline": item.get("deadline")}
+        for position, item in enumerate(action_items or []) if isinstance(item, dict)
+    ]
+
+
+def decision_rows(meeting_id: int, decisions) -> list:
+    return [
+        {"meeting_id": meeting_id, "position": position, "decision": item.get("decision"),
+         "context": item.get("context")}
+        for position, item in enumerate(decisions or []) if isinstance(item, dict)
+    ]
+
+
+def next_meeting_version():
+    """SQL for a meeting's next version; meetings from before the column have none yet"""
+    return func.coalesce(Meeting.version, 0) + 1
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_meeting_version(session, flush_context, instances):
+    """Give every changed meeting a new version, computed in the UPDATE so concurrent writers never share one"""
+    for meeting in session.dirty:
+        if isinstance(meeting, Meeting) and session.is_modified(meeting):
+            meeting.version = next_meeting_version()
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_meeting_items(session, flush_context):
+    """Keep the action item and decision tables in step with the JSON columns, in the same transaction"""
+    connection = session.connection()
+    for meeting in session.deleted:
+        if isinstance(meeting, Meeting):
+            connection.execute(delete(ActionItemRecord).where(ActionItemRecord.meeting_id == meeting.id))
+            connection.execute(delete(DecisionRecord).where(DecisionRecord.meeting_id == meeting.id))
+    for meeting in list(session.new) + list(session.dirty):
+        if not isinstance(meeting, Meeting):
+            continue
+        for attribute, record, rows in (("action_items", ActionItemRecord, action_item_rows),
+                                        ("decisions", DecisionRecord, decision_rows)):
+            is_new = meeting in session.new
+            if is_new or get_history(meeting, attribute).has_changes():
+                if not is_new:
+                    connection.execute(delete(record).where(record.meeting_id == meeting.id))
+                values = rows(meeting.id, getattr(meeting, attribute))
+                if values:
+                    connection.execute(insert(record), values)
+
+
+class ReembedStaging(Base):
+    """New embedding computed by a re-embedding run, held until the run swaps it in"""
+    __tablename__ = "reembed_staging"
+    __table_args__ = (Index("ix_reembed_staging_source_version_row", "source", "version", "row_id", unique=True),)
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String, nullable=False)  # Table the embedding belongs to
+    row_id = Column(Integer, nullable=False)
+    version = Column(String, nullable=False)
+    embedding = Column(EmbeddingType)
+
+
+class ProcessingCacheEntry(Base):
+    """Result of one processing stage, reusable by any meeting with the same audio"""
+    __tablename__ = "processing_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True)  # Hash of audio, stage, models and stage inputs
+    audio_hash = Column(String, index=True)
+    stage = Column(String)
+    result = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class EmbeddingCacheEntry(Base):
+    """Embedding of a normalized text, reused across searches and uploads"""
+    __tablename__ = "embedding_cache"
+    __table_args__ = (UniqueConstraint("model", "text_hash"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    model = Column(String, index=True)
+    text_hash = Column(String)  # SHA-256 of the normalized text
+    embedding = Column(EmbeddingType)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class StateEntry(Base):
+    """Named value shared by the API and the command-line tools, e.g. the stamp of the live embeddings"""
+    __tablename__ = "app_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def get_state(db_session, key: str):
+    # A query rather than Session.get, which would answer from a long-lived session's identity map
+    return db_session.execute(select(StateEntry.value).where(StateEntry.key == key)).scalar()
+
+
+def set_state(db_session, key: str, value: str):
+    """Store a named value in the caller's transaction"""
+    db_session.merge(StateEntry(key=key, value=value))
+
+
+def init_db(bind=engine):
+    """Create the pgvector extension when it is used, then any missing tables"""
+    if pgvector_enabled(bind.dialect):
+        with bind.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(bind=bind)
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+
+async def run_sync(db_session, fn, *args):
+    """Call ``fn(session, *args)`` with a sync session, bridging from an ``AsyncSession`` if needed.
+
+    A plain sync session is used from a worker thread, one call at a time. Waiting
+    there for SQLite's write lock cannot stall the event loop, which an async
+    session holding that lock needs in order to finish its transaction.
+    """
+    if isinstance(db_session, AsyncSession):
+        return await db_session.run_sync(fn, *args)
+    lock = db_session.info.get("run_sync_lock")
+    if lock is None:
+        lock = db_session.info["run_sync_lock"] = asyncio.Lock()
+    async with lock:
+        return await asyncio.to_thread(fn, db_session, *args)
\ No newline at end of file
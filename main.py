@@ -1,27 +1,109 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Form
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, Body
+from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import load_only
 import os
 import json
-from typing import List
-import aiofiles
+import base64
+import asyncio
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from datetime import datetime
 
-from database import get_db, Meeting, Translation
+from database import get_db, SessionLocal, async_engine, Meeting, Translation
 from models import (
-    MeetingCreate, MeetingResponse, TranslationRequest,
-    TranslationResponse, SearchQuery, SearchResult
+    MeetingResponse, MeetingSummary, TranslationRequest,
+    TranslationResponse, SearchQuery, SearchResult, MeetingStatusResponse
 )
 from services.openai_service import OpenAIService
-from services.search_service import SearchService
-
-app = FastAPI(title="Meeting Intelligence API")
+from services.search_service import (SearchService, INSIGHT_ITEMS_PER_OWNER, INSIGHT_LIST_MAX,
+                                     INSIGHT_MEETINGS_LIMIT)
+from services.keyword_index import KeywordSearchUnavailable
+from services.embedding_index import embedding_index, default_index_path
+from services.passage_index import passage_index, default_passage_index_path
+from services.audio_store import AudioStore, UploadTooLarge
+from services.multipart_stream import MultipartError, iter_parts
+from services.visual_store import VISUAL_SIZES, variant_url, visual_store
+from services.http_cache import cache_headers, etag_matches, json_response, meeting_etag, not_modified
+from services.result_cache import result_cache
+from services.embedding_cache import embedding_cache
+from services.translation import (chunked_translator, get_or_translate, save_translation, stored_translation,
+                                  translation_flights, translation_key)
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry, timed
+from services.profiler import profiler, PROFILER_INTERVAL_MS
+from services.pipeline import pipeline, initial_stages, PENDING, PROCESSING, COMPLETED, PARTIAL, FAILED
+from migrations import run_migrations
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    run_migrations()
+
+    # Restore the persisted vector index, then catch up with meetings added since
+    index_path, passage_path = default_index_path(), default_passage_index_path()
+    embedding_index.load(index_path)
+    passage_index.load(passage_path)
+    db = SessionLocal()
+    try:
+        embedding_index.sync(db)
+        passage_index.sync(db)
+        # Vectors from a previous embedding model are useless for the current one
+        embedding_cache.invalidate_stale_models(db)
+        embedding_cache.prune(db)
+        unfinished = db.query(Meeting.id, Meeting.audio_hash, Meeting.audio_filename).filter(
+            Meeting.status.in_([PENDING, PROCESSING])
+        ).order_by(Meeting.id).all()
+    finally:
+        db.close()
+
+    # Start the processing workers and resume meetings interrupted by a restart
+    await pipeline.start()
+    for meeting_id, audio_hash, filename in unfinished:
+        pipeline.submit(meeting_id, audio_store.meeting_path(audio_hash, filename))
+    yield
+    await pipeline.stop()
+    await OpenAIService.aclose()
+    await async_engine.dispose()
+    # A re-embedding run may have replaced the files with newer vectors while the server ran
+    embedding_index.save(index_path, keep_other_stamps=True)
+    passage_index.save(passage_path, keep_other_stamps=True)
+
+
+app = FastAPI(title="Meeting Intelligence API", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 # Create uploads directory if it doesn't exist
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+audio_store = AudioStore(UPLOAD_FOLDER)
+ALLOWED_EXTENSIONS = ['.mp3', '.wav', '.m4a', '.mp4', '.mpeg', '.mpga', '.webm']
+# Leading bytes of an upload needed to check its audio signature
+AUDIO_SIGNATURE_BYTES = 12
+# Largest plain form field (the title) read into memory
+MAX_FORM_FIELD_BYTES = 64 * 1024
+# The upload form is read by hand, so its schema is declared for the API docs
+UPLOAD_OPENAPI = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["title", "audio_file"],
+    "properties": {"title": {"type": "string"}, "audio_file": {"type": "string", "format": "binary"}},
+}}}}}
+
+# Page size bounds for the meeting list
+MEETING_PAGE_SIZE = 50
+MEETING_PAGE_SIZE_MAX = 200
+SUMMARY_EXCERPT_CHARS = 200
+
+# Visual URLs name their content, so browsers and proxies may keep responses for good
+VISUAL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# ...except an original served in place of a size that could not be made
+VISUAL_FALLBACK_CACHE_CONTROL = "public, no-cache"
+
+# Seconds between progress checks on the server-sent events stream
+STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", 1.0))
+
 # Serve static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -31,121 +113,358 @@ async def read_index():
     return FileResponse('static/index.html')
 
 
-@app.post("/api/meetings/upload", response_model=MeetingResponse)
-async def upload_meeting(
-        title: str = Form(...),
-        audio_file: UploadFile = File(...),
-        db: Session = Depends(get_db)
-):
-    """Upload and process a meeting recording"""
-    # Validate file size (100MB limit)
-    MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", 100)) * 1024 * 1024
+@app.post("/api/meetings/upload", response_model=MeetingStatusResponse, status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def upload_meeting(request: Request, db: AsyncSession = Depends(get_db)):
+    """Upload a meeting recording and queue it for processing.
 
-    contents = await audio_file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_FILE_SIZE}MB")
+    The multipart body is parsed as it arrives rather than spooled first: the
+    file type is checked on its first bytes, the size limit as bytes come in,
+    and the recording is written to disk once, under its content address.
+    """
+    max_file_size_mb = int(os.getenv("MAX_FILE_SIZE_MB", 100))
+    max_file_size = max_file_size_mb * 1024 * 1024
+    too_large = HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_file_size_mb}MB")
 
-    # Validate file type
-    allowed_extensions = ['.mp3', '.wav', '.m4a', '.mp4', '.mpeg', '.mpga', '.webm']
-    file_extension = os.path.splitext(audio_file.filename)[1].lower()
-    if file_extension not in allowed_extensions:
-        raise HTTPException(status_code=400, detail="Invalid file type. Allowed types: mp3, wav, m4a")
+    # Reject on the declared size before reading any of the body; the form fields add a little
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_file_size + MAX_FORM_FIELD_BYTES:
+        raise too_large
 
-    # Save file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{audio_file.filename}"
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(contents)
-
-    # Create meeting record
+    try:
+        with timed("upload.store"):
+            fields, filename, stored = await _receive_upload(request, max_file_size)
+    except UploadTooLarge:
+        raise too_large
+    except MultipartError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+
+    # Create meeting record; processing happens in the background pipeline
     meeting = Meeting(
-        title=title,
-        audio_filename=filename
+        title=fields["title"],
+        audio_filename=filename,
+        audio_hash=stored.audio_hash,
+        status=PENDING,
+        stages=initial_stages()
     )
     db.add(meeting)
-    db.commit()
-    db.refresh(meeting)
+    with timed("db.commit"):
+        await db.commit()
 
-    # Process audio in background (in production, use background tasks)
+    pipeline.submit(meeting.id, stored.path)
+
+    return _meeting_status(meeting)
+
+
+async def _receive_upload(request: Request, max_file_size: int):
+    """Read the upload form from the request stream, writing ``audio_file`` to the audio store.
+
+    Returns the plain fields, the file's name and its StoredAudio. Nothing is
+    written until the extension and signature have been checked, and a
+    rejected or interrupted upload leaves no file behind.
+    """
+    fields = {}
+    filename, head, incoming, stored = None, b"", None, None
+    invalid_type = HTTPException(status_code=400, detail="Invalid file type. Allowed types: mp3, wav, m4a")
     try:
-        # Transcribe audio
-        transcription = await OpenAIService.transcribe_audio(file_path)
-        meeting.transcription = transcription
+        async for part, data in iter_parts(request.headers.get("content-type"), request.stream()):
+            if part.filename is None:
+                if data is not None:
+                    fields[part.name] = fields.get(part.name, "") + data.decode("utf-8", "replace")
+                    if len(fields[part.name]) > MAX_FORM_FIELD_BYTES:
+                        raise HTTPException(status_code=400, detail=f"Form field {part.name} is too large")
+                continue
+            if part.name != "audio_file" or (filename is not None and filename != part.filename):
+                raise HTTPException(status_code=400, detail="Expected a single audio_file upload")
+            if filename is None:
+                filename = part.filename
+                # Validate file type by extension, then by the magic bytes at the start of the file
+                extension = os.path.splitext(filename)[1].lower()
+                if extension not in ALLOWED_EXTENSIONS:
+                    raise invalid_type
+            if incoming is None:
+                head += data or b""
+                if len(head) < AUDIO_SIGNATURE_BYTES and data is not None:
+                    continue
+                if not _matches_audio_signature(head, extension):
+                    raise HTTPException(status_code=400,
+                                        detail="Invalid file type. File content is not a supported audio format")
+                incoming = audio_store.incoming(extension, max_file_size)
+                # The head may hold the whole file, ending with the part (data is None)
+                await incoming.write(head)
+            elif data is not None:
+                await incoming.write(data)
+            if data is None:
+                stored = await incoming.finish()
+    except BaseException:
+        if incoming is not None:
+            await incoming.discard()
+        raise
+
+    missing = [name for name, present in (("title", "title" in fields), ("audio_file", stored is not None))
+               if not present]
+    if missing:
+        if incoming is not None:
+            await incoming.discard()
+        raise RequestValidationError([{"type": "missing", "loc": ("body", name), "msg": "Field required",
+                                       "input": None} for name in missing])
+    return fields, filename, stored
+
+
+@app.get("/api/meetings/{meeting_id}/status", response_model=MeetingStatusResponse)
+async def get_meeting_status(meeting_id: int, db: AsyncSession = Depends(get_db)):
+    """Get the processing status of a meeting"""
+    meeting = await db.scalar(select(Meeting).options(load_only(*STATUS_COLUMNS)).where(Meeting.id == meeting_id))
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    return _meeting_status(meeting)
 
-        # Analyze meeting
-        analysis = await OpenAIService.analyze_meeting(transcription)
-        meeting.summary = analysis['summary']
-        meeting.action_items = analysis['action_items']
-        meeting.decisions = analysis['decisions']
 
-        # Generate embedding
-        embedding_text = f"{title}\n{analysis['summary']}"
-        embedding = await OpenAIService.generate_embedding(embedding_text)
-        meeting.embedding = json.dumps(embedding)
+@app.get("/api/meetings/{meeting_id}/events")
+async def stream_meeting_status(meeting_id: int, db: AsyncSession = Depends(get_db)):
+    """Stream processing progress as server-sent events until the meeting is done"""
+    if await db.scalar(select(Meeting.id).where(Meeting.id == meeting_id)) is None:
+        raise HTTPException(status_code=404, detail="Meeting not found")
 
-        # Generate visual summary
-        key_points = [item['task'] for item in analysis['action_items'][:3]]
-        if not key_points and analysis['decisions']:
-            key_points = [dec['decision'] for dec in analysis['decisions'][:3]]
+    # Each poll opens a short session on the request's engine, so no connection is held while waiting
+    session_factory = async_sessionmaker(db.bind, expire_on_commit=False)
+
+    async def events():
+        last_payload = None
+        while True:
+            async with session_factory() as session:
+                meeting = await session.scalar(
+                    select(Meeting).options(load_only(*STATUS_COLUMNS)).where(Meeting.id == meeting_id)
+                )
+                if meeting is None:
+                    return
+                payload = _meeting_status(meeting).model_dump_json()
+                finished = meeting.status in (COMPLETED, PARTIAL, FAILED)
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+            if finished:
+                return
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _matches_audio_signature(head: bytes, extension: str) -> bool:
+    """Check the leading bytes of an upload against the container format its extension claims"""
+    if extension == ".wav":
+        return head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+    if extension in (".m4a", ".mp4"):
+        return head[4:8] == b"ftyp"
+    if extension == ".webm":
+        return head[:4] == b"\x1a\x45\xdf\xa3"
+    # .mp3, .mpga and .mpeg: ID3 tag, an MPEG audio frame sync, or an MPEG program/video stream
+    is_frame_sync = len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0
+    return head[:3] == b"ID3" or is_frame_sync or head[:4] in (b"\x00\x00\x01\xba", b"\x00\x00\x01\xb3")
+
+
+# Meeting columns behind a status response
+STATUS_COLUMNS = (Meeting.id, Meeting.title, Meeting.status, Meeting.stages, Meeting.error,
+                  Meeting.created_at, Meeting.updated_at)
+
+
+def _meeting_status(meeting: Meeting) -> MeetingStatusResponse:
+    return MeetingStatusResponse(
+        id=meeting.id,
+        title=meeting.title,
+        status=meeting.status or COMPLETED,
+        stages=meeting.stages or {},
+        error=meeting.error,
+        created_at=meeting.created_at,
+        updated_at=meeting.updated_at
+    )
 
-        if key_points:
-            visual_url = await OpenAIService.generate_visual_summary(
-                analysis['summary'],
-                key_points
-            )
-            meeting.visual_summary_url = visual_url
 
-        db.commit()
-        db.refresh(meeting)
+# Meeting columns each listing field needs; counts and excerpts are computed in SQL
+SUMMARY_COLUMNS = {
+    "id": (), "title": (Meeting.title,), "created_at": (), "status": (Meeting.status,),
+    "language": (Meeting.language,), "visual_summary_url": (Meeting.visual_summary_url,),
+    "visual_thumbnail_url": (Meeting.visual_summary_url,),
+    "summary_excerpt": (), "action_item_count": (), "decision_count": (),
+}
+SUMMARY_EXPRESSIONS = {
+    "summary_excerpt": func.substr(Meeting.summary, 1, SUMMARY_EXCERPT_CHARS + 1),
+    "action_item_count": func.json_array_length(Meeting.action_items),
+    "decision_count": func.json_array_length(Meeting.decisions),
+}
+
+
+@app.get("/api/meetings", response_model=List[MeetingSummary], response_model_exclude_unset=True)
+async def get_meetings(
+        response: Response,
+        limit: int = Query(MEETING_PAGE_SIZE, ge=1, le=MEETING_PAGE_SIZE_MAX),
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+        db: AsyncSession = Depends(get_db)
+):
+    """List meetings newest first, one page at a time.
+
+    Only the columns behind the requested ``fields`` are loaded; transcripts and
+    embeddings never are. The ``X-Next-Cursor`` response header holds the cursor
+    for the following page and is absent on the last page.
+    """
+    selected = list(SUMMARY_COLUMNS) if fields is None else [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [field for field in selected if field not in SUMMARY_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    columns = [Meeting.id, Meeting.created_at]
+    for field in selected:
+        columns.extend(SUMMARY_COLUMNS[field])
+    expressions = [SUMMARY_EXPRESSIONS[field].label(field) for field in selected if field in SUMMARY_EXPRESSIONS]
+    query = select(Meeting, *expressions).options(load_only(*columns, raiseload=True))
+
+    if cursor:
+        created_at, meeting_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            Meeting.created_at < created_at,
+            and_(Meeting.created_at == created_at, Meeting.id < meeting_id)
+        ))
+    rows = (await db.execute(query.order_by(Meeting.created_at.desc(), Meeting.id.desc()).limit(limit + 1))).all()
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing meeting: {str(e)}")
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1][0])
 
-    return meeting
+    summaries = []
+    for meeting, *values in rows:
+        computed = dict(zip([field for field in selected if field in SUMMARY_EXPRESSIONS], values))
+        excerpt = computed.get("summary_excerpt")
+        if excerpt and len(excerpt) > SUMMARY_EXCERPT_CHARS:
+            computed["summary_excerpt"] = excerpt[:SUMMARY_EXCERPT_CHARS] + "..."
+        if "visual_thumbnail_url" in selected:
+            computed["visual_thumbnail_url"] = variant_url(meeting.visual_summary_url, "thumb")
+        summaries.append(MeetingSummary(**{
+            field: computed[field] if field in computed else getattr(meeting, field)
+            for field in dict.fromkeys(["id", *selected])
+        }))
+    return summaries
 
 
-@app.get("/api/meetings", response_model=List[MeetingResponse])
-async def get_meetings(db: Session = Depends(get_db)):
-    """Get all meetings"""
-    meetings = db.query(Meeting).order_by(Meeting.created_at.desc()).all()
-    return meetings
+def _encode_cursor(meeting: Meeting) -> str:
+    payload = json.dumps([meeting.created_at.isoformat(), meeting.id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, meeting_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(meeting_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @app.get("/api/meetings/{meeting_id}", response_model=MeetingResponse)
-async def get_meeting(meeting_id: int, db: Session = Depends(get_db)):
-    """Get a specific meeting"""
-    meeting = db.query(Meeting).filter(Meeting.id == meeting_id).first()
+async def get_meeting(meeting_id: int, db: AsyncSession = Depends(get_db),
+                      if_none_match: Optional[str] = Header(None), if_modified_since: Optional[str] = Header(None),
+                      accept_encoding: Optional[str] = Header(None)):
+    """Get a specific meeting; a client holding the current version gets 304 Not Modified"""
+    if if_none_match or if_modified_since:
+        headers, current = await _meeting_validators(db, meeting_id, "meeting", if_none_match, if_modified_since)
+        if current:
+            return Response(status_code=304, headers=headers)
+    meeting = await db.scalar(select(Meeting).options(load_only(*MEETING_RESPONSE_COLUMNS)).where(
+        Meeting.id == meeting_id
+    ))
     if not meeting:
         raise HTTPException(status_code=404, detail="Meeting not found")
-    return meeting
+    # Validators of the row actually sent, which may be newer than the ones checked above
+    headers = _meeting_cache_headers(meeting_id, meeting.version, meeting.created_at, meeting.updated_at, "meeting")
+    return await json_response(MeetingResponse.model_validate(meeting, from_attributes=True).model_dump(),
+                               accept_encoding, headers)
+
+
+# Columns behind a MeetingResponse and its cache validators; the embedding and stage details are left unread
+MEETING_RESPONSE_COLUMNS = [getattr(Meeting, field) for field in MeetingResponse.model_fields] + [
+    Meeting.version, Meeting.updated_at
+]
+
+
+def _meeting_cache_headers(meeting_id: int, version: Optional[int], created_at: Optional[datetime],
+                           updated_at: Optional[datetime], kind: str):
+    return cache_headers(meeting_etag(meeting_id, version, created_at, kind), updated_at)
+
+
+async def _meeting_validators(db: AsyncSession, meeting_id: int, kind: str, if_none_match: Optional[str],
+                              if_modified_since: Optional[str]):
+    """Cache headers for a meeting representation, and whether the client's copy is still current.
+
+    Reads only the version columns, never the transcript.
+    """
+    row = (await db.execute(select(Meeting.version, Meeting.created_at, Meeting.updated_at).where(
+        Meeting.id == meeting_id
+    ))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    headers = _meeting_cache_headers(meeting_id, row.version, row.created_at, row.updated_at, kind)
+    return headers, not_modified(if_none_match, if_modified_since, headers["ETag"], row.updated_at)
+
+
+@app.get("/api/visuals/{digest}")
+async def get_visual(digest: str, size: str = Query("original"),
+                     if_none_match: Optional[str] = Header(None)):
+    """Serve a stored visual summary, or a WebP variant of it made on first request.
+
+    Responses carry a strong ETag and a year-long immutable Cache-Control, and
+    honour Range requests. A size that cannot be made (no Pillow) is answered
+    with the original, which clients must revalidate instead of keeping.
+    """
+    if size != "original" and size not in VISUAL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown size; expected original, {', '.join(VISUAL_SIZES)}")
+    # Resizing is CPU and file work, kept off the event loop
+    visual = await asyncio.to_thread(visual_store.variant, digest, size)
+    if visual is None:
+        raise HTTPException(status_code=404, detail="Visual not found")
+    cache_control = VISUAL_CACHE_CONTROL if visual.size == size else VISUAL_FALLBACK_CACHE_CONTROL
+    headers = {"ETag": visual.etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, visual.etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(visual.path, media_type=visual.media_type, headers=headers)
 
 
 @app.post("/api/meetings/search", response_model=List[SearchResult])
-async def search_meetings(query: SearchQuery, db: Session = Depends(get_db)):
-    """Search meetings using semantic search"""
-    results = await SearchService.search_meetings(query.query, db, query.top_k)
+async def search_meetings(query: SearchQuery, db: AsyncSession = Depends(get_db)):
+    """Search meetings by meaning, by keyword, or by both fused together.
+
+    With ``granularity=passage`` meetings are ranked by their best transcript
+    passages, which are returned with their offsets.
+    """
+    if query.granularity == "passage":
+        if query.mode != "semantic":
+            raise HTTPException(status_code=400, detail="Passage search is only available in semantic mode")
+        results = await SearchService.search_passages(query.query, db, query.top_k, query.aggregate)
+    else:
+        try:
+            results = await SearchService.search_meetings(query.query, db, query.top_k, query.nprobe, query.mode)
+        except KeywordSearchUnavailable as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        results = [(meeting, score, []) for meeting, score in results]
 
     search_results = []
-    for meeting, score in results:
-        excerpt = meeting.summary[:200] + "..." if meeting.summary and len(meeting.summary) > 200 else meeting.summary
+    for meeting, score, passages in results:
+        excerpt = passages[0]["text"] if passages else meeting.summary
+        excerpt = excerpt[:200] + "..." if excerpt and len(excerpt) > 200 else excerpt
         search_results.append(SearchResult(
             meeting_id=meeting.id,
             title=meeting.title,
             excerpt=excerpt or "",
             similarity_score=float(score),
-            created_at=meeting.created_at
+            created_at=meeting.created_at,
+            passages=passages
         ))
 
     return search_results
 
 
 @app.get("/api/meetings/{meeting_id}/similar", response_model=List[SearchResult])
-async def get_similar_meetings(meeting_id: int, db: Session = Depends(get_db)):
-    """Find similar meetings"""
-    results = await SearchService.find_similar_meetings(meeting_id, db)
+async def get_similar_meetings(meeting_id: int, top_k: int = Query(3, ge=1, le=50),
+                               db: AsyncSession = Depends(get_db)):
+    """Find similar meetings from the precomputed neighbour table"""
+    results = await SearchService.find_similar_meetings(meeting_id, db, top_k)
 
     similar_meetings = []
     for meeting, score in results:
@@ -162,56 +481,165 @@ async def get_similar_meetings(meeting_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/api/meetings/translate", response_model=TranslationResponse)
-async def translate_meeting(request: TranslationRequest, db: Session = Depends(get_db)):
+async def translate_meeting(request: TranslationRequest, db: AsyncSession = Depends(get_db)):
     """Translate a meeting transcription"""
-    meeting = db.query(Meeting).filter(Meeting.id == request.meeting_id).first()
+    meeting = await db.scalar(
+        select(Meeting).options(load_only(Meeting.id, Meeting.transcription)).where(Meeting.id == request.meeting_id)
+    )
     if not meeting:
         raise HTTPException(status_code=404, detail="Meeting not found")
 
     if not meeting.transcription:
         raise HTTPException(status_code=400, detail="Meeting has no transcription")
 
-    # Check if translation already exists
-    existing = db.query(Translation).filter(
-        Translation.meeting_id == request.meeting_id,
-        Translation.target_language == request.target_language
-    ).first()
-
+    existing = await stored_translation(db, meeting.id, request.target_language)
     if existing:
         return existing
 
-    # Translate
-    translated_text = await OpenAIService.translate_text(
-        meeting.transcription,
+    # Concurrent requests for the same translation share one; long transcripts are translated
+    # in concurrent chunks, and finished chunks survive a failed request
+    return await get_or_translate(
+        async_sessionmaker(db.bind, expire_on_commit=False), meeting.id, meeting.transcription,
         request.target_language
     )
 
-    # Save translation
-    translation = Translation(
-        meeting_id=request.meeting_id,
-        target_language=request.target_language,
-        translated_text=translated_text
+
+@app.post("/api/meetings/translate/stream")
+async def stream_translation(request: TranslationRequest, db: AsyncSession = Depends(get_db)):
+    """Stream a meeting translation as plain text, chunk by chunk, as it is produced"""
+    meeting = await db.scalar(
+        select(Meeting).options(load_only(Meeting.id, Meeting.transcription)).where(Meeting.id == request.meeting_id)
     )
-    db.add(translation)
-    db.commit()
-    db.refresh(translation)
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    if not meeting.transcription:
+        raise HTTPException(status_code=400, detail="Meeting has no transcription")
 
-    return translation
+    key = translation_key(meeting.id, request.target_language)
+    existing = await stored_translation(db, meeting.id, request.target_language)
+    flight = translation_flights.in_flight(key) if existing is None else None
+    if flight is not None:
+        # Another request is already translating this meeting; wait for its result
+        existing = await asyncio.shield(flight)
+    if existing is not None:
+        return StreamingResponse(iter([existing.translated_text]), media_type="text/plain; charset=utf-8")
+
+    # The translation runs in its own task and session, registered before the response
+    # starts: it finishes for the requests waiting on it even if this client disconnects
+    session_factory = async_sessionmaker(db.bind, expire_on_commit=False)
+    meeting_id, transcription = meeting.id, meeting.transcription
+    parts: asyncio.Queue = asyncio.Queue()
+
+    async def translate() -> Translation:
+        try:
+            async with session_factory() as session:
+                translated = []
+                async for part in chunked_translator.stream(session, meeting_id, transcription,
+                                                            request.target_language):
+                    translated.append(part)
+                    parts.put_nowait(part)
+                return await save_translation(session, meeting_id, request.target_language, "".join(translated))
+        finally:
+            parts.put_nowait(None)
+
+    flight = translation_flights.start(key, translate)
+
+    async def translated_chunks():
+        while (part := await parts.get()) is not None:
+            yield part
+        # Surfaces a failed translation, which ends the response early
+        await asyncio.shield(flight)
+
+    return StreamingResponse(translated_chunks(), media_type="text/plain; charset=utf-8")
 
 
 @app.get("/api/meetings/{meeting_id}/translations", response_model=List[TranslationResponse])
-async def get_translations(meeting_id: int, db: Session = Depends(get_db)):
-    """Get all translations for a meeting"""
-    translations = db.query(Translation).filter(
+async def get_translations(meeting_id: int, db: AsyncSession = Depends(get_db),
+                           if_none_match: Optional[str] = Header(None),
+                           if_modified_since: Optional[str] = Header(None),
+                           accept_encoding: Optional[str] = Header(None)):
+    """Get all translations for a meeting; a client holding the current version gets 304 Not Modified"""
+    headers, current = await _meeting_validators(db, meeting_id, "translations", if_none_match, if_modified_since)
+    if current:
+        return Response(status_code=304, headers=headers)
+    # Read after the version, so a translation stored in between only makes the next request miss
+    translations = (await db.scalars(select(Translation).where(
         Translation.meeting_id == meeting_id
-    ).all()
-    return translations
+    ))).all()
+    return await json_response([
+        TranslationResponse.model_validate(translation, from_attributes=True).model_dump()
+        for translation in translations
+    ], accept_encoding, headers)
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(db: AsyncSession = Depends(get_db)):
+    """Hit/miss counters for the processing result and embedding caches"""
+    return {"processing": result_cache.stats(), "embeddings": await db.run_sync(embedding_cache.stats)}
+
+
+@app.get("/api/openai/stats")
+async def get_openai_stats():
+    """Queue depth, wait times and rate-limit counters of the OpenAI request scheduler"""
+    return OpenAIService.scheduler_stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request, OpenAI, database and pipeline metrics in the Prometheus text format"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def _require_profiler():
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiler is disabled; set PROFILER_ENABLED=true")
+
+
+@app.get("/api/debug/profiler")
+async def get_profiler_status():
+    """Whether the sampling profiler is running and how much it has collected"""
+    _require_profiler()
+    return profiler.stats()
+
+
+@app.post("/api/debug/profiler/start")
+async def start_profiler(interval_ms: float = Query(PROFILER_INTERVAL_MS, ge=1, le=1000)):
+    """Start sampling every thread's stack, discarding earlier samples"""
+    _require_profiler()
+    if not profiler.start(interval_ms):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return profiler.stats()
+
+
+@app.post("/api/debug/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler():
+    """Stop sampling and return the collapsed stacks (flamegraph.pl / speedscope input)"""
+    _require_profiler()
+    # Joining the sampler thread waits up to one interval, so it happens off the event loop
+    return PlainTextResponse(await asyncio.to_thread(profiler.stop))
 
 
 @app.post("/api/insights/cross-meeting")
-async def get_cross_meeting_insights(meeting_ids: List[int], db: Session = Depends(get_db)):
-    """Get insights across multiple meetings"""
-    insights = await SearchService.extract_cross_meeting_insights(meeting_ids, db)
+async def get_cross_meeting_insights(
+        meeting_ids: Optional[List[int]] = Body(None),
+        all_meetings: bool = False,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        owner: Optional[str] = None,
+        items_per_owner: int = Query(INSIGHT_ITEMS_PER_OWNER, ge=1, le=INSIGHT_LIST_MAX),
+        meetings_limit: int = Query(INSIGHT_MEETINGS_LIMIT, ge=1, le=INSIGHT_LIST_MAX),
+        db: AsyncSession = Depends(get_db)
+):
+    """Get insights across the listed meetings, or across every meeting with ``all_meetings=true``.
+
+    Totals and per-owner counts cover every matching item; the item and meeting
+    lists are capped by ``items_per_owner`` and ``meetings_limit``.
+    """
+    if meeting_ids is None and not all_meetings:
+        raise HTTPException(status_code=400, detail="Provide a list of meeting ids or set all_meetings=true")
+    insights = await SearchService.extract_cross_meeting_insights(
+        None if all_meetings else meeting_ids, db, start_date, end_date, owner, items_per_owner, meetings_limit
+    )
     return insights
 
 
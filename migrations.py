@@ -0,0 +1,214 @@
+"""In-place migrations for existing meeting databases.
+
+Run ``python migrations.py`` once after upgrading, or let the API apply them at startup.
+Every migration is idempotent, so running them repeatedly is safe.
+"""
+import json
+
+from sqlalchemy import LargeBinary, insert, inspect, text
+
+from database import (Base, engine, init_db, pgvector_enabled, encode_embedding, EMBEDDING_MAGIC,
+                      ActionItemRecord, DecisionRecord, StateEntry, action_item_rows, decision_rows, get_state)
+from services.keyword_index import create_keyword_index
+from services.openai_service import TRANSLATION_MODEL
+
+BATCH_SIZE = 500
+# app_state key recording that the item tables have been backfilled
+MEETING_ITEMS_BACKFILLED = "migration:backfill_meeting_items"
+
+
+def _legacy_embedding(value):
+    """Return the decoded JSON embedding for a legacy row, or None if already binary"""
+    if value is None:
+        return None
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, (bytes, bytearray)):
+        if value[:2] == EMBEDDING_MAGIC:
+            return None
+        value = value.decode("utf-8")
+    if isinstance(value, (list, dict)):
+        return value
+    while isinstance(value, str):
+        value = json.loads(value)
+    return value
+
+
+def _rewrite_embeddings(connection, source: str, target: str, skip_binary: bool = True) -> int:
+    """Copy embeddings from source to target column as binary blobs, batch by batch.
+
+    With ``skip_binary``, rows already in the binary format are filtered out in
+    SQL, so a database that has been migrated is not read back in full.
+    """
+    converted = 0
+    last_id = 0
+    already_binary = f"AND substr({source}, 1, 2) != :magic " if skip_binary else ""
+    while True:
+        rows = connection.execute(
+            text(f"SELECT id, {source} FROM meetings WHERE id > :last_id AND {source} IS NOT NULL "
+                 f"{already_binary}ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE, "magic": EMBEDDING_MAGIC}
+        ).fetchall()
+        if not rows:
+            return converted
+        updates = []
+        for meeting_id, value in rows:
+            embedding = _legacy_embedding(value)
+            if embedding is not None:
+                updates.append({"id": meeting_id, "embedding": encode_embedding(embedding)})
+        if updates:
+            connection.execute(text(f"UPDATE meetings SET {target} = :embedding WHERE id = :id"), updates)
+            converted += len(updates)
+        last_id = rows[-1][0]
+
+
+def migrate_embeddings_to_binary(bind=engine) -> int:
+    """Convert JSON text embeddings to the binary format, returning the number of rows rewritten"""
+    if pgvector_enabled(bind.dialect):
+        # pgvector columns are written in their own format by the driver
+        return 0
+    inspector = inspect(bind)
+    if "meetings" not in inspector.get_table_names():
+        return 0
+    columns = {column["name"]: column for column in inspector.get_columns("meetings")}
+    if "embedding" not in columns:
+        return 0
+
+    with bind.begin() as connection:
+        if bind.dialect.name == "sqlite":
+            # SQLite stores any value in any column, so rows can be rewritten in place
+            return _rewrite_embeddings(connection, "embedding", "embedding")
+
+        if columns["embedding"]["type"].python_type is bytes:
+            return _rewrite_embeddings(connection, "embedding", "embedding")
+
+        # Typed backends need a binary column: fill a new one, then swap it in
+        blob_type = LargeBinary().compile(dialect=bind.dialect)
+        connection.execute(text(f"ALTER TABLE meetings ADD COLUMN embedding_binary {blob_type}"))
+        # Every row of a text column is legacy JSON
+        converted = _rewrite_embeddings(connection, "embedding", "embedding_binary", skip_binary=False)
+        connection.execute(text("ALTER TABLE meetings DROP COLUMN embedding"))
+        connection.execute(text("ALTER TABLE meetings RENAME COLUMN embedding_binary TO embedding"))
+        return converted
+
+
+def add_missing_columns(bind=engine) -> int:
+    """Add columns declared on the models but missing from existing tables"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = 0
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                added += 1
+    return added
+
+
+def add_missing_indexes(bind=engine) -> int:
+    """Create indexes declared on the models but missing from existing tables"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = 0
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=connection)
+                    added += 1
+    return added
+
+
+def dedupe_translations(bind=engine) -> int:
+    """Attribute legacy translations to the current model and drop duplicates before the unique index.
+
+    The oldest row of each (meeting, language, model) is kept. Returns the number of rows removed.
+    """
+    if "translations" not in inspect(bind).get_table_names():
+        return 0
+    with bind.begin() as connection:
+        # Legacy rows count as the current model, so duplicates go before the UPDATE can collide with the index
+        removed = connection.execute(text(
+            "DELETE FROM translations WHERE id NOT IN (SELECT min(id) FROM translations "
+            "GROUP BY meeting_id, target_language, coalesce(model, :model))"
+        ), {"model": TRANSLATION_MODEL}).rowcount
+        connection.execute(text("UPDATE translations SET model = :model WHERE model IS NULL"),
+                           {"model": TRANSLATION_MODEL})
+        return removed
+
+
+def mark_legacy_meetings_completed(bind=engine) -> int:
+    """Meetings created before background processing were processed inline"""
+    with bind.begin() as connection:
+        return connection.execute(text("UPDATE meetings SET status = 'completed' WHERE status IS NULL")).rowcount
+
+
+def _json_list(value):
+    while isinstance(value, str):
+        value = json.loads(value)
+    return value if isinstance(value, list) else []
+
+
+def backfill_meeting_items(bind=engine) -> int:
+    """Fill the action item and decision tables for meetings stored before they existed.
+
+    Only meetings with no rows in either table are read, batch by batch. Meetings
+    written since keep their rows in step, so the pass runs once and is then
+    recorded in app_state. Returns the number of meetings backfilled.
+    """
+    backfilled = 0
+    last_id = 0
+    with bind.begin() as connection:
+        if get_state(connection, MEETING_ITEMS_BACKFILLED) is not None:
+            return 0
+        while True:
+            rows = connection.execute(text(
+                "SELECT id, action_items, decisions FROM meetings WHERE id > :last_id "
+                "AND NOT EXISTS (SELECT 1 FROM meeting_action_items WHERE meeting_id = meetings.id) "
+                "AND NOT EXISTS (SELECT 1 FROM meeting_decisions WHERE meeting_id = meetings.id) "
+                "ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+            if not rows:
+                connection.execute(insert(StateEntry).values(key=MEETING_ITEMS_BACKFILLED, value="done"))
+                return backfilled
+            items, decisions = [], []
+            for meeting_id, action_items, meeting_decisions in rows:
+                meeting_items = action_item_rows(meeting_id, _json_list(action_items))
+                meeting_decision_rows = decision_rows(meeting_id, _json_list(meeting_decisions))
+                if meeting_items or meeting_decision_rows:
+                    backfilled += 1
+                items.extend(meeting_items)
+                decisions.extend(meeting_decision_rows)
+            if items:
+                connection.execute(insert(ActionItemRecord), items)
+            if decisions:
+                connection.execute(insert(DecisionRecord), decisions)
+            last_id = rows[-1][0]
+
+
+def run_migrations(bind=engine):
+    """Apply every migration to the given engine"""
+    init_db(bind)
+    return {
+        "columns_added": add_missing_columns(bind),
+        "translations_deduplicated": dedupe_translations(bind),
+        "indexes_added": add_missing_indexes(bind),
+        "embeddings_converted": migrate_embeddings_to_binary(bind),
+        "meetings_marked_completed": mark_legacy_meetings_completed(bind),
+        "meetings_keyword_indexed": create_keyword_index(bind),
+        "meeting_items_backfilled": backfill_meeting_items(bind),
+    }
+
+
+if __name__ == "__main__":
+    for name, count in run_migrations().items():
+        print(f"{name}: {count}")
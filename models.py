@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Literal
 from datetime import datetime
 
 class MeetingCreate(BaseModel):
@@ -14,17 +14,53 @@ class Decision(BaseModel):
     decision: str
     context: Optional[str]
 
+class TranscriptSegment(BaseModel):
+    start: float
+    end: float
+    text: str
+
 class MeetingResponse(BaseModel):
     id: int
     title: str
     audio_filename: Optional[str]
     transcription: Optional[str]
+    transcript_segments: Optional[List[TranscriptSegment]] = None
     summary: Optional[str]
     action_items: Optional[List[ActionItem]]
     decisions: Optional[List[Decision]]
     visual_summary_url: Optional[str]
     created_at: datetime
     language: str
+    status: Optional[str] = None
+
+class MeetingSummary(BaseModel):
+    """Lightweight meeting listing entry; fields not requested with ``fields=`` are omitted"""
+    id: int
+    title: Optional[str] = None
+    created_at: Optional[datetime] = None
+    status: Optional[str] = None
+    language: Optional[str] = None
+    summary_excerpt: Optional[str] = None
+    action_item_count: Optional[int] = None
+    decision_count: Optional[int] = None
+    visual_summary_url: Optional[str] = None
+    visual_thumbnail_url: Optional[str] = None
+
+class StageStatus(BaseModel):
+    status: str
+    attempts: int = 0
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+class MeetingStatusResponse(BaseModel):
+    id: int
+    title: str
+    status: str
+    stages: Dict[str, StageStatus]
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
 
 class TranslationRequest(BaseModel):
     meeting_id: int
@@ -39,11 +75,24 @@ class TranslationResponse(BaseModel):
 
 class SearchQuery(BaseModel):
     query: str
-    top_k: Optional[int] = 5
+    top_k: int = Field(5, ge=1)
+    nprobe: Optional[int] = None  # lists probed by the IVF backend: higher is slower but more accurate
+    mode: Literal["semantic", "keyword", "hybrid"] = "semantic"  # keyword search needs no API call
+    granularity: Literal["meeting", "passage"] = "meeting"  # passage ranks transcript chunks (semantic mode)
+    aggregate: Literal["max", "sum"] = "max"  # how passage scores combine into a meeting score
+
+class PassageMatch(BaseModel):
+    text: str
+    start_char: int
+    end_char: int
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    score: float
 
 class SearchResult(BaseModel):
     meeting_id: int
     title: str
     excerpt: str
     similarity_score: float
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+    passages: List[PassageMatch] = []
\ No newline at end of file
@@ -0,0 +1,105 @@
+import contextlib
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+
+import aiofiles
+
+# Uploads are written in pieces of this size, so memory use is constant per upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit while streaming"""
+
+
+@dataclass
+class StoredAudio:
+    audio_hash: str
+    path: str
+    size: int
+    deduplicated: bool  # the same bytes were already stored
+
+
+class AudioStore:
+    """Content-addressed storage for uploaded recordings.
+
+    Files live at ``<root>/<hash[:2]>/<sha256><ext>``, so re-uploading the same
+    recording reuses the existing file instead of writing a second copy.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def blob_path(self, audio_hash: str, extension: str) -> str:
+        return os.path.join(self.root, audio_hash[:2], f"{audio_hash}{extension}")
+
+    def meeting_path(self, audio_hash, audio_filename: str) -> str:
+        """Location of a meeting's audio; meetings stored before hashing use their filename"""
+        if audio_hash:
+            return self.blob_path(audio_hash, os.path.splitext(audio_filename or "")[1].lower())
+        return os.path.join(self.root, audio_filename)
+
+    def incoming(self, extension: str, max_size: int) -> "IncomingAudio":
+        """A writer for an upload whose bytes are still arriving"""
+        return IncomingAudio(self, extension, max_size)
+
+
+class IncomingAudio:
+    """An upload streamed to a temporary file and hashed as bytes arrive.
+
+    Bytes are buffered and written in UPLOAD_CHUNK_SIZE pieces. Once complete,
+    the file is moved to its content address; if that address exists, the
+    temporary file is discarded instead.
+    """
+
+    def __init__(self, store: AudioStore, extension: str, max_size: int):
+        self.store = store
+        self.extension = extension
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+        incoming = os.path.join(store.root, ".incoming")
+        os.makedirs(incoming, exist_ok=True)
+        self.temp_path = os.path.join(incoming, f"{uuid.uuid4().hex}.part")
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLarge(self.size)
+        self._sha256.update(data)
+        self._buffer += data
+        if len(self._buffer) >= UPLOAD_CHUNK_SIZE:
+            await self._flush()
+
+    async def finish(self) -> StoredAudio:
+        await self._flush()
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        audio_hash = self._sha256.hexdigest()
+        path = self.store.blob_path(audio_hash, self.extension)
+        if os.path.exists(path):
+            await self.discard()
+            return StoredAudio(audio_hash, path, self.size, deduplicated=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.temp_path, path)
+        return StoredAudio(audio_hash, path, self.size, deduplicated=False)
+
+    async def discard(self):
+        """Drop the partial upload"""
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.temp_path)
+
+    async def _flush(self):
+        if self._file is None:
+            # Created on first write, so an empty upload still leaves a file to move into place
+            self._file = await aiofiles.open(self.temp_path, "wb")
+        await self._file.write(bytes(self._buffer))
+        self._buffer.clear()
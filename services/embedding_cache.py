@@ -0,0 +1,254 @@
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from database import EmbeddingCacheEntry, run_sync
+from services import openai_service
+from services.openai_service import OpenAIService
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1024))
+# Entries older than this are re-embedded; 0 keeps them until evicted
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+# Upper bound on persisted rows; the oldest are evicted first (0 disables)
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", 100000))
+# Persisted entries are pruned once every this many writes
+EMBEDDING_CACHE_PRUNE_INTERVAL = 100
+# Keys per IN (...) lookup when fetching many entries at once
+LOOKUP_BATCH_SIZE = 500
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFKC, case-folded, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier cache for text embeddings.
+
+    Lookups try a bounded in-process LRU first, then the ``embedding_cache``
+    table, and only call the embeddings API on a miss in both. Entries are keyed
+    by (model, hash of the normalized text), so changing ``EMBEDDING_MODEL``
+    never serves a stale vector; ``invalidate_stale_models`` drops the rows left
+    behind by previous models.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, ttl_seconds: float = EMBEDDING_CACHE_TTL_SECONDS,
+                 max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[tuple[str, str], tuple[np.ndarray, datetime]]" = OrderedDict()
+        self._writes = 0
+        self.counts = Counter()
+
+    @property
+    def model(self) -> str:
+        return openai_service.EMBEDDING_MODEL
+
+    def _expired(self, created_at: Optional[datetime], now: datetime) -> bool:
+        return bool(self.ttl_seconds) and created_at is not None and \
+            now - created_at > timedelta(seconds=self.ttl_seconds)
+
+    async def get_or_create(self, text: str, db_session=None) -> np.ndarray:
+        """Embedding for ``text``, from the cache when possible"""
+        model, key = self.model, text_hash(text)
+        now = datetime.utcnow()
+
+        with self._lock:
+            cached = self._memory.get((model, key))
+            if cached is not None:
+                if not self._expired(cached[1], now):
+                    self._memory.move_to_end((model, key))
+                    self.counts["memory_hits"] += 1
+                    return cached[0]
+                del self._memory[(model, key)]
+                self.counts["expired"] += 1
+
+        if db_session is not None:
+            embedding = await run_sync(db_session, self._lookup, model, key, now)
+            if embedding is not None:
+                return embedding
+
+        self.counts["misses"] += 1
+        embedding = np.asarray(await OpenAIService.generate_embedding(text), dtype=np.float32)
+        self._remember(model, key, embedding, now)
+        if db_session is not None:
+            await run_sync(db_session, self._persist, model, key, embedding, now)
+        return embedding
+
+    async def get_or_create_many(self, texts: List[str], db_session=None) -> List[np.ndarray]:
+        """Embeddings for many texts; every miss is embedded in batched API requests"""
+        model, now = self.model, datetime.utcnow()
+        keys = [text_hash(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                cached = self._memory.get((model, key))
+                if cached is not None and not self._expired(cached[1], now):
+                    self._memory.move_to_end((model, key))
+                    found[key] = cached[0]
+                    self.counts["memory_hits"] += 1
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if db_session is not None and missing:
+            found.update(await run_sync(db_session, self._lookup_many, model, missing, now))
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            self.counts["misses"] += len(missing)
+            embeddings = await OpenAIService.generate_embeddings(list(missing.values()))
+            fresh = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in zip(missing, embeddings)}
+            for key, embedding in fresh.items():
+                self._remember(model, key, embedding, now)
+                found[key] = embedding
+            if db_session is not None:
+                await run_sync(db_session, self._persist_many, model, fresh, now)
+        return [found[key] for key in keys]
+
+    def _lookup(self, db_session, model: str, key: str, now: datetime) -> Optional[np.ndarray]:
+        entry = db_session.query(EmbeddingCacheEntry).filter(
+            EmbeddingCacheEntry.model == model,
+            EmbeddingCacheEntry.text_hash == key
+        ).first()
+        if entry is not None and not self._expired(entry.created_at, now):
+            self.counts["db_hits"] += 1
+            self._remember(model, key, entry.embedding, entry.created_at)
+            return entry.embedding
+        if entry is not None:
+            self.counts["expired"] += 1
+            db_session.delete(entry)
+            db_session.commit()
+        return None
+
+    def _lookup_many(self, db_session, model: str, keys: List[str], now: datetime) -> Dict[str, np.ndarray]:
+        found = {}
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            entries = db_session.query(EmbeddingCacheEntry).filter(
+                EmbeddingCacheEntry.model == model,
+                EmbeddingCacheEntry.text_hash.in_(keys[start:start + LOOKUP_BATCH_SIZE])
+            ).all()
+            for entry in entries:
+                if not self._expired(entry.created_at, now):
+                    found[entry.text_hash] = entry.embedding
+                    self.counts["db_hits"] += 1
+                    self._remember(model, entry.text_hash, entry.embedding, entry.created_at)
+        return found
+
+    def _remember(self, model: str, key: str, embedding: np.ndarray, created_at: datetime):
+        with self._lock:
+            self._memory[(model, key)] = (embedding, created_at)
+            self._memory.move_to_end((model, key))
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def _persist(self, db_session, model: str, key: str, embedding: np.ndarray, created_at: datetime):
+        try:
+            # A savepoint keeps a concurrent duplicate insert from rolling back the caller's work
+            with db_session.begin_nested():
+                db_session.add(EmbeddingCacheEntry(model=model, text_hash=key, embedding=embedding,
+                                                   created_at=created_at))
+        except IntegrityError:
+            pass
+        db_session.commit()
+
+        self._writes += 1
+        if self._writes >= EMBEDDING_CACHE_PRUNE_INTERVAL:
+            self._writes = 0
+            self.prune(db_session)
+
+    def _persist_many(self, db_session, model: str, embeddings: Dict[str, np.ndarray], created_at: datetime):
+        # Expired rows with the same keys are replaced rather than duplicated
+        db_session.query(EmbeddingCacheEntry).filter(
+            EmbeddingCacheEntry.model == model,
+            EmbeddingCacheEntry.text_hash.in_(list(embeddings))
+        ).delete(synchronize_session=False)
+        try:
+            with db_session.begin_nested():
+                db_session.add_all([
+                    EmbeddingCacheEntry(model=model, text_hash=key, embedding=embedding, created_at=created_at)
+                    for key, embedding in embeddings.items()
+                ])
+        except IntegrityError:
+            pass
+        db_session.commit()
+
+        self._writes += len(embeddings)
+        if self._writes >= EMBEDDING_CACHE_PRUNE_INTERVAL:
+            self._writes = 0
+            self.prune(db_session)
+
+    def prune(self, db_session) -> int:
+        """Delete expired rows and the oldest rows beyond ``max_rows``; returns the number removed"""
+        removed = 0
+        if self.ttl_seconds:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+            removed += db_session.query(EmbeddingCacheEntry).filter(
+                EmbeddingCacheEntry.created_at < cutoff
+            ).delete(synchronize_session=False)
+        if self.max_rows:
+            keep = db_session.query(EmbeddingCacheEntry.id).order_by(
+                EmbeddingCacheEntry.created_at.desc(), EmbeddingCacheEntry.id.desc()
+            ).limit(self.max_rows)
+            removed += db_session.query(EmbeddingCacheEntry).filter(
+                EmbeddingCacheEntry.id.notin_(keep.scalar_subquery())
+            ).delete(synchronize_session=False)
+        db_session.commit()
+        self.counts["evictions"] += removed
+        return removed
+
+    def invalidate_stale_models(self, db_session) -> int:
+        """Drop cached embeddings produced by any model other than the current one"""
+        model = self.model
+        with self._lock:
+            for key in [key for key in self._memory if key[0] != model]:
+                del self._memory[key]
+        removed = db_session.query(EmbeddingCacheEntry).filter(
+            EmbeddingCacheEntry.model != model
+        ).delete(synchronize_session=False)
+        db_session.commit()
+        return removed
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self, db_session=None) -> Dict[str, Any]:
+        hits = self.counts["memory_hits"] + self.counts["db_hits"]
+        lookups = hits + self.counts["misses"]
+        stats = {
+            "model": self.model,
+            "memory_hits": self.counts["memory_hits"],
+            "db_hits": self.counts["db_hits"],
+            "misses": self.counts["misses"],
+            "expired": self.counts["expired"],
+            "evictions": self.counts["evictions"],
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": len(self._memory),
+            "memory_max_size": self.max_size,
+        }
+        if db_session is not None:
+            stats["db_size"] = db_session.query(EmbeddingCacheEntry).count()
+        return stats
+
+    def reset(self):
+        self.clear_memory()
+        self.counts.clear()
+        self._writes = 0
+
+
+# Shared by search and the processing pipeline
+embedding_cache = EmbeddingCache()
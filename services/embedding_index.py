@@ -0,0 +1,305 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from database import DATABASE_URL, Meeting, decode_embedding, get_state
+
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "exact")
+
+
+def stamp_key(table) -> str:
+    """State key of the stamp a re-embedding run writes when it swaps in a table's new vectors"""
+    return f"embedding_stamp:{table.__tablename__}"
+
+
+def to_vector(embedding) -> Optional[np.ndarray]:
+    """Coerce a stored embedding (list, array, binary blob or JSON string) into a float32 vector"""
+    if isinstance(embedding, (str, bytes, bytearray, memoryview)):
+        embedding = decode_embedding(embedding)
+    if embedding is None:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    if vector.ndim != 1 or vector.size == 0:
+        return None
+    return vector
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    """Scale a vector to unit length so a dot product equals cosine similarity"""
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return vector
+    return vector / norm
+
+
+class EmbeddingIndex:
+    """Process-wide matrix of normalized meeting embeddings for exact cosine search.
+
+    Rows live in a contiguous float32 matrix with a parallel array of meeting ids,
+    so a query is a single matrix-vector product followed by an argpartition top-k.
+    Approximate backends subclass this and override the scoring step. The index
+    carries the embedding stamp of its source table; when a re-embedding run
+    changes the stamp, the next sync rebuilds the index.
+    """
+
+    backend = "exact"
+    # Table whose ``id`` and ``embedding`` columns the index mirrors
+    source = Meeting
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._initial_capacity = initial_capacity
+        self.reset()
+
+    def reset(self):
+        """Drop every vector held by the index"""
+        with self._lock:
+            self._matrix = None
+            self._ids = np.empty(0, dtype=np.int64)
+            self._positions = {}
+            self._size = 0
+            self._max_id = 0
+            self.stamp = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    def build(self, db_session):
+        """Rebuild the index from every row with an embedding"""
+        stamp = get_state(db_session, stamp_key(self.source))
+        rows = self._rows(db_session).yield_per(1000)
+        with self._lock:
+            self.reset()
+            self._add_rows(rows)
+            self.stamp = stamp
+
+    def sync(self, db_session):
+        """Bring the index up to date with its source table.
+
+        Rows appended since the last sync are added incrementally; any other
+        divergence (deleted rows, a recreated table, vectors swapped in by a
+        re-embedding run) triggers a full rebuild.
+        """
+        if get_state(db_session, stamp_key(self.source)) != self.stamp:
+            self.build(db_session)
+            return
+        count, max_id = (
+            db_session.query(func.count(self.source.id), func.max(self.source.id))
+            .filter(self.source.embedding.isnot(None))
+            .one()
+        )
+        max_id = max_id or 0
+        with self._lock:
+            if count == self._size and max_id == self._max_id:
+                return
+            if max_id > self._max_id and count > self._size:
+                self._add_rows(self._rows(db_session, after_id=self._max_id).all())
+                if count == self._size:
+                    return
+            self.build(db_session)
+
+    def add(self, meeting_id: int, embedding):
+        """Insert or replace the vector stored for a meeting"""
+        vector = to_vector(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            self._add(meeting_id, normalize(vector))
+
+    def get(self, meeting_id: int) -> Optional[np.ndarray]:
+        """Return the normalized vector stored for a meeting"""
+        with self._lock:
+            position = self._positions.get(meeting_id)
+            if position is None:
+                return None
+            return self._matrix[position].copy()
+
+    def search(self, query_embedding, top_k: int = 5,
+               exclude_ids: Iterable[int] = (), **params) -> List[Tuple[int, float]]:
+        """Return up to top_k (meeting_id, cosine similarity) pairs, best first.
+
+        Backend-specific tuning knobs (e.g. ``nprobe``) are passed as keyword arguments
+        and ignored by backends that do not use them.
+        """
+        query = to_vector(query_embedding)
+        with self._lock:
+            if query is None or self._size == 0 or top_k <= 0:
+                return []
+            if query.shape[0] != self._matrix.shape[1]:
+                raise ValueError(
+                    f"Query dimension {query.shape[0]} does not match index dimension {self._matrix.shape[1]}"
+                )
+            positions, scores = self._score(normalize(query), **params)
+            ids = self._ids[:self._size][positions] if positions is not None else self._ids[:self._size].copy()
+            excluded = set(exclude_ids)
+
+        if excluded:
+            scores[np.isin(ids, list(excluded))] = -np.inf
+
+        k = min(top_k, int(np.count_nonzero(scores > -np.inf)))
+        if k <= 0:
+            return []
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        best = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in best]
+
+    def similarities(self, query_embedding) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact cosine similarity of a query to every stored vector, as (ids, scores) arrays"""
+        query = to_vector(query_embedding)
+        with self._lock:
+            if query is None or self._size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            scores = self._matrix[:self._size] @ normalize(query)
+            return self._ids[:self._size].copy(), scores
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The stored (ids, normalized vectors), as views of the index's own arrays rather than copies"""
+        with self._lock:
+            if self._matrix is None:
+                return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+            return self._ids[:self._size], self._matrix[:self._size]
+
+    def save(self, path: str, keep_other_stamps: bool = False) -> bool:
+        """Persist the index to disk, replacing any previous file atomically.
+
+        With ``keep_other_stamps``, a file built from other embeddings (by a
+        re-embedding run since this index was loaded) is left in place; returns
+        whether the file was written.
+        """
+        with self._lock:
+            arrays = self._state()
+            stamp = self.stamp
+        if keep_other_stamps and self.file_stamp(path) not in (None, stamp or ""):
+            return False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, backend=np.array(self.backend), stamp=np.array(stamp or ""), **arrays)
+        os.replace(tmp_path, path)
+        return True
+
+    @staticmethod
+    def file_stamp(path: str) -> Optional[str]:
+        """Embedding stamp of a persisted index ("" if it has none); None if there is no readable file"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return str(data["stamp"]) if "stamp" in data.files else ""
+        except (OSError, ValueError):
+            return None
+
+    def load(self, path: str) -> bool:
+        """Restore a persisted index; returns False if the file is missing or incompatible"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["backend"]) != self.backend:
+                    return False
+                stamp = str(data["stamp"]) if "stamp" in data.files else ""
+                arrays = {name: data[name] for name in data.files if name not in ("backend", "stamp")}
+        except (OSError, ValueError, KeyError):
+            return False
+        with self._lock:
+            self.reset()
+            self._restore(arrays)
+            self.stamp = stamp or None
+        return True
+
+    def _rows(self, db_session, after_id: int = 0):
+        """Query for (id, embedding) rows with an id above ``after_id``, in id order"""
+        return (
+            db_session.query(self.source.id, self.source.embedding)
+            .filter(self.source.embedding.isnot(None), self.source.id > after_id)
+            .order_by(self.source.id)
+        )
+
+    def _score(self, query: np.ndarray, **params):
+        """Score candidate rows; returns (positions or None for all rows, scores)"""
+        return None, self._matrix[:self._size] @ query
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        if self._matrix is None:
+            return {"matrix": np.empty((0, 0), dtype=np.float32), "ids": np.empty(0, dtype=np.int64)}
+        return {"matrix": self._matrix[:self._size], "ids": self._ids[:self._size]}
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        matrix, ids = arrays["matrix"], arrays["ids"]
+        if matrix.shape[0] == 0:
+            return
+        capacity = max(self._initial_capacity, matrix.shape[0])
+        self._matrix = np.empty((capacity, matrix.shape[1]), dtype=np.float32)
+        self._matrix[:matrix.shape[0]] = matrix
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._ids[:ids.shape[0]] = ids
+        self._size = int(ids.shape[0])
+        self._positions = {int(meeting_id): position for position, meeting_id in enumerate(ids)}
+        self._max_id = int(ids.max())
+
+    def _add_rows(self, rows):
+        for meeting_id, embedding in rows:
+            vector = to_vector(embedding)
+            if vector is not None:
+                self._add(meeting_id, normalize(vector))
+
+    def _add(self, meeting_id: int, vector: np.ndarray):
+        if self._matrix is None:
+            self._matrix = np.empty((self._initial_capacity, vector.shape[0]), dtype=np.float32)
+            self._ids = np.empty(self._initial_capacity, dtype=np.int64)
+        elif vector.shape[0] != self._matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {vector.shape[0]} does not match index dimension {self._matrix.shape[1]}"
+            )
+
+        position = self._positions.get(meeting_id)
+        if position is None:
+            if self._size == self._matrix.shape[0]:
+                self._grow()
+            position = self._size
+            self._size += 1
+            self._positions[meeting_id] = position
+            self._ids[position] = meeting_id
+            self._max_id = max(self._max_id, meeting_id)
+        self._matrix[position] = vector
+
+    def _grow(self):
+        capacity = self._matrix.shape[0] * 2
+        matrix = np.empty((capacity, self._matrix.shape[1]), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+
+
+def create_index(backend: str = None) -> EmbeddingIndex:
+    """Instantiate the configured vector index backend ("exact" or "ivf")"""
+    backend = backend or VECTOR_INDEX_BACKEND
+    if backend == "exact":
+        return EmbeddingIndex()
+    if backend == "ivf":
+        from services.ivf_index import IVFIndex
+        return IVFIndex()
+    raise ValueError(f"Unknown vector index backend: {backend}")
+
+
+def default_index_path() -> str:
+    """Index file location: VECTOR_INDEX_PATH, else next to the SQLite database"""
+    path = os.getenv("VECTOR_INDEX_PATH")
+    if path:
+        return path
+    if DATABASE_URL.startswith("sqlite:///"):
+        database_path = DATABASE_URL[len("sqlite:///"):]
+        return f"{os.path.splitext(database_path)[0]}.{VECTOR_INDEX_BACKEND}.npz"
+    return f"meeting_intelligence.{VECTOR_INDEX_BACKEND}.npz"
+
+
+# Shared by the API process; loaded at startup and updated as meetings are processed
+embedding_index = create_index()
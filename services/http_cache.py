@@ -0,0 +1,118 @@
+"""Conditional, compressed JSON responses for large meeting payloads.
+
+Meeting details and translations carry whole transcripts, often hundreds of
+KB. Each meeting has a version that goes up whenever processing or a
+translation writes to it. Its ETag and ``Last-Modified`` come from that version,
+so a client that still holds the current copy gets a ``304`` without the
+transcript being read. Bodies are encoded with orjson, and above
+COMPRESS_MIN_BYTES they are compressed with brotli or gzip, whichever the
+client accepts.
+"""
+import asyncio
+import gzip
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import brotli
+import orjson
+from fastapi import Response
+
+# Smaller bodies gain too little from compression to pay for it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+# Higher levels shrink transcripts little more for several times the CPU;
+# brotli at quality 1 is both smaller and faster than gzip at level 1
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 1))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 1))
+# Clients may keep these responses, but must revalidate them before each use
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def encode_json(value: Any) -> bytes:
+    return orjson.dumps(value)
+
+
+def meeting_etag(meeting_id: int, version: Optional[int], created_at: Optional[datetime], kind: str) -> str:
+    """Weak ETag of one representation (``kind``) of a meeting at a version.
+
+    Weak, since the same version is served gzip, brotli or uncompressed. The
+    creation time tells apart meetings that reuse the id of a deleted one.
+    """
+    created = int(created_at.timestamp() * 1_000_000) if created_at else 0
+    return f'W/"{kind}-{meeting_id}-{version or 0}-{created:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header lists ``etag`` (weak comparison, as RFC 9110 asks)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def http_date(value: datetime) -> str:
+    """An HTTP date for a naive UTC timestamp, as stored in the database"""
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str,
+                 last_modified: Optional[datetime]) -> bool:
+    """Whether a conditional GET can be answered with 304; ``If-None-Match`` wins when both are sent"""
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """"br" or "gzip" if the client accepts it (brotli preferred); None for identity"""
+    accepted = {}
+    for entry in (accept_encoding or "").lower().split(","):
+        name, _, params = entry.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if accepted.get("br", accepted.get("*", 0)) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+async def json_response(value: Any, accept_encoding: Optional[str] = None,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """Encode ``value`` as JSON, compressed when it is large and the client accepts it"""
+    body = encode_json(value)
+    headers = dict(headers or {})
+    encoding = choose_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding is not None:
+        # Milliseconds of CPU for a long transcript, kept off the event loop
+        body = await asyncio.to_thread(compress, body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,184 @@
+import math
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from services.embedding_index import EmbeddingIndex
+
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0))  # 0 picks ~4 * sqrt(N) lists
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", 4096))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", 20000))
+IVF_TRAIN_ITERATIONS = int(os.getenv("IVF_TRAIN_ITERATIONS", 10))
+
+ASSIGN_CHUNK_SIZE = 4096
+
+
+class IVFIndex(EmbeddingIndex):
+    """Inverted-file approximate index: a spherical k-means coarse quantizer plus
+    one inverted list of row positions per centroid.
+
+    A query scores the centroids, probes the ``nprobe`` closest lists and only
+    scans their rows. Below ``min_train_size`` vectors the index behaves exactly
+    like the brute-force backend. New vectors are assigned to their nearest
+    centroid as they arrive, and the quantizer is retrained once the index has
+    doubled since the last training run.
+    """
+
+    backend = "ivf"
+
+    def __init__(self, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE,
+                 min_train_size: int = IVF_MIN_TRAIN_SIZE, train_sample: int = IVF_TRAIN_SAMPLE,
+                 train_iterations: int = IVF_TRAIN_ITERATIONS, initial_capacity: int = 1024):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.train_sample = train_sample
+        self.train_iterations = train_iterations
+        self._deferred_training = False
+        super().__init__(initial_capacity)
+
+    def reset(self):
+        with self._lock:
+            super().reset()
+            self._centroids = None
+            self._assignments = np.empty(0, dtype=np.int32)
+            self._lists = []
+            self._list_arrays = {}
+            self._trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def build(self, db_session):
+        with self._lock:
+            self._deferred_training = True
+            try:
+                super().build(db_session)
+            finally:
+                self._deferred_training = False
+            self.train()
+
+    def train(self):
+        """(Re)train the coarse quantizer on the current vectors and rebuild the inverted lists"""
+        with self._lock:
+            size = self._size
+            if size < max(self.min_train_size, 1):
+                self._centroids = None
+                self._lists = []
+                self._list_arrays = {}
+                return
+
+            nlist = min(self.nlist or max(1, int(4 * math.sqrt(size))), size)
+            rng = np.random.default_rng(0)
+            sample_size = min(size, max(self.train_sample, nlist))
+            sample = self._matrix[np.sort(rng.choice(size, sample_size, replace=False))]
+            centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+            for _ in range(self.train_iterations):
+                assignments = self._nearest(sample, centroids)
+                order = np.argsort(assignments, kind="stable")
+                counts = np.bincount(assignments, minlength=nlist)
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+                non_empty = counts > 0
+                sums = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                centroids[non_empty] = sums / norms
+                # Re-seed empty lists from random sample points
+                empty = np.flatnonzero(~non_empty)
+                if empty.size:
+                    centroids[empty] = sample[rng.choice(sample_size, empty.size, replace=False)]
+
+            self._centroids = centroids.astype(np.float32)
+            self._assignments = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+            self._assignments[:size] = self._nearest(self._matrix[:size], self._centroids)
+            self._rebuild_lists()
+            self._trained_size = size
+
+    def _score(self, query: np.ndarray, nprobe: Optional[int] = None, **params):
+        if self._centroids is None:
+            return super()._score(query)
+        nlist = self._centroids.shape[0]
+        nprobe = max(1, min(nprobe or self.nprobe, nlist))
+        centroid_scores = self._centroids @ query
+        if nprobe < nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(nlist)
+        positions = np.concatenate([self._list_array(list_id) for list_id in probe])
+        return positions, self._matrix[positions] @ query
+
+    def _add(self, meeting_id: int, vector: np.ndarray):
+        previous = self._positions.get(meeting_id)
+        super()._add(meeting_id, vector)
+        if self._deferred_training:
+            return
+        if self._centroids is None:
+            if self._size >= self.min_train_size:
+                self.train()
+            return
+        if self._size >= 2 * self._trained_size:
+            self.train()
+            return
+
+        position = self._positions[meeting_id]
+        if previous is not None:
+            old_list = int(self._assignments[position])
+            self._lists[old_list].remove(position)
+            self._list_arrays.pop(old_list, None)
+        list_id = int(np.argmax(self._centroids @ vector))
+        self._assignments[position] = list_id
+        self._lists[list_id].append(position)
+        self._list_arrays.pop(list_id, None)
+
+    def _grow(self):
+        super()._grow()
+        if self._assignments.shape[0]:
+            assignments = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+            assignments[:self._assignments.shape[0]] = self._assignments
+            self._assignments = assignments
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        state = super()._state()
+        if self._centroids is not None:
+            state["centroids"] = self._centroids
+            state["assignments"] = self._assignments[:self._size]
+            state["trained_size"] = np.array(self._trained_size)
+        return state
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        super()._restore(arrays)
+        if "centroids" not in arrays or self._matrix is None:
+            return
+        self._centroids = arrays["centroids"].astype(np.float32)
+        self._assignments = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+        self._assignments[:self._size] = arrays["assignments"]
+        self._trained_size = int(arrays["trained_size"])
+        self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        assignments = self._assignments[:self._size]
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self._centroids.shape[0])
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        self._lists = [order[bounds[i]:bounds[i + 1]].tolist() for i in range(len(counts))]
+        self._list_arrays = {}
+
+    def _list_array(self, list_id: int) -> np.ndarray:
+        array = self._list_arrays.get(list_id)
+        if array is None:
+            array = np.asarray(self._lists[list_id], dtype=np.int64)
+            self._list_arrays[list_id] = array
+        return array
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Index of the most similar centroid for each row, computed in bounded chunks"""
+        assignments = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], ASSIGN_CHUNK_SIZE):
+            chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+            assignments[start:start + ASSIGN_CHUNK_SIZE] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignments
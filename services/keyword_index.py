@@ -0,0 +1,129 @@
+import re
+from typing import List, Tuple
+
+from sqlalchemy import event, inspect, text
+
+from database import Meeting
+
+# Column weights for BM25: title, summary, transcription, action items
+KEYWORD_WEIGHTS = (5.0, 2.0, 1.0, 2.0)
+
+FTS_TABLE = "meetings_fts"
+
+# Action items are stored as JSON; only their task and owner text is indexed
+_ACTION_ITEMS_TEXT = """(SELECT group_concat(
+    coalesce(json_extract(value, '$.task'), '') || ' ' || coalesce(json_extract(value, '$.owner'), ''), ' ')
+    FROM json_each(CASE WHEN json_valid({row}.action_items) THEN {row}.action_items ELSE '[]' END))"""
+
+_INDEX_ROW = "{row}.id, {row}.title, {row}.summary, {row}.transcription, " + _ACTION_ITEMS_TEXT
+
+CREATE_STATEMENTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, summary, transcription, action_items, tokenize = 'unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER IF NOT EXISTS meetings_fts_insert AFTER INSERT ON meetings BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, title, summary, transcription, action_items)
+        VALUES ({_INDEX_ROW.format(row="new")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS meetings_fts_update
+        AFTER UPDATE OF title, summary, transcription, action_items ON meetings BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, title, summary, transcription, action_items)
+        VALUES ({_INDEX_ROW.format(row="new")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS meetings_fts_delete AFTER DELETE ON meetings BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+)
+
+DROP_STATEMENTS = (
+    "DROP TRIGGER IF EXISTS meetings_fts_insert",
+    "DROP TRIGGER IF EXISTS meetings_fts_update",
+    "DROP TRIGGER IF EXISTS meetings_fts_delete",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+)
+
+
+class KeywordSearchUnavailable(Exception):
+    """Raised when the database has no full-text index (non-SQLite backends)"""
+
+
+def is_supported(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def create_keyword_index(bind) -> int:
+    """Create the FTS5 table and its triggers if missing, indexing existing meetings.
+
+    Returns the number of meetings indexed by the backfill (0 if the index already existed).
+    """
+    if not is_supported(bind) or FTS_TABLE in inspect(bind).get_table_names():
+        return 0
+    with bind.begin() as connection:
+        for statement in CREATE_STATEMENTS:
+            connection.execute(text(statement))
+        return connection.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, summary, transcription, action_items) "
+            f"SELECT {_INDEX_ROW.format(row='meetings')} FROM meetings"
+        )).rowcount
+
+
+@event.listens_for(Meeting.__table__, "after_create")
+def _create_with_meetings(target, connection, **kw):
+    if is_supported(connection):
+        for statement in CREATE_STATEMENTS:
+            connection.execute(text(statement))
+
+
+@event.listens_for(Meeting.__table__, "before_drop")
+def _drop_with_meetings(target, connection, **kw):
+    if is_supported(connection):
+        for statement in DROP_STATEMENTS:
+            connection.execute(text(statement))
+
+
+def match_expression(query: str) -> str:
+    """Turn free text into a safe FTS5 query.
+
+    Quoted passages stay phrases and every other word is quoted on its own, so
+    punctuation in ticket numbers or names is never parsed as query syntax.
+    Terms are OR-ed; BM25 ranks meetings matching more of them first.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        words = re.findall(r"\w+", phrase if phrase else word)
+        if words:
+            terms.append('"' + " ".join(words) + '"')
+    return " OR ".join(terms)
+
+
+class KeywordIndex:
+    """BM25 keyword search over meeting titles, summaries, transcripts and action items.
+
+    The SQLite FTS5 table is maintained by triggers on ``meetings``, so every
+    insert and update is indexed in the same transaction and searches need no
+    network access.
+    """
+
+    @staticmethod
+    def search(query: str, db_session, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return (meeting_id, score) pairs, best first; higher scores are better matches"""
+        if not is_supported(db_session.get_bind()):
+            raise KeywordSearchUnavailable("Keyword search requires SQLite with FTS5")
+        expression = match_expression(query)
+        if not expression:
+            return []
+        weights = ", ".join(str(weight) for weight in KEYWORD_WEIGHTS)
+        rows = db_session.execute(text(
+            f"SELECT rowid, -bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH :query ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT :limit"
+        ), {"query": expression, "limit": top_k}).fetchall()
+        return [(row[0], float(row[1])) for row in rows]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse several ranked lists; each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores = {}
+    for ranking in rankings:
+        for rank, (item_id, _) in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
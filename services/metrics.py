@@ -0,0 +1,302 @@
+"""Process metrics in the Prometheus text format, plus per-request timings.
+
+``MetricsMiddleware`` times every HTTP request by route template and opens a
+per-request record that the rest of the code adds to: ``timed()`` blocks
+(search stages, file writes, commits), OpenAI calls and the SQL queries the
+engine hooks count. Histograms and counters are rendered by ``/metrics``; a
+request's own breakdown can be returned in a ``Server-Timing`` header.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Send a Server-Timing header on every response; without it only requests with an
+# ``X-Server-Timing: 1`` header get one
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# OpenAI calls include scheduler queueing and can run for minutes (long transcriptions)
+OPENAI_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(items))
+        return lines
+
+    @abstractmethod
+    def _samples(self, items) -> Iterator[str]:
+        """Exposition lines for the (label values, value) pairs of every series"""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, items):
+        for key, value in items:
+            yield f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self, items):
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(pairs)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def add(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.add(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")))
+HTTP_REQUEST_QUERIES = registry.add(Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ("route",), COUNT_BUCKETS))
+HTTP_REQUEST_ROWS = registry.add(Histogram(
+    "http_request_db_rows", "ORM rows loaded plus rows written per HTTP request", ("route",), COUNT_BUCKETS))
+OPERATION_SECONDS = registry.add(Histogram(
+    "app_operation_duration_seconds", "Time spent in instrumented blocks (search stages, file I/O, commits)",
+    ("operation",)))
+PIPELINE_STAGE_SECONDS = registry.add(Histogram(
+    "pipeline_stage_duration_seconds", "Background processing stage attempts", ("stage", "outcome"),
+    OPENAI_BUCKETS))
+OPENAI_REQUEST_SECONDS = registry.add(Histogram(
+    "openai_request_duration_seconds", "OpenAI calls including scheduler queueing and retries",
+    ("endpoint", "model", "outcome"), OPENAI_BUCKETS))
+OPENAI_TOKENS = registry.add(Counter(
+    "openai_tokens_total", "Tokens reported by OpenAI responses", ("model", "type")))
+DB_QUERY_SECONDS = registry.add(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time by statement type", ("statement",)))
+DB_ROWS_LOADED = registry.add(Counter("db_rows_loaded_total", "ORM objects loaded from query results"))
+DB_ROWS_WRITTEN = registry.add(Counter("db_rows_written_total", "Rows inserted, updated or deleted"))
+
+
+@dataclass
+class RequestStats:
+    """What one HTTP request spent its time on"""
+    timings: Dict[str, float] = field(default_factory=dict)
+    queries: int = 0
+    query_seconds: float = 0.0
+    rows: int = 0
+
+    def add(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()]
+        if self.queries:
+            entries.append(f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries, {self.rows} rows"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request() -> Optional[RequestStats]:
+    """Stats of the HTTP request being served, or None outside one (background workers)"""
+    return _current_request.get()
+
+
+@contextmanager
+def timed(operation: str):
+    """Record the block's duration under ``operation`` and in the current request's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        OPERATION_SECONDS.observe(elapsed, operation=operation)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.add(operation, elapsed)
+
+
+def record_openai_call(endpoint: str, model: str, seconds: float, outcome: str, usage=None):
+    """Time an OpenAI call and count the tokens its response reports"""
+    OPENAI_REQUEST_SECONDS.observe(seconds, endpoint=endpoint, model=model, outcome=outcome)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if isinstance(tokens, int) and tokens:
+            OPENAI_TOKENS.inc(tokens, model=model, type=kind.split("_")[0])
+    stats = _current_request.get()
+    if stats is not None:
+        stats.add(f"openai.{endpoint}", seconds)
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return keyword if keyword in ("select", "insert", "update", "delete", "with") else "other"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    kind = _statement_type(statement)
+    DB_QUERY_SECONDS.observe(elapsed, statement=kind)
+    written = cursor.rowcount if kind in ("insert", "update", "delete") and cursor.rowcount > 0 else 0
+    if written:
+        DB_ROWS_WRITTEN.inc(written)
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+        stats.rows += written
+
+
+def _on_load(target, context):
+    DB_ROWS_LOADED.inc()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.rows += 1
+
+
+def instrument_engine(sync_engine):
+    """Count and time every statement run on ``sync_engine`` (an async engine's ``.sync_engine``)"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def instrument_orm_loads(base):
+    """Count every ORM object loaded for the models of a declarative base"""
+    event.listen(base, "load", _on_load, propagate=True)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, query and row counts per route, with optional Server-Timing"""
+
+    def __init__(self, app, server_timing: bool = None):
+        self.app = app
+        self.server_timing = METRICS_SERVER_TIMING if server_timing is None else server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        started = time.perf_counter()
+        status = 500
+        send_timing = self.server_timing or (b"x-server-timing", b"1") in scope.get("headers", ())
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if send_timing:
+                    # Work still running after the headers (streamed bodies) is only in the histograms
+                    header = stats.server_timing(time.perf_counter() - started).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        token = _current_request.set(stats)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current_request.reset(token)
+            # The route template keeps label cardinality bounded; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route,
+                                         status=str(status))
+            HTTP_REQUEST_QUERIES.observe(stats.queries, route=route)
+            HTTP_REQUEST_ROWS.observe(stats.rows, route=route)
@@ -0,0 +1,99 @@
+"""Streaming reader for multipart/form-data request bodies.
+
+Starlette's form parser writes every file part to a temporary file before the
+endpoint runs, so an upload can only be checked once all of it has arrived and
+been written out once already. This reader parses the body as the server
+receives it and hands each part's bytes to the caller chunk by chunk, so the
+caller can reject a request after its first bytes and write a file exactly once.
+"""
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+class MultipartError(Exception):
+    """Raised for a body that is not well-formed multipart/form-data"""
+
+
+@dataclass
+class FormPart:
+    name: str
+    filename: Optional[str] = None  # set for file fields
+    content_type: Optional[str] = None
+
+
+class _Events:
+    """Parser callbacks, collecting (part, data) events for the reader to hand out"""
+
+    def __init__(self):
+        self.events: List[Tuple[FormPart, Optional[bytes]]] = []
+        self.finished = False
+        self._headers = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._part: Optional[FormPart] = None
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MultipartError('A part has no Content-Disposition "name"')
+        filename = options.get(b"filename")
+        content_type = self._headers.get(b"content-type")
+        self._part = FormPart(
+            options[b"name"].decode("utf-8", "replace"),
+            filename.decode("utf-8", "replace") if filename is not None else None,
+            content_type.decode("latin-1") if content_type is not None else None,
+        )
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        self.events.append((self._part, bytes(data[start:end])))
+
+    def on_part_end(self):
+        self.events.append((self._part, None))
+
+    def on_end(self):
+        self.finished = True
+
+
+async def iter_parts(content_type: str, stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[FormPart, Optional[bytes]]]:
+    """Yield ``(part, data)`` as body bytes arrive, and ``(part, None)`` once a part is complete.
+
+    At most one received chunk's worth of events is held at a time; stopping
+    the iteration stops reading the body.
+    """
+    kind, params = parse_options_header(content_type or "")
+    if kind != b"multipart/form-data" or b"boundary" not in params:
+        raise MultipartError("Expected a multipart/form-data body")
+    events = _Events()
+    parser = MultipartParser(params[b"boundary"], {
+        name: getattr(events, name) for name in (
+            "on_part_begin", "on_header_field", "on_header_value", "on_header_end", "on_headers_finished",
+            "on_part_data", "on_part_end", "on_end",
+        )
+    })
+    async for chunk in stream:
+        try:
+            parser.write(chunk)
+        except MultipartParseError as e:
+            raise MultipartError(str(e)) from e
+        for event in events.events:
+            yield event
+        events.events.clear()
+        if events.finished:
+            return
+    raise MultipartError("The multipart body ended early")
@@ -0,0 +1,221 @@
+"""Precomputed similar-meeting lists.
+
+Every meeting with an embedding keeps its ``NEIGHBOR_K`` most similar meetings in
+``meeting_neighbors``, so ``/api/meetings/{id}/similar`` is one indexed lookup.
+``Meeting.neighbors_updated_at`` is the staleness marker: NULL means the stored
+list is missing or out of date and must be recomputed. ``Meeting.neighbor_floor``
+holds the weakest score of a full list, so a new meeting only touches the lists
+it beats.
+
+Rebuild every list (or only the stale ones) with::
+
+    python -m services.neighbors [--stale]
+"""
+import argparse
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, insert, or_, update
+
+from database import Meeting, MeetingNeighbor, SessionLocal
+from services.embedding_index import embedding_index
+
+NEIGHBOR_K = int(os.getenv("NEIGHBOR_K", 10))
+# Upper bound on the similarity block held in memory during a rebuild
+NEIGHBOR_BLOCK_BYTES = int(os.getenv("NEIGHBOR_BLOCK_BYTES", 64 * 1024 * 1024))
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores in each row, best first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        best = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(best, order, axis=1)
+
+
+def rebuild_neighbors(db_session, only_stale: bool = False, k: int = NEIGHBOR_K,
+                      block_bytes: int = NEIGHBOR_BLOCK_BYTES) -> int:
+    """Recompute neighbour lists with chunked matrix-matrix products.
+
+    Rows are scored a block at a time against the whole embedding matrix, so
+    memory stays near ``block_bytes`` however many meetings there are. Each block
+    is committed with its staleness markers cleared, which lets an interrupted
+    rebuild resume with ``only_stale``. Vectors come from the in-memory embedding
+    index, which is synced first rather than copied. Returns the number of
+    meetings updated.
+    """
+    embedding_index.sync(db_session)
+    ids, matrix = embedding_index.vectors()
+    if only_stale:
+        stale = {row[0] for row in db_session.query(Meeting.id).filter(
+            Meeting.embedding.isnot(None), Meeting.neighbors_updated_at.is_(None)
+        )}
+        targets = np.flatnonzero(np.isin(ids, list(stale)))
+    else:
+        db_session.query(Meeting).update({Meeting.neighbors_updated_at: None}, synchronize_session=False)
+        db_session.query(MeetingNeighbor).delete(synchronize_session=False)
+        db_session.commit()
+        targets = np.arange(len(ids))
+    if not len(targets):
+        return 0
+
+    block = max(1, block_bytes // (matrix.shape[0] * 4))
+    for start in range(0, len(targets), block):
+        rows = targets[start:start + block]
+        scores = matrix[rows] @ matrix.T
+        scores[np.arange(len(rows)), rows] = -np.inf  # a meeting is not its own neighbour
+        best = _top_k(scores, k)
+
+        block_ids = [int(meeting_id) for meeting_id in ids[rows]]
+        if only_stale:
+            db_session.query(MeetingNeighbor).filter(
+                MeetingNeighbor.meeting_id.in_(block_ids)
+            ).delete(synchronize_session=False)
+        neighbor_rows, markers, now = [], [], datetime.utcnow()
+        for i in range(len(rows)):
+            ranked = [(int(ids[j]), float(scores[i, j])) for j in best[i] if scores[i, j] > -np.inf]
+            neighbor_rows.extend({"meeting_id": block_ids[i], "neighbor_id": neighbor_id, "score": score}
+                                 for neighbor_id, score in ranked)
+            markers.append({"id": block_ids[i], "neighbors_updated_at": now, "neighbor_floor": _floor(ranked, k)})
+        if neighbor_rows:
+            db_session.execute(insert(MeetingNeighbor), neighbor_rows)
+        db_session.execute(update(Meeting), markers)
+        db_session.commit()
+    return len(targets)
+
+
+def refresh_meeting(db_session, meeting_id: int, k: int = NEIGHBOR_K) -> List[Tuple[int, float]]:
+    """Recompute and store one meeting's own list from the in-memory embedding index"""
+    embedding_index.sync(db_session)
+    vector = embedding_index.get(meeting_id)
+    if vector is None:
+        return []
+    ranked = embedding_index.search(vector, k, exclude_ids=[meeting_id])
+    db_session.query(MeetingNeighbor).filter(MeetingNeighbor.meeting_id == meeting_id).delete(
+        synchronize_session=False
+    )
+    if ranked:
+        db_session.execute(insert(MeetingNeighbor), [
+            {"meeting_id": meeting_id, "neighbor_id": neighbor_id, "score": score} for neighbor_id, score in ranked
+        ])
+    db_session.query(Meeting).filter(Meeting.id == meeting_id).update(
+        {Meeting.neighbors_updated_at: datetime.utcnow(), Meeting.neighbor_floor: _floor(ranked, k)},
+        synchronize_session=False
+    )
+    db_session.commit()
+    return ranked
+
+
+def update_neighbors(db_session, meeting_id: int, k: int = NEIGHBOR_K):
+    """Fold one new or re-embedded meeting into the neighbour table.
+
+    Its own list is recomputed, and every fresh list it now belongs in gains it
+    and drops its weakest entry. Only lists with room, or whose floor is below
+    the meeting's score, are read. Lists it drops out of (after a re-embedding)
+    are marked stale rather than patched.
+    """
+    refresh_meeting(db_session, meeting_id, k)
+    vector = embedding_index.get(meeting_id)
+    if vector is None:
+        return
+    ids, scores = embedding_index.similarities(vector)
+    others = ids != meeting_id
+    ids, scores = ids[others], scores[others]
+
+    previous_lists = {row[0] for row in db_session.query(MeetingNeighbor.meeting_id).filter(
+        MeetingNeighbor.neighbor_id == meeting_id
+    )}
+    db_session.query(MeetingNeighbor).filter(MeetingNeighbor.neighbor_id == meeting_id).delete(
+        synchronize_session=False
+    )
+
+    entered = set()
+    if len(ids):
+        # Fresh lists that could take the meeting: those with room, or a floor below its best score
+        candidates = db_session.query(Meeting.id, Meeting.neighbor_floor).filter(
+            Meeting.neighbors_updated_at.isnot(None), Meeting.id != meeting_id,
+            or_(Meeting.neighbor_floor.is_(None), Meeting.neighbor_floor < float(scores.max()))
+        ).all()
+        candidate_ids = np.array([row[0] for row in candidates], dtype=np.int64)
+        floors = np.array([np.nan if row[1] is None else row[1] for row in candidates], dtype=np.float64)
+        order = np.argsort(ids)
+        found = np.searchsorted(ids, candidate_ids, sorter=order)
+        found = np.minimum(found, len(ids) - 1)
+        indexed = ids[order[found]] == candidate_ids
+        candidate_scores = np.where(indexed, scores[order[found]], -np.inf)
+        beats = indexed & (np.isnan(floors) | (candidate_scores > floors))
+        entered = _enter_lists(db_session, meeting_id, candidate_ids[beats].tolist(),
+                               candidate_scores[beats].tolist(), k)
+
+    dropped = previous_lists - entered
+    if dropped:
+        db_session.query(Meeting).filter(Meeting.id.in_(dropped)).update(
+            {Meeting.neighbors_updated_at: None}, synchronize_session=False
+        )
+    db_session.commit()
+
+
+def _enter_lists(db_session, meeting_id: int, lists: List[int], scores: List[float], k: int) -> set:
+    """Add the meeting to each list it beats and store the lists' new floors; returns the lists entered"""
+    if not lists:
+        return set()
+    # Lists without a floor may be full all the same (e.g. stored before floors were kept)
+    sizes = {row[0]: (row[1], row[2]) for row in db_session.query(
+        MeetingNeighbor.meeting_id, func.count(MeetingNeighbor.id), func.min(MeetingNeighbor.score)
+    ).filter(MeetingNeighbor.meeting_id.in_(lists)).group_by(MeetingNeighbor.meeting_id)}
+
+    entered, floors = set(), []
+    for other, score in zip(lists, scores):
+        size, weakest = sizes.get(other, (0, None))
+        if size >= k and score <= weakest:
+            floors.append({"id": other, "neighbor_floor": weakest})
+            continue
+        if size >= k:
+            weakest_id = db_session.query(MeetingNeighbor.id).filter(
+                MeetingNeighbor.meeting_id == other
+            ).order_by(MeetingNeighbor.score, MeetingNeighbor.id.desc()).limit(1).scalar()
+            db_session.query(MeetingNeighbor).filter(MeetingNeighbor.id == weakest_id).delete(
+                synchronize_session=False
+            )
+        db_session.add(MeetingNeighbor(meeting_id=other, neighbor_id=meeting_id, score=score))
+        entered.add(other)
+    db_session.flush()
+
+    if entered:
+        for other, size, weakest in db_session.query(
+            MeetingNeighbor.meeting_id, func.count(MeetingNeighbor.id), func.min(MeetingNeighbor.score)
+        ).filter(MeetingNeighbor.meeting_id.in_(entered)).group_by(MeetingNeighbor.meeting_id):
+            floors.append({"id": other, "neighbor_floor": weakest if size >= k else None})
+    if floors:
+        db_session.execute(update(Meeting), floors)
+    return entered
+
+
+def _floor(ranked: List[Tuple[int, float]], k: int) -> Optional[float]:
+    """Weakest score of a best-first list once it holds k entries"""
+    return ranked[-1][1] if len(ranked) >= k else None
+
+
+def get_neighbors(db_session, meeting_id: int, top_k: int) -> List[Tuple[int, float]]:
+    """Stored (neighbor_id, score) pairs for a meeting, best first"""
+    return [(row[0], row[1]) for row in db_session.query(MeetingNeighbor.neighbor_id, MeetingNeighbor.score).filter(
+        MeetingNeighbor.meeting_id == meeting_id
+    ).order_by(MeetingNeighbor.score.desc()).limit(top_k)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the precomputed similar-meeting table")
+    parser.add_argument("--stale", action="store_true", help="only recompute meetings marked stale")
+    args = parser.parse_args()
+    session = SessionLocal()
+    try:
+        print(f"meetings updated: {rebuild_neighbors(session, only_stale=args.stale)}")
+    finally:
+        session.close()
@@ -1,27 +1,166 @@
 import openai
+import asyncio
+import base64
+import importlib.util
 import os
+import time
+import weakref
+from pathlib import Path
 from typing import List, Dict, Any
 import json
+import httpx
 from dotenv import load_dotenv
 
+from services.metrics import record_openai_call
+from services.request_scheduler import (
+    OPENAI_RATE_LIMITS, Priority, RequestScheduler, estimate_tokens, parse_rate_limits,
+)
+
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI()
+
+# Shared connection pool for every OpenAI request made by this process
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 64))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 32))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 10))
+# HTTP/2 multiplexes concurrent calls over one connection but needs the optional h2 package
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+# Per-endpoint in-flight request limits and read timeouts (seconds)
+ENDPOINT_CONCURRENCY = {
+    "transcription": int(os.getenv("OPENAI_TRANSCRIPTION_CONCURRENCY", 4)),
+    "chat": int(os.getenv("OPENAI_CHAT_CONCURRENCY", 8)),
+    "embedding": int(os.getenv("OPENAI_EMBEDDING_CONCURRENCY", 16)),
+    "image": int(os.getenv("OPENAI_IMAGE_CONCURRENCY", 4)),
+}
+ENDPOINT_TIMEOUTS = {
+    "transcription": float(os.getenv("OPENAI_TRANSCRIPTION_TIMEOUT", 600)),
+    "chat": float(os.getenv("OPENAI_CHAT_TIMEOUT", 180)),
+    "embedding": float(os.getenv("OPENAI_EMBEDDING_TIMEOUT", 30)),
+    "image": float(os.getenv("OPENAI_IMAGE_TIMEOUT", 120)),
+}
+
+# Model used by each operation; changing one invalidates results cached for it
+TRANSCRIPTION_MODEL = os.getenv("TRANSCRIPTION_MODEL", "whisper-1")
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gpt-4-turbo-preview")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+IMAGE_MODEL = os.getenv("IMAGE_MODEL", "dall-e-3")
+TRANSLATION_MODEL = os.getenv("TRANSLATION_MODEL", "gpt-4-turbo-preview")
+# Fast model for the draft summary that feeds the visual while the full analysis runs
+DRAFT_MODEL = os.getenv("DRAFT_MODEL", "gpt-4o-mini")
+DRAFT_MAX_CHARS = int(os.getenv("DRAFT_MAX_CHARS", 48000))
+# Inputs per embeddings request when embedding many texts at once
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 256))
+
+
+class _LoopResources:
+    """Async client and request scheduler bound to a single event loop"""
+
+    def __init__(self):
+        self.client = None
+        self.scheduler = RequestScheduler(ENDPOINT_CONCURRENCY, parse_rate_limits(OPENAI_RATE_LIMITS))
+
+
+# httpx connections and asyncio futures cannot be shared across event loops,
+# so each running loop (uvicorn's, or a test's) gets its own set
+_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopResources]" = weakref.WeakKeyDictionary()
+
+
+def _loop_resources() -> _LoopResources:
+    loop = asyncio.get_running_loop()
+    resources = _resources.get(loop)
+    if resources is None:
+        resources = _resources[loop] = _LoopResources()
+    return resources
+
+
+def create_client() -> openai.AsyncOpenAI:
+    """Build an AsyncOpenAI client on a tuned, keep-alive httpx connection pool"""
+    http_client = httpx.AsyncClient(
+        http2=OPENAI_HTTP2,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(max(ENDPOINT_TIMEOUTS.values()), connect=OPENAI_CONNECT_TIMEOUT),
+    )
+    # Retries go through the scheduler, which spaces them out against the shared rate budget
+    return openai.AsyncOpenAI(api_key=openai.api_key, http_client=http_client, max_retries=0)
+
+
+def get_client() -> openai.AsyncOpenAI:
+    """Return the shared async client for the running event loop, creating it on first use"""
+    resources = _loop_resources()
+    if resources.client is None:
+        resources.client = create_client()
+    return resources.client
+
+
+def _prompt_tokens(messages: List[Dict[str, str]], functions: List[Dict[str, Any]] = ()) -> int:
+    """Estimated prompt size; the scheduler corrects its budget from the usage the response reports"""
+    return sum(estimate_tokens(message["content"]) for message in messages) + estimate_tokens(json.dumps(functions))
+
+
+async def _scheduled(endpoint: str, model: str, request, priority: Priority = Priority.BATCH, tokens: int = 0):
+    """Run an API request through the rate-limit-aware scheduler of the running event loop"""
+    started = time.perf_counter()
+    try:
+        response = await _loop_resources().scheduler.call(endpoint, model, request, priority, tokens)
+    except Exception as e:
+        record_openai_call(endpoint, model, time.perf_counter() - started, type(e).__name__)
+        raise
+    record_openai_call(endpoint, model, time.perf_counter() - started, "ok", getattr(response, "usage", None))
+    return response
 
 
 class OpenAIService:
+    @staticmethod
+    async def aclose():
+        """Close the connection pool of the running event loop"""
+        resources = _resources.pop(asyncio.get_running_loop(), None)
+        if resources is not None and resources.client is not None:
+            await resources.client.close()
+
+    @staticmethod
+    def scheduler_stats() -> Dict[str, Any]:
+        """Queue depth, wait time and rate-limit counters of the running event loop's scheduler"""
+        return _loop_resources().scheduler.stats()
+
     @staticmethod
     async def transcribe_audio(file_path: str) -> str:
         """Transcribe audio using Whisper API"""
-        with open(file_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text"
+        # A path lets the client read the file without blocking the event loop
+        transcript = await _scheduled(
+            "transcription", TRANSCRIPTION_MODEL,
+            lambda: get_client().audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL,
+                file=Path(file_path),
+                response_format="text",
+                timeout=ENDPOINT_TIMEOUTS["transcription"]
             )
+        )
         return transcript
 
+    @staticmethod
+    async def transcribe_audio_segments(file_path: str) -> List[Dict[str, Any]]:
+        """Transcribe audio using Whisper API, keeping segment timestamps"""
+        transcript = await _scheduled(
+            "transcription", TRANSCRIPTION_MODEL,
+            lambda: get_client().audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL,
+                file=Path(file_path),
+                response_format="verbose_json",
+                timeout=ENDPOINT_TIMEOUTS["transcription"]
+            )
+        )
+        return [
+            {"start": segment.start, "end": segment.end, "text": segment.text}
+            for segment in transcript.segments or []
+        ]
+
     @staticmethod
     async def analyze_meeting(transcription: str) -> Dict[str, Any]:
         """Analyze meeting using GPT-4 with function calling"""
@@ -65,20 +204,76 @@ class OpenAIService:
             }
         ]
 
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a meeting analyst. Extract key insights, action items, and decisions from meeting transcriptions."
-                },
-                {
-                    "role": "user",
-                    "content": f"Analyze this meeting transcription and extract insights:\n\n{transcription}"
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a meeting analyst. Extract key insights, action items, and decisions from meeting transcriptions."
+            },
+            {
+                "role": "user",
+                "content": f"Analyze this meeting transcription and extract insights:\n\n{transcription}"
+            }
+        ]
+        response = await _scheduled(
+            "chat", ANALYSIS_MODEL,
+            lambda: get_client().chat.completions.create(
+                model=ANALYSIS_MODEL,
+                messages=messages,
+                functions=functions,
+                function_call={"name": "extract_meeting_insights"},
+                timeout=ENDPOINT_TIMEOUTS["chat"]
+            ),
+            tokens=_prompt_tokens(messages, functions)
+        )
+
+        function_call = response.choices[0].message.function_call
+        return json.loads(function_call.arguments)
+
+    @staticmethod
+    async def draft_summary(transcription: str) -> Dict[str, Any]:
+        """Quick summary and key points from a fast model, used before the full analysis is ready"""
+        functions = [
+            {
+                "name": "draft_meeting_summary",
+                "description": "Draft a short summary and the main points of a meeting",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "summary": {
+                            "type": "string",
+                            "description": "Two or three sentence summary of the meeting"
+                        },
+                        "key_points": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Up to three key points, action items or decisions"
+                        }
+                    },
+                    "required": ["summary", "key_points"]
                 }
-            ],
-            functions=functions,
-            function_call={"name": "extract_meeting_insights"}
+            }
+        ]
+
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a meeting analyst. Briefly summarize meeting transcriptions."
+            },
+            {
+                "role": "user",
+                "content": f"Summarize this meeting transcription:\n\n{transcription[:DRAFT_MAX_CHARS]}"
+            }
+        ]
+        response = await _scheduled(
+            "chat", DRAFT_MODEL,
+            lambda: get_client().chat.completions.create(
+                model=DRAFT_MODEL,
+                messages=messages,
+                functions=functions,
+                function_call={"name": "draft_meeting_summary"},
+                timeout=ENDPOINT_TIMEOUTS["chat"]
+            ),
+            tokens=_prompt_tokens(messages, functions)
         )
 
         function_call = response.choices[0].message.function_call
@@ -87,26 +282,60 @@ class OpenAIService:
     @staticmethod
     async def generate_embedding(text: str) -> List[float]:
         """Generate text embedding using OpenAI Embeddings API"""
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
+        response = await _scheduled(
+            "embedding", EMBEDDING_MODEL,
+            lambda: get_client().embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=text,
+                timeout=ENDPOINT_TIMEOUTS["embedding"]
+            ),
+            Priority.INTERACTIVE, estimate_tokens(text)
         )
         return response.data[0].embedding
 
     @staticmethod
-    async def generate_visual_summary(meeting_summary: str, key_points: List[str]) -> str:
-        """Generate visual summary using DALL-E 3"""
+    async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+        """Embed many texts, sending up to EMBEDDING_BATCH_SIZE inputs per request.
+
+        Batches run concurrently within the embedding endpoint's concurrency limit;
+        results come back in input order.
+        """
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            response = await _scheduled(
+                "embedding", EMBEDDING_MODEL,
+                lambda: get_client().embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=batch,
+                    timeout=ENDPOINT_TIMEOUTS["embedding"]
+                ),
+                tokens=sum(estimate_tokens(text) for text in batch)
+            )
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+        batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    @staticmethod
+    async def generate_visual_summary(meeting_summary: str, key_points: List[str]) -> bytes:
+        """Generate visual summary using DALL-E 3 and return the image bytes"""
         prompt = f"Create a professional infographic-style visual summary of a meeting. The meeting summary: {meeting_summary}. Key points to highlight: {', '.join(key_points[:3])}. Use corporate colors, clean design, and visual metaphors for the concepts discussed."
 
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1,
+        response = await _scheduled(
+            "image", IMAGE_MODEL,
+            lambda: get_client().images.generate(
+                model=IMAGE_MODEL,
+                prompt=prompt,
+                size="1024x1024",
+                quality="standard",
+                n=1,
+                # The image comes back in the response, instead of behind a URL that expires
+                response_format="b64_json",
+                timeout=ENDPOINT_TIMEOUTS["image"]
+            )
         )
 
-        return response.data[0].url
+        return base64.b64decode(response.data[0].b64_json)
 
     @staticmethod
     async def translate_text(text: str, target_language: str) -> str:
@@ -121,18 +350,25 @@ class OpenAIService:
 
         target_lang_name = language_names.get(target_language, target_language)
 
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are a professional translator. Translate the following text to {target_lang_name}. Maintain the original meaning and tone."
-                },
-                {
-                    "role": "user",
-                    "content": text
-                }
-            ]
+        messages = [
+            {
+                "role": "system",
+                "content": f"You are a professional translator. Translate the following text to {target_lang_name}. Maintain the original meaning and tone."
+            },
+            {
+                "role": "user",
+                "content": text
+            }
+        ]
+        # A translation is about as long as its source
+        response = await _scheduled(
+            "chat", TRANSLATION_MODEL,
+            lambda: get_client().chat.completions.create(
+                model=TRANSLATION_MODEL,
+                messages=messages,
+                timeout=ENDPOINT_TIMEOUTS["chat"]
+            ),
+            Priority.TRANSLATION, 2 * _prompt_tokens(messages)
         )
 
         return response.choices[0].message.content
\ No newline at end of file
@@ -0,0 +1,177 @@
+import bisect
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import TranscriptPassage
+from services.embedding_index import EmbeddingIndex, default_index_path, normalize, to_vector
+
+PASSAGE_CHARS = int(os.getenv("PASSAGE_CHARS", 1000))
+PASSAGE_OVERLAP_CHARS = int(os.getenv("PASSAGE_OVERLAP_CHARS", 200))
+# Passages scored per requested meeting before aggregating, so top_k distinct meetings surface
+PASSAGE_CANDIDATES_PER_MEETING = 20
+PASSAGE_MIN_CANDIDATES = 200
+
+_SENTENCE_END = re.compile(r"[.!?]\s")
+
+
+@dataclass
+class PassageSpan:
+    position: int
+    start_char: int
+    end_char: int
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+
+
+def split_passages(text: str, size: int = PASSAGE_CHARS, overlap: int = PASSAGE_OVERLAP_CHARS,
+                   segments: Optional[List[Dict[str, Any]]] = None) -> List[PassageSpan]:
+    """Split a transcript into overlapping character windows.
+
+    Windows end at the last sentence break in their final third when there is
+    one, otherwise at a word boundary, and the next window starts ``overlap``
+    characters earlier (moved forward to a word start). When the transcript's
+    timed ``segments`` joined by spaces reproduce the text, each passage also
+    gets the recording time it covers.
+    """
+    overlap = min(overlap, size // 2)
+    spans = []
+    start = len(text) - len(text.lstrip())
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            window = text[start:end]
+            breaks = [match.end() - 1 for match in _SENTENCE_END.finditer(window, size * 2 // 3)]
+            if breaks:
+                end = start + breaks[-1]
+            else:
+                space = window.rfind(" ", size // 2)
+                if space > 0:
+                    end = start + space
+        passage_end = len(text[:end].rstrip())
+        spans.append(PassageSpan(len(spans), start, passage_end))
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space >= 0 and text[next_start - 1] != " " else next_start
+        while start < len(text) and text[start].isspace():
+            start += 1
+
+    if segments and " ".join(segment["text"] for segment in segments) == text:
+        starts, offset = [], 0
+        for segment in segments:
+            starts.append(offset)
+            offset += len(segment["text"]) + 1
+        for span in spans:
+            first = max(bisect.bisect_right(starts, span.start_char) - 1, 0)
+            last = max(bisect.bisect_right(starts, span.end_char - 1) - 1, 0)
+            span.start_time, span.end_time = segments[first]["start"], segments[last]["end"]
+    return spans
+
+
+class PassageIndex(EmbeddingIndex):
+    """Exact cosine index over transcript passages, aggregated to meetings at query time.
+
+    Keeps the owning meeting id of every row in a parallel array, so a query is
+    one matrix-vector product over all passages, an argpartition for the best
+    candidates, and a per-meeting max or sum computed with numpy.
+    """
+
+    backend = "passages"
+    source = TranscriptPassage
+
+    def reset(self):
+        with self._lock:
+            super().reset()
+            self._owners = np.empty(0, dtype=np.int64)
+
+    def add(self, passage_id: int, embedding, meeting_id: int = None):
+        """Insert or replace a passage vector owned by ``meeting_id``"""
+        vector = to_vector(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            self._add(passage_id, normalize(vector))
+            self._owners[self._positions[passage_id]] = meeting_id
+
+    def search_meetings(self, query_embedding, top_k: int = 5, aggregate: str = "max",
+                        passages_per_meeting: int = 3) -> List[Tuple[int, float, List[Tuple[int, float]]]]:
+        """Rank meetings by their best-matching passages.
+
+        Returns (meeting_id, score, [(passage_id, score), ...]) triples, best first.
+        ``aggregate`` is ``max`` (best passage) or ``sum`` (sum over the meeting's
+        candidate passages, favouring meetings that discuss the query repeatedly).
+        """
+        if aggregate not in ("max", "sum"):
+            raise ValueError(f"Unknown passage aggregate: {aggregate}")
+        candidates = max(top_k * PASSAGE_CANDIDATES_PER_MEETING, PASSAGE_MIN_CANDIDATES)
+        ranked = self.search(query_embedding, candidates)
+        if not ranked:
+            return []
+
+        passage_ids = np.fromiter((passage_id for passage_id, _ in ranked), dtype=np.int64, count=len(ranked))
+        scores = np.fromiter((score for _, score in ranked), dtype=np.float64, count=len(ranked))
+        with self._lock:
+            owners = self._owners[[self._positions[int(passage_id)] for passage_id in passage_ids]]
+
+        meetings, inverse = np.unique(owners, return_inverse=True)
+        if aggregate == "sum":
+            totals = np.bincount(inverse, weights=scores, minlength=len(meetings))
+        else:
+            totals = np.full(len(meetings), -np.inf)
+            np.maximum.at(totals, inverse, scores)
+        order = np.argsort(-totals, kind="stable")[:top_k]
+
+        results = []
+        for group in order:
+            # ranked is sorted best first, so the first members of a group are its best passages
+            members = np.flatnonzero(inverse == group)[:passages_per_meeting]
+            results.append((
+                int(meetings[group]), float(totals[group]),
+                [(int(passage_ids[i]), float(scores[i])) for i in members]
+            ))
+        return results
+
+    def _rows(self, db_session, after_id: int = 0):
+        return (
+            db_session.query(TranscriptPassage.id, TranscriptPassage.embedding, TranscriptPassage.meeting_id)
+            .filter(TranscriptPassage.embedding.isnot(None), TranscriptPassage.id > after_id)
+            .order_by(TranscriptPassage.id)
+        )
+
+    def _add_rows(self, rows):
+        for passage_id, embedding, meeting_id in rows:
+            vector = to_vector(embedding)
+            if vector is not None:
+                self._add(passage_id, normalize(vector))
+                self._owners[self._positions[passage_id]] = meeting_id
+
+    def _add(self, passage_id: int, vector: np.ndarray):
+        super()._add(passage_id, vector)
+        if self._owners.shape[0] < self._matrix.shape[0]:
+            owners = np.zeros(self._matrix.shape[0], dtype=np.int64)
+            owners[:self._owners.shape[0]] = self._owners
+            self._owners = owners
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        state = super()._state()
+        state["owners"] = self._owners[:self._size]
+        return state
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        super()._restore(arrays)
+        if self._matrix is not None:
+            self._owners = np.zeros(self._matrix.shape[0], dtype=np.int64)
+            self._owners[:self._size] = arrays["owners"]
+
+
+def default_passage_index_path() -> str:
+    return f"{os.path.splitext(default_index_path())[0]}.passages.npz"
+
+
+# Shared by the API process alongside the meeting-level index
+passage_index = PassageIndex()
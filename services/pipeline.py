@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import object_session
+
+from database import Meeting, SessionLocal, TranscriptPassage, run_sync
+from services import openai_service
+from services.openai_service import OpenAIService
+from services.request_scheduler import Priority, request_priority
+from services.embedding_index import embedding_index
+from services.transcription import transcribe_recording
+from services.result_cache import result_cache, STAGE_MODELS
+from services.embedding_cache import embedding_cache
+from services.passage_index import passage_index, split_passages
+from services.neighbors import update_neighbors
+from services.visual_store import visual_store, visual_url
+from services.metrics import PIPELINE_STAGE_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 2))
+PIPELINE_STAGE_ATTEMPTS = int(os.getenv("PIPELINE_STAGE_ATTEMPTS", 3))
+PIPELINE_RETRY_DELAY = float(os.getenv("PIPELINE_RETRY_DELAY", 2.0))
+
+# Each stage lists the stages it waits for; independent stages run concurrently
+STAGE_DEPENDENCIES = {
+    "transcription": (),
+    "analysis": ("transcription",),
+    "embedding": ("transcription",),
+    "draft": ("transcription",),
+    "visual": ("draft",),
+    "passages": ("transcription",),
+}
+STAGES = tuple(STAGE_DEPENDENCIES)
+# A failure in these stages still leaves a usable meeting
+OPTIONAL_STAGES = frozenset({"draft", "visual", "passages"})
+
+# Embedding input is capped to stay within the embedding model's context window
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", 24000))
+# Bump when embedding_text changes; `python -m services.reembed` then regenerates old vectors
+EMBEDDING_RECIPE_VERSION = 1
+
+PENDING = "pending"
+PROCESSING = "processing"
+RUNNING = "running"
+COMPLETED = "completed"
+PARTIAL = "partial"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def initial_stages() -> Dict[str, Dict[str, Any]]:
+    """Per-stage status record for a freshly uploaded meeting"""
+    return {name: {"status": PENDING, "attempts": 0, "duration_ms": None, "error": None} for name in STAGES}
+
+
+# Each stage is a handler that calls the API and returns a JSON-serializable result,
+# plus an applier that copies a result (fresh or from the cache) onto the meeting.
+
+async def transcribe(meeting: Meeting, job: Dict[str, Any]) -> Dict[str, Any]:
+    transcript = await transcribe_recording(job["file_path"])
+    segments = [segment.to_dict() for segment in transcript.segments] if transcript.segments is not None else None
+    return {"text": transcript.text, "segments": segments}
+
+
+def apply_transcription(meeting: Meeting, job: Dict[str, Any], result: Dict[str, Any]):
+    meeting.transcription = result["text"]
+    if result.get("segments") is not None:
+        meeting.transcript_segments = result["segments"]
+
+
+async def analyze(meeting: Meeting, job: Dict[str, Any]) -> Dict[str, Any]:
+    return await OpenAIService.analyze_meeting(meeting.transcription)
+
+
+def apply_analysis(meeting: Meeting, job: Dict[str, Any], analysis: Dict[str, Any]):
+    meeting.summary = analysis['summary']
+    meeting.action_items = analysis['action_items']
+    meeting.decisions = analysis['decisions']
+
+
+def embedding_version() -> str:
+    """Model and text recipe behind newly written embeddings, stored alongside every vector"""
+    return f"{openai_service.EMBEDDING_MODEL}:{EMBEDDING_RECIPE_VERSION}"
+
+
+def embedding_text(meeting: Meeting, job: Dict[str, Any]) -> str:
+    # Embeds the transcript itself, so it does not wait for the analysis
+    return f"{meeting.title}\n{meeting.transcription[:EMBEDDING_MAX_CHARS]}"
+
+
+async def embed(meeting: Meeting, job: Dict[str, Any]) -> Dict[str, Any]:
+    embedding = await embedding_cache.get_or_create(embedding_text(meeting, job), object_session(meeting))
+    return {"embedding": [float(value) for value in embedding]}
+
+
+def apply_embedding(meeting: Meeting, job: Dict[str, Any], result: Dict[str, Any]):
+    meeting.embedding = result["embedding"]
+    meeting.embedding_version = embedding_version()
+    meeting.neighbors_updated_at = None
+
+
+async def draft(meeting: Meeting, job: Dict[str, Any]) -> Dict[str, Any]:
+    return await OpenAIService.draft_summary(meeting.transcription)
+
+
+def apply_draft(meeting: Meeting, job: Dict[str, Any], result: Dict[str, Any]):
+    job["draft"] = result
+
+
+async def visualize(meeting: Meeting, job: Dict[str, Any]) -> Dict[str, Any]:
+    if "draft" in job:
+        summary, key_points = job["draft"]["summary"], job["draft"]["key_points"][:3]
+    else:
+        # Resumed after a restart: the draft is gone, fall back to the full analysis
+        summary = meeting.summary
+        key_points = [item['task'] for item in (meeting.action_items or [])[:3]]
+        if not key_points and meeting.decisions:
+            key_points = [dec['decision'] for dec in meeting.decisions[:3]]
+
+    if summary and key_points:
+        image = await OpenAIService.generate_visual_summary(summary, key_points)
+        digest = await asyncio.to_thread(visual_store.save, image)
+        return {"url": visual_url(digest)}
+    return {"url": None}
+
+
+def apply_visual(meeting: Meeting, job: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    if result["url"] is None:
+        return SKIPPED
+    meeting.visual_summary_url = result["url"]
+
+
+async def embed_passages(meeting: Meeting, job: Dict[str, Any]) -> Dict[str, Any]:
+    spans = split_passages(meeting.transcription or "", segments=meeting.transcript_segments)
+    texts = [meeting.transcription[span.start_char:span.end_char] for span in spans]
+    # Passage texts go through the embedding cache, so a re-uploaded recording costs no API calls
+    embeddings = await embedding_cache.get_or_create_many(texts, object_session(meeting))
+    return {"spans": spans, "embeddings": embeddings}
+
+
+def apply_passages(meeting: Meeting, job: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    db = object_session(meeting)
+    db.query(TranscriptPassage).filter(TranscriptPassage.meeting_id == meeting.id).delete()
+    version = embedding_version()
+    passages = [
+        TranscriptPassage(meeting_id=meeting.id, position=span.position, start_char=span.start_char,
+                          end_char=span.end_char, start_time=span.start_time, end_time=span.end_time,
+                          embedding=embedding, embedding_version=version)
+        for span, embedding in zip(result["spans"], result["embeddings"])
+    ]
+    db.add_all(passages)
+    db.flush()
+    job["passages"] = [(passage.id, passage.embedding) for passage in passages]
+    if not passages:
+        return SKIPPED
+
+
+StageHandler = Callable[[Meeting, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+StageApplier = Callable[[Meeting, Dict[str, Any], Dict[str, Any]], Optional[str]]
+
+STAGE_HANDLERS: Dict[str, Tuple[StageHandler, StageApplier]] = {
+    "transcription": (transcribe, apply_transcription),
+    "analysis": (analyze, apply_analysis),
+    "embedding": (embed, apply_embedding),
+    "draft": (draft, apply_draft),
+    "visual": (visualize, apply_visual),
+    "passages": (embed_passages, apply_passages),
+}
+
+# Inputs besides the audio that a stage's result depends on, folded into its cache key
+STAGE_CACHE_INPUTS: Dict[str, Callable[[Meeting, Dict[str, Any]], str]] = {
+    "embedding": embedding_text,
+}
+
+
+class MeetingPipeline:
+    """Background worker pool that processes uploaded meetings.
+
+    Stages form a dependency graph (``STAGE_DEPENDENCIES``) and independent
+    stages run concurrently, so a meeting takes roughly as long as its slowest
+    chain rather than the sum of every stage. Each stage is retried with
+    exponential backoff and its status, attempt count and duration are committed
+    to ``Meeting.stages`` as soon as it finishes, so clients can poll progress.
+    Completed stages are skipped when a meeting is resubmitted, which lets
+    interrupted jobs resume after a restart, and stage results are cached by
+    audio hash so re-uploading a recording does not call the API again.
+    """
+
+    def __init__(self, session_factory=SessionLocal, workers: int = PIPELINE_WORKERS,
+                 max_attempts: int = PIPELINE_STAGE_ATTEMPTS, retry_delay: float = PIPELINE_RETRY_DELAY):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Start the worker tasks on the current event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; unfinished meetings stay pending and are resumed on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, meeting_id: int, file_path: str):
+        """Queue a meeting for processing"""
+        if self._queue is None:
+            raise RuntimeError("Meeting pipeline is not running")
+        self._queue.put_nowait((meeting_id, file_path))
+
+    async def _worker(self):
+        while True:
+            meeting_id, file_path = await self._queue.get()
+            try:
+                await self.process(meeting_id, file_path)
+            except Exception:
+                logger.exception("Processing meeting %s failed", meeting_id)
+            finally:
+                self._queue.task_done()
+
+    async def process(self, meeting_id: int, file_path: str):
+        """Run every outstanding stage for a meeting, each as soon as its dependencies finish.
+
+        Progress is committed after every stage. A failed optional stage leaves the
+        meeting ``partial``; a failed required stage marks it ``failed`` but keeps
+        whatever the other stages produced.
+        """
+        db = self.session_factory()
+        # Database work runs in worker threads (see run_sync); between calls the
+        # stages read the meeting's attributes, which must not expire on commit
+        db.expire_on_commit = False
+        try:
+            meeting = await run_sync(db, self._start, meeting_id)
+            if meeting is None:
+                return
+
+            job = {"file_path": file_path, "audio_hash": meeting.audio_hash}
+            outcomes = {name: asyncio.get_running_loop().create_future() for name in STAGES}
+
+            async def run(name: str):
+                ok = False
+                try:
+                    dependencies = STAGE_DEPENDENCIES[name]
+                    blocked_by = [dep for dep in dependencies if not await outcomes[dep]]
+                    if meeting.stages[name]["status"] in (COMPLETED, SKIPPED):
+                        ok = True
+                    elif blocked_by:
+                        await self._set_stage(db, meeting, name, {
+                            **meeting.stages[name], "status": PENDING, "error": f"Blocked by {', '.join(blocked_by)}"
+                        })
+                    else:
+                        ok = await self._run_stage(db, meeting, name, job)
+                finally:
+                    outcomes[name].set_result(ok)
+
+            # Background work yields to interactive requests sharing the OpenAI rate budget
+            with request_priority(Priority.BATCH):
+                await asyncio.gather(*(run(name) for name in STAGES))
+
+            failed = [name for name in STAGES if not outcomes[name].result()]
+            await run_sync(db, self._finish, meeting, job, failed)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _start(db, meeting_id: int) -> Optional[Meeting]:
+        meeting = db.query(Meeting).filter(Meeting.id == meeting_id).first()
+        if meeting is not None:
+            meeting.status = PROCESSING
+            meeting.error = None
+            meeting.stages = {**initial_stages(), **(meeting.stages or {})}
+            db.commit()
+        return meeting
+
+    @staticmethod
+    def _finish(db, meeting: Meeting, job: Dict[str, Any], failed: List[str]):
+        """Store the meeting's final status and add its vectors to the in-memory indexes"""
+        required_failures = [name for name in failed if name not in OPTIONAL_STAGES]
+        if required_failures:
+            meeting.status = FAILED
+        else:
+            meeting.status = PARTIAL if failed else COMPLETED
+        meeting.error = "; ".join(
+            f"{name} failed: {meeting.stages[name]['error']}" for name in failed
+        ) or None
+        db.commit()
+        if meeting.embedding is not None:
+            embedding_index.add(meeting.id, meeting.embedding)
+            if meeting.neighbors_updated_at is None:
+                try:
+                    update_neighbors(db, meeting.id)
+                except Exception:
+                    # The list stays marked stale and is rebuilt on first request
+                    logger.exception("Updating similar meetings for %s failed", meeting.id)
+                    db.rollback()
+        for passage_id, embedding in job.get("passages", ()):
+            passage_index.add(passage_id, embedding, meeting.id)
+
+    async def _run_stage(self, db, meeting: Meeting, name: str, job: Dict[str, Any]) -> bool:
+        handler, apply = STAGE_HANDLERS[name]
+        record = dict(meeting.stages.get(name) or {})
+
+        # Reuse the result of an earlier upload of the same recording. Passage embeddings
+        # are too large for the result cache; they are reused through the embedding cache instead.
+        audio_hash = job.get("audio_hash") if name in STAGE_MODELS else None
+        stage_input = STAGE_CACHE_INPUTS[name](meeting, job) if name in STAGE_CACHE_INPUTS else ""
+        if audio_hash:
+            cached = await run_sync(db, result_cache.get, audio_hash, name, stage_input)
+            if cached is not None:
+                await run_sync(db, self._apply, meeting, name, apply, job, cached, record,
+                               {"duration_ms": 0.0, "error": None, "cached": True})
+                PIPELINE_STAGE_SECONDS.observe(0.0, stage=name, outcome="cached")
+                return True
+
+        for attempt in range(1, self.max_attempts + 1):
+            record.update(status=RUNNING, attempts=record.get("attempts", 0) + 1,
+                          started_at=datetime.utcnow().isoformat(), error=None)
+            await self._set_stage(db, meeting, name, record)
+
+            started = time.perf_counter()
+            try:
+                result = await handler(meeting, job)
+            except Exception as e:
+                PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - started, stage=name, outcome="failed")
+                record.update(status=FAILED, error=str(e),
+                              duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                await self._set_stage(db, meeting, name, record)
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                continue
+
+            elapsed = time.perf_counter() - started
+            PIPELINE_STAGE_SECONDS.observe(elapsed, stage=name, outcome="ok")
+            await run_sync(db, self._apply, meeting, name, apply, job, result, record,
+                           {"duration_ms": round(elapsed * 1000, 1)})
+            if audio_hash:
+                await run_sync(db, result_cache.put, audio_hash, name, result, stage_input)
+            return True
+        return False
+
+    @staticmethod
+    def _apply(db, meeting: Meeting, name: str, apply: StageApplier, job: Dict[str, Any],
+               result: Dict[str, Any], record: Dict[str, Any], fields: Dict[str, Any]):
+        """Copy a stage result onto the meeting and mark the stage done, in one commit"""
+        outcome = apply(meeting, job, result)
+        record.update(status=outcome or COMPLETED, **fields)
+        MeetingPipeline._store_stage(db, meeting, name, record)
+
+    @staticmethod
+    async def _set_stage(db, meeting: Meeting, name: str, record: Dict[str, Any]):
+        await run_sync(db, MeetingPipeline._store_stage, meeting, name, record)
+
+    @staticmethod
+    def _store_stage(db, meeting: Meeting, name: str, record: Dict[str, Any]):
+        # JSON columns only persist on reassignment, not in-place mutation
+        meeting.stages = {**meeting.stages, name: dict(record)}
+        with timed("db.commit"):
+            db.commit()
+
+
+# Shared worker pool, started and stopped with the API process
+pipeline = MeetingPipeline()
@@ -0,0 +1,101 @@
+"""Sampling profiler that can be switched on and off in a running server.
+
+A background thread snapshots every thread's Python stack at a fixed interval
+and counts identical stacks. The result is in the collapsed-stack format read
+by flamegraph.pl and speedscope: ``thread;outer (file.py);...;inner (file.py) count``.
+Nothing is sampled while it is off, so it costs nothing until needed.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+# The debug endpoints refuse to start the profiler unless this is set
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+# A forgotten profiler stops itself after this long
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 300))
+# Deepest stack recorded; deeper frames are cut at the root end
+PROFILER_MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    def __init__(self, enabled: bool = PROFILER_ENABLED, max_seconds: float = PROFILER_MAX_SECONDS):
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self.interval = PROFILER_INTERVAL_MS / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = PROFILER_INTERVAL_MS) -> bool:
+        """Clear earlier samples and start sampling; False if already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = max(interval_ms, 1.0) / 1000
+            self.stacks.clear()
+            self.samples = 0
+            self.started_at = time.monotonic()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks collected"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "seconds": round(time.monotonic() - self.started_at, 3) if self.started_at is not None else 0.0,
+        }
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self.stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                self.samples += 1
+            if time.monotonic() - self.started_at >= self.max_seconds:
+                break
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        functions = []
+        while frame is not None and len(functions) < PROFILER_MAX_DEPTH:
+            code = frame.f_code
+            functions.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        functions.append(thread_name.replace(";", ":"))
+        return ";".join(reversed(functions))
+
+
+# Shared by the debug endpoints of the API process
+profiler = SamplingProfiler()
@@ -0,0 +1,220 @@
+"""Regenerate stored embeddings after a change of embedding model or text recipe.
+
+Rows whose ``embedding_version`` differs from the current one are streamed in
+id order, embedded in batched requests, and their new vectors are staged in
+``reembed_staging``. Nothing visible changes until every row is staged; then one
+transaction swaps the vectors in, and the vector index files are rebuilt and
+replaced atomically. The staged rows are the checkpoint: an interrupted run
+resumes after the last row it staged.
+
+    python -m services.reembed [--source meetings|passages|all] [--force]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from sqlalchemy import delete, func, insert, or_, select, update
+
+from database import Meeting, ReembedStaging, SessionLocal, TranscriptPassage, pgvector_enabled, set_state
+from services.embedding_index import create_index, default_index_path, stamp_key
+from services.neighbors import rebuild_neighbors
+from services.openai_service import EMBEDDING_BATCH_SIZE, OpenAIService
+from services.passage_index import PassageIndex, default_passage_index_path
+from services.pipeline import EMBEDDING_MAX_CHARS, embedding_text, embedding_version
+from services.request_scheduler import on_rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Texts per embeddings request, and the most requests in flight at once
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", min(EMBEDDING_BATCH_SIZE, 128)))
+REEMBED_CONCURRENCY = int(os.getenv("REEMBED_CONCURRENCY", 4))
+
+
+class AdaptiveConcurrency:
+    """Additive-increase, multiplicative-decrease limit on concurrent embedding requests.
+
+    Every rate-limit response a request receives halves the limit; the request
+    scheduler does the waiting and retrying. Every ``limit`` successful
+    requests raise the limit by one, up to ``max_limit``.
+    """
+
+    def __init__(self, max_limit: int = REEMBED_CONCURRENCY):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.rate_limited = 0
+        self._successes = 0
+
+    async def embed(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        """Embeddings for ``texts`` in input order, ``batch_size`` texts per request"""
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        pending = list(range(len(batches)))
+        while pending:
+            window, pending = pending[:self.limit], pending[self.limit:]
+            outcomes = await asyncio.gather(*(self._request(batches[i]) for i in window))
+            for index, outcome in zip(window, outcomes):
+                results[index] = outcome
+        return [embedding for batch in results for embedding in batch]
+
+    async def _request(self, batch: List[str]) -> List[List[float]]:
+        with on_rate_limit(self._rate_limited):
+            embeddings = await OpenAIService.generate_embeddings(batch)
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+        return embeddings
+
+    def _rate_limited(self):
+        self.rate_limited += 1
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+
+
+@dataclass
+class Source:
+    """A table of embeddings and how to rebuild the text each vector was made from"""
+    name: str
+    model: type
+    text_columns: Callable[[], tuple]
+    text: Callable[[object], str]
+    joins: Callable[[object], object] = lambda query: query
+    conditions: tuple = ()
+
+
+SOURCES = {
+    "meetings": Source(
+        "meetings", Meeting,
+        lambda: (Meeting.title, func.substr(Meeting.transcription, 1, EMBEDDING_MAX_CHARS).label("transcription")),
+        lambda row: embedding_text(row, {}),
+        conditions=(Meeting.transcription.isnot(None),),
+    ),
+    "passages": Source(
+        "passages", TranscriptPassage,
+        lambda: (func.substr(Meeting.transcription, TranscriptPassage.start_char + 1,
+                             TranscriptPassage.end_char - TranscriptPassage.start_char).label("text"),),
+        lambda row: row.text or "",
+        joins=lambda query: query.join(Meeting, Meeting.id == TranscriptPassage.meeting_id),
+    ),
+}
+
+
+def checkpoint(db_session, source: Source, version: str) -> int:
+    """Id of the last row staged for this source and version, or 0 for a fresh run"""
+    return db_session.scalar(
+        select(func.max(ReembedStaging.row_id)).where(
+            ReembedStaging.source == source.name, ReembedStaging.version == version
+        )
+    ) or 0
+
+
+async def stage_embeddings(db_session, source: Source, version: str, force: bool = False,
+                           batch_size: int = REEMBED_BATCH_SIZE, controller: AdaptiveConcurrency = None) -> int:
+    """Embed every outdated row of ``source`` into the staging table; returns the number staged.
+
+    Rows are read one page at a time (a page is one request batch per allowed
+    concurrent request), and each page is committed, so memory is bounded by
+    the page size and a restart continues after the last committed page.
+    """
+    controller = controller or AdaptiveConcurrency()
+    table = source.model
+    conditions = list(source.conditions)
+    if not force:
+        conditions.append(or_(table.embedding_version.is_(None), table.embedding_version != version))
+
+    after_id, staged = checkpoint(db_session, source, version), 0
+    while True:
+        query = source.joins(select(table.id, *source.text_columns()))
+        rows = db_session.execute(
+            query.where(table.id > after_id, *conditions).order_by(table.id).limit(batch_size * controller.limit)
+        ).all()
+        if not rows:
+            return staged
+        embeddings = await controller.embed([source.text(row) for row in rows], batch_size)
+        db_session.execute(insert(ReembedStaging), [
+            {"source": source.name, "row_id": row.id, "version": version, "embedding": embedding}
+            for row, embedding in zip(rows, embeddings)
+        ])
+        db_session.commit()
+        staged += len(rows)
+        after_id = rows[-1].id
+        logger.info("Staged %s %s embeddings up to id %s", staged, source.name, after_id)
+
+
+def swap_embeddings(db_session, source: Source, version: str) -> int:
+    """Replace the live embeddings with the staged ones in a single transaction"""
+    table = source.model
+    staged = select(ReembedStaging.row_id).where(
+        ReembedStaging.source == source.name, ReembedStaging.version == version
+    )
+    values = {
+        table.embedding: select(ReembedStaging.embedding).where(
+            ReembedStaging.source == source.name, ReembedStaging.version == version,
+            ReembedStaging.row_id == table.id
+        ).scalar_subquery(),
+        table.embedding_version: version,
+    }
+    if table is Meeting:
+        values[Meeting.neighbors_updated_at] = None
+    swapped = db_session.execute(
+        update(table).where(table.id.in_(staged)).values(values).execution_options(synchronize_session=False)
+    ).rowcount
+    db_session.execute(delete(ReembedStaging).where(ReembedStaging.source == source.name))
+    if swapped:
+        # Vector indexes built before this stamp are rebuilt by their next sync
+        set_state(db_session, stamp_key(table), f"{version}:{uuid.uuid4().hex}")
+    db_session.commit()
+    return swapped
+
+
+def rebuild_index_file(db_session, source: Source) -> Optional[str]:
+    """Rebuild the persisted vector index for ``source`` and replace its file atomically"""
+    if pgvector_enabled(db_session.get_bind().dialect):
+        return None  # The database column is the index
+    if source.model is Meeting:
+        index, path = create_index(), default_index_path()
+    else:
+        index, path = PassageIndex(), default_passage_index_path()
+    index.build(db_session)
+    index.save(path)
+    return path
+
+
+async def reembed(db_session, sources: List[str] = ("meetings", "passages"), force: bool = False,
+                  batch_size: int = REEMBED_BATCH_SIZE, concurrency: int = REEMBED_CONCURRENCY) -> dict:
+    """Re-embed, swap in and re-index every source; returns per-source row counts"""
+    version = embedding_version()
+    controller = AdaptiveConcurrency(concurrency)
+    counts = {}
+    for name in sources:
+        source = SOURCES[name]
+        await stage_embeddings(db_session, source, version, force, batch_size, controller)
+        counts[name] = swap_embeddings(db_session, source, version)
+        if counts[name]:
+            rebuild_index_file(db_session, source)
+            if source.model is Meeting:
+                # Every list may change when vectors move, not only those of re-embedded meetings
+                rebuild_neighbors(db_session)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate stored embeddings with the current model and recipe")
+    parser.add_argument("--source", choices=["meetings", "passages", "all"], default="all")
+    parser.add_argument("--force", action="store_true", help="re-embed rows already at the current version")
+    parser.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE, help="texts per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=REEMBED_CONCURRENCY, help="most requests in flight")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    selected = list(SOURCES) if args.source == "all" else [args.source]
+    session = SessionLocal()
+    try:
+        results = asyncio.run(reembed(session, selected, args.force, args.batch_size, args.concurrency))
+        for name, count in results.items():
+            print(f"{name} re-embedded: {count}")
+    finally:
+        session.close()
@@ -0,0 +1,309 @@
+"""Rate-limit-aware scheduling for every OpenAI request.
+
+Each call waits for its model's budget (requests and tokens per minute, as
+token buckets), then for a free slot on its endpoint, and both waits are served
+in priority order: an interactive search embedding overtakes queued
+translation chunks, which overtake batch processing. A 429 response is
+retried after the server's ``Retry-After`` (which also holds back every other
+caller of that model) or after a jittered exponential backoff; timeouts,
+dropped connections and 5xx responses are retried with the same backoff.
+"""
+import asyncio
+import email.utils
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+# Attempts after a rate-limit or transient failure, and the backoff used when the server gives no Retry-After
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 6))
+OPENAI_BACKOFF_SECONDS = float(os.getenv("OPENAI_BACKOFF_SECONDS", 1.0))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", 60.0))
+# Per-model budgets, "model=requests_per_minute:tokens_per_minute,..."; unlisted models
+# (and a 0 for either figure) are limited only by the server's 429s
+OPENAI_RATE_LIMITS = os.getenv("OPENAI_RATE_LIMITS", "")
+# Rough size of a token for English-like text, used to estimate a request's token cost
+CHARS_PER_TOKEN = 4
+# Failures that say nothing about the request itself, worth another attempt
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # search query embeddings, someone is waiting on the result
+    TRANSLATION = 1
+    BATCH = 2  # meeting processing, visuals and re-embedding
+
+
+_priority_override: ContextVar[Optional[Priority]] = ContextVar("openai_request_priority", default=None)
+_rate_limit_listener: ContextVar[Optional[Callable[[], None]]] = ContextVar("openai_rate_limit_listener",
+                                                                             default=None)
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    """Run every OpenAI request made inside the block (and tasks it starts) at ``priority``"""
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+@contextmanager
+def on_rate_limit(listener: Callable[[], None]):
+    """Call ``listener`` on every 429 a request made inside the block receives, before it is retried"""
+    token = _rate_limit_listener.set(listener)
+    try:
+        yield
+    finally:
+        _rate_limit_listener.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """``{"model": (requests_per_minute, tokens_per_minute)}`` from an OPENAI_RATE_LIMITS string"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, budget = entry.partition("=")
+        requests, _, tokens = budget.partition(":")
+        limits[model.strip()] = (float(requests or 0), float(tokens or 0))
+    return limits
+
+
+def retry_after(error: openai.APIStatusError) -> Optional[float]:
+    """Seconds the server asked us to wait, from ``retry-after-ms`` or ``retry-after``"""
+    headers = error.response.headers if error.response is not None else {}
+    try:
+        return float(headers["retry-after-ms"]) / 1000
+    except (KeyError, TypeError, ValueError):
+        pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value) if value else None
+        return max(0.0, date.timestamp() - time.time()) if date is not None else None
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units continuously and holds at most one minute's worth; 0 disables it"""
+
+    def __init__(self, per_minute: float = 0, clock: Callable[[], float] = time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken"""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        # A request larger than the whole budget waits for a full bucket and overdraws it
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.capacity:
+            self._refill()
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        """Correct an estimate once the real cost is known; a negative amount is a debt"""
+        if self.capacity:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _PriorityLine:
+    """Callers waiting for a resource, served by priority and then in arrival order"""
+
+    def __init__(self):
+        self._waiting: List[list] = []
+        self._arrivals = itertools.count()
+
+    def depth(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for priority, _, _ in self._waiting:
+            counts[priority.name.lower()] = counts.get(priority.name.lower(), 0) + 1
+        return counts
+
+    async def wait(self, priority: Priority, ready: Callable[[], Optional[float]]):
+        """Return once this caller is first in line and ``ready()`` returns 0.
+
+        ``ready`` gives the seconds until the resource frees up, or None when
+        only a ``wake()`` can tell.
+        """
+        entry = [priority, next(self._arrivals), None]
+        heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                delay = ready() if self._waiting[0] is entry else None
+                if delay is not None and delay <= 0:
+                    return
+                entry[2] = asyncio.get_running_loop().create_future()
+                await asyncio.wait({entry[2]}, timeout=delay)
+        finally:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self.wake()
+
+    def wake(self):
+        """Let the first caller in line check the resource again"""
+        if self._waiting:
+            waker = self._waiting[0][2]
+            if waker is not None and not waker.done():
+                waker.set_result(None)
+
+
+class ModelBudget:
+    """Requests and tokens per minute for one model, plus any pause the server asked for"""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.clock = clock
+        self.paused_until = 0.0
+        self.line = _PriorityLine()
+
+    def delay(self, tokens: int) -> float:
+        return max(self.paused_until - self.clock(), self.requests.delay(1), self.tokens.delay(tokens), 0.0)
+
+    async def acquire(self, priority: Priority, tokens: int):
+        await self.line.wait(priority, lambda: self.delay(tokens))
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.line.wake()
+
+
+class EndpointGate:
+    """At most ``limit`` requests in flight to one endpoint, granted in priority order"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.line = _PriorityLine()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority):
+        await self.line.wait(priority, lambda: 0 if self.active < self.limit else None)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.line.wake()
+
+
+class RequestScheduler:
+    """Budgets, endpoint limits, priorities and retries for OpenAI requests on one event loop"""
+
+    def __init__(self, concurrency: Dict[str, int], rate_limits: Dict[str, Tuple[float, float]] = None,
+                 max_retries: int = OPENAI_MAX_RETRIES, backoff: float = OPENAI_BACKOFF_SECONDS,
+                 max_backoff: float = OPENAI_BACKOFF_MAX_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.gates = {endpoint: EndpointGate(limit) for endpoint, limit in concurrency.items()}
+        self.budgets = {model: ModelBudget(*limits, clock=clock) for model, limits in (rate_limits or {}).items()}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.counts = {"requests": 0, "rate_limited": 0, "transient_errors": 0, "retries": 0, "failures": 0}
+        self.waits = {priority: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0} for priority in Priority}
+
+    def budget(self, model: str) -> ModelBudget:
+        budget = self.budgets.get(model)
+        if budget is None:
+            budget = self.budgets[model] = ModelBudget(clock=self.clock)
+        return budget
+
+    async def call(self, endpoint: str, model: str, request: Callable[[], Awaitable[Any]],
+                   priority: Priority = Priority.BATCH, tokens: int = 0) -> Any:
+        """Run ``request`` when budget and a slot allow, retrying rate-limit responses and transient failures"""
+        override = _priority_override.get()
+        priority = priority if override is None else override
+        budget = self.budget(model)
+        for attempt in itertools.count():
+            queued_at = self.clock()
+            await budget.acquire(priority, tokens)
+            async with self.gates[endpoint].slot(priority):
+                self._record_wait(priority, self.clock() - queued_at)
+                self.counts["requests"] += 1
+                try:
+                    response = await request()
+                except openai.RateLimitError as e:
+                    self.counts["rate_limited"] += 1
+                    listener = _rate_limit_listener.get()
+                    if listener is not None:
+                        listener()
+                    # An exhausted quota will not recover by waiting
+                    if attempt >= self.max_retries or e.code == "insufficient_quota":
+                        self.counts["failures"] += 1
+                        raise
+                    server_delay = retry_after(e)
+                except TRANSIENT_ERRORS as e:
+                    self.counts["transient_errors"] += 1
+                    if attempt >= self.max_retries:
+                        self.counts["failures"] += 1
+                        raise
+                    # A 503 may still say when to come back; a dropped connection never does
+                    server_delay = retry_after(e) if isinstance(e, openai.APIStatusError) else None
+                else:
+                    actual = getattr(getattr(response, "usage", None), "total_tokens", None)
+                    if isinstance(actual, int):
+                        budget.tokens.give_back(tokens - actual)
+                    return response
+            if server_delay is not None:
+                budget.pause(server_delay)
+                delay = server_delay * random.uniform(1.0, 1.2)
+            else:
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+            self.counts["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def _record_wait(self, priority: Priority, seconds: float):
+        waits = self.waits[priority]
+        waits["count"] += 1
+        waits["total_seconds"] += seconds
+        waits["max_seconds"] = max(waits["max_seconds"], seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depths, in-flight requests, retry counters and wait times by priority"""
+        queued: Dict[str, Dict[str, int]] = {}
+        for name, line in [*((f"model:{model}", budget.line) for model, budget in self.budgets.items()),
+                           *((f"endpoint:{endpoint}", gate.line) for endpoint, gate in self.gates.items())]:
+            depth = line.depth()
+            if depth:
+                queued[name] = depth
+        return {
+            **self.counts,
+            "queued": queued,
+            "in_flight": {endpoint: gate.active for endpoint, gate in self.gates.items()},
+            "waits": {
+                priority.name.lower(): {
+                    **waits,
+                    "mean_seconds": waits["total_seconds"] / waits["count"] if waits["count"] else 0.0,
+                }
+                for priority, waits in self.waits.items()
+            },
+        }
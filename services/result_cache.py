@@ -0,0 +1,78 @@
+import hashlib
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from database import ProcessingCacheEntry
+from services.openai_service import (
+    TRANSCRIPTION_MODEL, ANALYSIS_MODEL, EMBEDDING_MODEL, DRAFT_MODEL, IMAGE_MODEL
+)
+
+# Models whose output a stage's result depends on, directly or through earlier stages
+STAGE_MODELS = {
+    "transcription": (TRANSCRIPTION_MODEL,),
+    "analysis": (TRANSCRIPTION_MODEL, ANALYSIS_MODEL),
+    "embedding": (TRANSCRIPTION_MODEL, EMBEDDING_MODEL),
+    "draft": (TRANSCRIPTION_MODEL, DRAFT_MODEL),
+    "visual": (TRANSCRIPTION_MODEL, DRAFT_MODEL, IMAGE_MODEL),
+}
+
+
+class ResultCache:
+    """Processing results keyed by audio content hash, stage, model versions and stage inputs.
+
+    A re-uploaded recording hits the cache for every stage and is processed
+    without any OpenAI calls. Hit and miss counts are kept per stage.
+    """
+
+    def __init__(self):
+        self.hits = Counter()
+        self.misses = Counter()
+
+    @staticmethod
+    def key(audio_hash: str, stage: str, stage_input: str = "") -> str:
+        models = "|".join(STAGE_MODELS.get(stage, ()))
+        return hashlib.sha256(f"{audio_hash}|{stage}|{models}|{stage_input}".encode("utf-8")).hexdigest()
+
+    def get(self, db_session, audio_hash: str, stage: str, stage_input: str = "") -> Optional[Dict[str, Any]]:
+        entry = db_session.query(ProcessingCacheEntry.result).filter(
+            ProcessingCacheEntry.cache_key == self.key(audio_hash, stage, stage_input)
+        ).first()
+        if entry is None:
+            self.misses[stage] += 1
+            return None
+        self.hits[stage] += 1
+        return entry.result
+
+    def put(self, db_session, audio_hash: str, stage: str, result: Dict[str, Any], stage_input: str = ""):
+        try:
+            # A savepoint keeps a concurrent duplicate insert from rolling back the caller's work
+            with db_session.begin_nested():
+                db_session.add(ProcessingCacheEntry(
+                    cache_key=self.key(audio_hash, stage, stage_input),
+                    audio_hash=audio_hash,
+                    stage=stage,
+                    result=result
+                ))
+        except IntegrityError:
+            pass
+        db_session.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        stages = sorted(set(self.hits) | set(self.misses))
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "stages": {stage: {"hits": self.hits[stage], "misses": self.misses[stage]} for stage in stages},
+        }
+
+    def reset_stats(self):
+        self.hits.clear()
+        self.misses.clear()
+
+
+# Shared by the processing pipeline
+result_cache = ResultCache()
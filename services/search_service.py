@@ -1,92 +1,276 @@
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Tuple, Dict, Any
-import json
-from database import Meeting
-from services.openai_service import OpenAIService
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple, Dict, Any
+
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.orm import load_only
+
+from database import Meeting, TranscriptPassage, ActionItemRecord, DecisionRecord, pgvector_enabled
+from services.embedding_index import embedding_index
+from services.embedding_cache import embedding_cache
+from services.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from services.metrics import timed
+from services.passage_index import passage_index
+from services.neighbors import NEIGHBOR_K, get_neighbors, refresh_meeting
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion constant and how deep each ranking is read for hybrid search
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+HYBRID_CANDIDATE_MULTIPLIER = 4
+HYBRID_MIN_CANDIDATES = 50
+
+# Cross-meeting insights list this many items per owner and meetings overall unless
+# the caller asks for more, up to INSIGHT_LIST_MAX; totals and counts are never capped
+INSIGHT_ITEMS_PER_OWNER = 50
+INSIGHT_MEETINGS_LIMIT = 100
+INSIGHT_LIST_MAX = 1000
+# Owner key of action items without an owner; filtering on it selects those items
+UNASSIGNED_OWNER = "Unassigned"
+
+# Meeting columns loaded for search and similarity results
+RESULT_COLUMNS = (Meeting.id, Meeting.title, Meeting.summary, Meeting.created_at)
 
 
 class SearchService:
     @staticmethod
-    async def search_meetings(query: str, db_session, top_k: int = 5) -> List[Tuple[Meeting, float]]:
-        """Search meetings using semantic similarity"""
-        # Generate embedding for search query
-        query_embedding = await OpenAIService.generate_embedding(query)
+    async def search_meetings(query: str, db_session, top_k: int = 5, nprobe: int = None,
+                              mode: str = "semantic") -> List[Tuple[Meeting, float]]:
+        """Search meetings by meaning (``semantic``), exact terms (``keyword``) or both (``hybrid``)"""
+        if mode == "keyword":
+            # Served entirely by the local full-text index, no API call
+            with timed("search.keyword"):
+                ranked = await db_session.run_sync(lambda session: KeywordIndex.search(query, session, top_k))
+            return await SearchService._load_ranked(ranked, db_session)
+        if mode == "hybrid":
+            return await SearchService._hybrid_search(query, db_session, top_k, nprobe)
+        return await SearchService._load_ranked(
+            await SearchService._semantic_ranking(query, db_session, top_k, nprobe), db_session
+        )
 
-        # Get all meetings from database
-        meetings = db_session.query(Meeting).all()
+    @staticmethod
+    async def _semantic_ranking(query: str, db_session, top_k: int, nprobe: int = None) -> List[Tuple[int, float]]:
+        if pgvector_enabled(db_session.get_bind().dialect):
+            with timed("search.embed"):
+                query_embedding = await embedding_cache.get_or_create(query, db_session)
+            with timed("search.scan"):
+                return await SearchService._pgvector_ranking(query_embedding, db_session, top_k)
 
-        if not meetings:
+        with timed("search.index_sync"):
+            await db_session.run_sync(embedding_index.sync)
+        if not len(embedding_index):
             return []
 
-        # Calculate similarities
-        similarities = []
-        for meeting in meetings:
-            if meeting.embedding:
-                meeting_embedding = json.loads(meeting.embedding)
-                similarity = cosine_similarity(
-                    [query_embedding],
-                    [meeting_embedding]
-                )[0][0]
-                similarities.append((meeting, similarity))
+        # Embed the query, reusing the cached vector for repeated queries
+        with timed("search.embed"):
+            query_embedding = await embedding_cache.get_or_create(query, db_session)
 
-        # Sort by similarity score
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # Score every meeting in one pass and keep the best top_k ids
+        with timed("search.scan"):
+            return embedding_index.search(query_embedding, top_k, nprobe=nprobe)
 
-        return similarities[:top_k]
+    @staticmethod
+    async def _pgvector_ranking(query_embedding, db_session, top_k: int) -> List[Tuple[int, float]]:
+        """Exact cosine ranking computed by PostgreSQL with the pgvector ``<=>`` operator"""
+        vector = "[" + ",".join(repr(float(value)) for value in query_embedding) + "]"
+        rows = (await db_session.execute(text(
+            "SELECT id, 1 - (embedding <=> CAST(:query AS vector)) AS score FROM meetings "
+            "WHERE embedding IS NOT NULL ORDER BY embedding <=> CAST(:query AS vector) LIMIT :limit"
+        ), {"query": vector, "limit": top_k})).all()
+        return [(row[0], float(row[1])) for row in rows]
 
     @staticmethod
-    async def find_similar_meetings(meeting_id: int, db_session, top_k: int = 3) -> List[Tuple[Meeting, float]]:
-        """Find meetings similar to a given meeting"""
-        # Get the target meeting
-        target_meeting = db_session.query(Meeting).filter(Meeting.id == meeting_id).first()
-        if not target_meeting or not target_meeting.embedding:
+    async def _hybrid_search(query: str, db_session, top_k: int, nprobe: int = None) -> List[Tuple[Meeting, float]]:
+        """Fuse keyword and semantic rankings with reciprocal rank fusion.
+
+        Each side contributes a deeper candidate list than ``top_k`` so meetings
+        ranked moderately by both can surface. If the embedding call fails the
+        keyword ranking is used on its own.
+        """
+        candidates = max(top_k * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MIN_CANDIDATES)
+        with timed("search.keyword"):
+            keyword = await db_session.run_sync(lambda session: KeywordIndex.search(query, session, candidates))
+        try:
+            semantic = await SearchService._semantic_ranking(query, db_session, candidates, nprobe)
+        except Exception:
+            logger.warning("Semantic ranking failed, falling back to keyword results", exc_info=True)
+            semantic = []
+        fused = reciprocal_rank_fusion([keyword, semantic], HYBRID_RRF_K)[:top_k]
+        return await SearchService._load_ranked(fused, db_session)
+
+    @staticmethod
+    async def search_passages(query: str, db_session, top_k: int = 5, aggregate: str = "max",
+                              passages_per_meeting: int = 3) -> List[Tuple[Meeting, float, List[Dict[str, Any]]]]:
+        """Rank meetings by their best-matching transcript passages.
+
+        Returns (meeting, score, passages) triples; each passage dict carries its
+        text, character offsets, recording times when known, and score.
+        """
+        with timed("search.index_sync"):
+            await db_session.run_sync(passage_index.sync)
+        if not len(passage_index):
+            return []
+
+        with timed("search.embed"):
+            query_embedding = await embedding_cache.get_or_create(query, db_session)
+        with timed("search.scan"):
+            ranked = passage_index.search_meetings(query_embedding, top_k, aggregate, passages_per_meeting)
+        if not ranked:
             return []
 
-        target_embedding = json.loads(target_meeting.embedding)
+        # Passage text is cut from the transcript in SQL, so whole transcripts are never loaded
+        passage_scores = {passage_id: score for _, _, hits in ranked for passage_id, score in hits}
+        passages = (await db_session.execute(
+            select(
+                TranscriptPassage.id, TranscriptPassage.start_char, TranscriptPassage.end_char,
+                TranscriptPassage.start_time, TranscriptPassage.end_time,
+                func.substr(Meeting.transcription, TranscriptPassage.start_char + 1,
+                            TranscriptPassage.end_char - TranscriptPassage.start_char).label("text")
+            ).join(Meeting, Meeting.id == TranscriptPassage.meeting_id)
+            .where(TranscriptPassage.id.in_(list(passage_scores)))
+        )).all()
+        by_id = {passage.id: passage for passage in passages}
 
-        # Get all other meetings
-        other_meetings = db_session.query(Meeting).filter(Meeting.id != meeting_id).all()
+        results = []
+        for meeting, score in await SearchService._load_ranked(
+                [(meeting_id, score) for meeting_id, score, _ in ranked], db_session):
+            hits = next(hits for meeting_id, _, hits in ranked if meeting_id == meeting.id)
+            matches = []
+            for passage_id, passage_score in hits:
+                passage = by_id.get(passage_id)
+                if passage is None:
+                    continue
+                matches.append({
+                    "text": passage.text or "",
+                    "start_char": passage.start_char,
+                    "end_char": passage.end_char,
+                    "start_time": passage.start_time,
+                    "end_time": passage.end_time,
+                    "score": passage_score,
+                })
+            results.append((meeting, score, matches))
+        return results
 
-        similarities = []
-        for meeting in other_meetings:
-            if meeting.embedding:
-                meeting_embedding = json.loads(meeting.embedding)
-                similarity = cosine_similarity(
-                    [target_embedding],
-                    [meeting_embedding]
-                )[0][0]
-                similarities.append((meeting, similarity))
+    @staticmethod
+    async def find_similar_meetings(meeting_id: int, db_session, top_k: int = 3) -> List[Tuple[Meeting, float]]:
+        """Find meetings similar to a given meeting.
 
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_k]
+        Served from the precomputed neighbour table; a stale or missing list is
+        recomputed from the in-memory index and stored for the next request.
+        """
+        marker = (await db_session.execute(
+            select(Meeting.neighbors_updated_at).where(Meeting.id == meeting_id)
+        )).first()
+        if marker is None:
+            return []
+        if top_k > NEIGHBOR_K:
+            await db_session.run_sync(embedding_index.sync)
+            target_embedding = embedding_index.get(meeting_id)
+            if target_embedding is None:
+                return []
+            ranked = embedding_index.search(target_embedding, top_k, exclude_ids=[meeting_id])
+        elif marker.neighbors_updated_at is not None:
+            ranked = await db_session.run_sync(get_neighbors, meeting_id, top_k)
+        else:
+            ranked = (await db_session.run_sync(refresh_meeting, meeting_id))[:top_k]
+        return await SearchService._load_ranked(ranked, db_session)
 
     @staticmethod
-    async def extract_cross_meeting_insights(meeting_ids: List[int], db_session) -> Dict[str, Any]:
-        """Extract insights across multiple meetings"""
-        meetings = db_session.query(Meeting).filter(Meeting.id.in_(meeting_ids)).all()
+    async def extract_cross_meeting_insights(meeting_ids: Optional[List[int]], db_session,
+                                             start_date: datetime = None, end_date: datetime = None,
+                                             owner: str = None,
+                                             items_per_owner: int = INSIGHT_ITEMS_PER_OWNER,
+                                             meetings_limit: int = INSIGHT_MEETINGS_LIMIT) -> Dict[str, Any]:
+        """Extract insights across meetings with SQL aggregation over the normalized item tables.
 
-        all_action_items = []
-        all_decisions = []
+        ``meeting_ids=None`` covers every meeting. Date bounds filter on creation time;
+        ``owner`` narrows to meetings with an action item for that owner and to their items
+        (``UNASSIGNED_OWNER`` selects items without an owner).
 
-        for meeting in meetings:
-            if meeting.action_items:
-                all_action_items.extend(meeting.action_items)
-            if meeting.decisions:
-                all_decisions.extend(meeting.decisions)
+        Totals and ``action_item_counts_by_owner`` cover every selected item, while
+        ``action_items_by_owner`` lists only the first ``items_per_owner`` items of each
+        owner and ``meetings`` the ``meetings_limit`` most recent meetings, so the
+        response does not grow with the size of the archive.
+        """
+        conditions = []
+        if meeting_ids is not None:
+            conditions.append(Meeting.id.in_(meeting_ids))
+        if start_date is not None:
+            conditions.append(Meeting.created_at >= start_date)
+        if end_date is not None:
+            conditions.append(Meeting.created_at <= end_date)
+        item_conditions = []
+        if owner == UNASSIGNED_OWNER:
+            # Grouped under the same key as items without an owner, so selected with them
+            item_conditions.append(or_(ActionItemRecord.owner.is_(None), ActionItemRecord.owner == owner))
+        elif owner is not None:
+            item_conditions.append(ActionItemRecord.owner == owner)
+        if item_conditions:
+            conditions.append(Meeting.id.in_(select(ActionItemRecord.meeting_id).where(*item_conditions)))
+        selected = select(Meeting.id).where(*conditions)
+        item_conditions.append(ActionItemRecord.meeting_id.in_(selected))
 
-        # Group action items by owner
+        # Totals, per-owner counts and the first items_per_owner items of every owner
+        # come from one statement, so they are read from one snapshot and always agree
+        owner_key = func.coalesce(ActionItemRecord.owner, UNASSIGNED_OWNER)
+        numbered = select(
+            owner_key.label("owner_key"), ActionItemRecord.task, ActionItemRecord.owner,
+            ActionItemRecord.deadline, ActionItemRecord.meeting_id,
+            func.row_number().over(
+                partition_by=owner_key, order_by=(ActionItemRecord.meeting_id, ActionItemRecord.position)
+            ).label("item_number"),
+            func.count().over(partition_by=owner_key).label("owner_count")
+        ).where(*item_conditions).subquery()
+        totals = select(
+            select(func.count(Meeting.id)).where(*conditions).scalar_subquery().label("total_meetings"),
+            select(func.count(DecisionRecord.id)).where(DecisionRecord.meeting_id.in_(selected))
+            .scalar_subquery().label("total_decisions")
+        ).subquery()
+        # The outer join keeps the totals row when there are no items
+        rows = (await db_session.execute(
+            select(totals, numbered)
+            .select_from(totals.outerjoin(numbered, numbered.c.item_number <= items_per_owner))
+            .order_by(numbered.c.owner_key, numbered.c.item_number)
+        )).all()
+
+        counts = {}
         action_items_by_owner = {}
-        for item in all_action_items:
-            owner = item.get('owner', 'Unassigned')
-            if owner not in action_items_by_owner:
-                action_items_by_owner[owner] = []
-            action_items_by_owner[owner].append(item)
+        for row in rows:
+            if row.owner_key is None:
+                continue
+            counts[row.owner_key] = row.owner_count
+            action_items_by_owner.setdefault(row.owner_key, []).append({
+                "task": row.task, "owner": row.owner, "deadline": row.deadline, "meeting_id": row.meeting_id
+            })
+
+        meetings = (await db_session.execute(
+            select(Meeting.id, Meeting.title, Meeting.created_at).where(*conditions)
+            .order_by(Meeting.created_at.desc(), Meeting.id.desc()).limit(meetings_limit)
+        )).all()
 
         return {
-            "total_meetings": len(meetings),
-            "total_action_items": len(all_action_items),
-            "total_decisions": len(all_decisions),
+            "total_meetings": rows[0].total_meetings,
+            "total_action_items": sum(counts.values()),
+            "total_decisions": rows[0].total_decisions,
             "action_items_by_owner": action_items_by_owner,
+            "action_item_counts_by_owner": counts,
             "meetings": [{"id": m.id, "title": m.title, "date": m.created_at} for m in meetings]
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    async def _load_ranked(ranked: List[Tuple[int, float]], db_session) -> List[Tuple[Meeting, float]]:
+        """Fetch the meetings for ranked (id, score) pairs, preserving rank order.
+
+        Only the columns a search result shows are loaded; touching any other
+        attribute raises instead of issuing a lazy query.
+        """
+        if not ranked:
+            return []
+        with timed("search.fetch"):
+            meetings = (await db_session.scalars(
+                select(Meeting).options(load_only(*RESULT_COLUMNS, raiseload=True))
+                .where(Meeting.id.in_([meeting_id for meeting_id, _ in ranked]))
+            )).all()
+        by_id = {meeting.id: meeting for meeting in meetings}
+        return [(by_id[meeting_id], score) for meeting_id, score in ranked if meeting_id in by_id]
\ No newline at end of file
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import re
+import tempfile
+import wave
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Protocol
+
+import numpy as np
+
+from services.openai_service import OpenAIService
+
+# Whisper rejects uploads above 25MB; chunks are sized to stay under this
+TRANSCRIPTION_MAX_CHUNK_BYTES = int(os.getenv("TRANSCRIPTION_MAX_CHUNK_BYTES", 24 * 1024 * 1024))
+TRANSCRIPTION_CHUNK_SECONDS = float(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", 600))
+TRANSCRIPTION_OVERLAP_SECONDS = float(os.getenv("TRANSCRIPTION_OVERLAP_SECONDS", 5))
+# How far back from a window's end to look for a quiet split point (0 disables)
+TRANSCRIPTION_SILENCE_SEARCH_SECONDS = float(os.getenv("TRANSCRIPTION_SILENCE_SEARCH_SECONDS", 15))
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", 4))
+
+SILENCE_FRAME_SECONDS = 0.03
+COPY_BLOCK_FRAMES = 64 * 1024
+
+
+@dataclass
+class Segment:
+    start: float
+    end: float
+    text: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"start": round(self.start, 3), "end": round(self.end, 3), "text": self.text}
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    start: float  # seconds from the start of the recording
+    end: float
+    path: str
+
+
+@dataclass
+class Transcript:
+    text: str
+    segments: Optional[List[Segment]] = field(default=None)
+
+
+class TranscriptionBackend(Protocol):
+    async def transcribe(self, file_path: str) -> List[Segment]:
+        """Transcribe one audio file into segments with timestamps relative to its start"""
+
+
+class OpenAITranscriptionBackend:
+    """Whisper API backend returning timestamped segments"""
+
+    async def transcribe(self, file_path: str) -> List[Segment]:
+        segments = await OpenAIService.transcribe_audio_segments(file_path)
+        return [Segment(s["start"], s["end"], s["text"]) for s in segments]
+
+
+def wav_duration(file_path: str) -> float:
+    with wave.open(file_path, "rb") as audio:
+        return audio.getnframes() / audio.getframerate()
+
+
+def _frame_rms(audio: wave.Wave_read, start_frame: int, frame_count: int) -> np.ndarray:
+    """RMS energy of consecutive short frames, read straight from the WAV file"""
+    audio.setpos(start_frame)
+    raw = audio.readframes(frame_count)
+    width = audio.getsampwidth()
+    if width == 1:
+        samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128
+    elif width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        samples = (packed[:, 0].astype(np.int32) | (packed[:, 1].astype(np.int32) << 8)
+                   | (packed[:, 2].astype(np.int8).astype(np.int32) << 16)).astype(np.float32)
+    else:
+        samples = np.frombuffer(raw, dtype={2: "<i2", 4: "<i4"}[width]).astype(np.float32)
+    samples = samples.reshape(-1, audio.getnchannels()).mean(axis=1)
+    window = max(1, int(audio.getframerate() * SILENCE_FRAME_SECONDS))
+    usable = samples[:len(samples) // window * window].reshape(-1, window)
+    return np.sqrt((usable ** 2).mean(axis=1)) if usable.size else np.empty(0)
+
+
+def _quietest_frame(audio: wave.Wave_read, target: int, search: int) -> int:
+    """Frame position of the quietest short frame in the ``search`` frames before ``target``"""
+    start = max(0, target - search)
+    rms = _frame_rms(audio, start, target - start)
+    if not rms.size:
+        return target
+    window = max(1, int(audio.getframerate() * SILENCE_FRAME_SECONDS))
+    # Prefer the latest of equally quiet frames to keep chunks long
+    quietest = len(rms) - 1 - int(np.argmin(rms[::-1]))
+    return start + quietest * window + window // 2
+
+
+def split_wav(file_path: str, out_dir: str, window_seconds: float = TRANSCRIPTION_CHUNK_SECONDS,
+              overlap_seconds: float = TRANSCRIPTION_OVERLAP_SECONDS,
+              silence_search_seconds: float = TRANSCRIPTION_SILENCE_SEARCH_SECONDS,
+              max_chunk_bytes: int = TRANSCRIPTION_MAX_CHUNK_BYTES) -> List[AudioChunk]:
+    """Split a WAV file into overlapping chunk files using only the standard library and numpy.
+
+    Each chunk ends at the quietest point within ``silence_search_seconds`` of its
+    nominal window end, and the next chunk starts ``overlap_seconds`` earlier so
+    words cut at the boundary appear in both. Audio is copied in bounded blocks.
+    """
+    chunks = []
+    with wave.open(file_path, "rb") as audio:
+        rate = audio.getframerate()
+        total = audio.getnframes()
+        bytes_per_frame = audio.getsampwidth() * audio.getnchannels()
+        window = min(int(window_seconds * rate), max_chunk_bytes // bytes_per_frame)
+        overlap = min(int(overlap_seconds * rate), window // 2)
+        search = min(int(silence_search_seconds * rate), window // 4)
+
+        start = 0
+        while start < total:
+            end = min(start + window, total)
+            if end < total and search > 0:
+                end = max(start + overlap + 1, _quietest_frame(audio, end, search))
+
+            path = os.path.join(out_dir, f"chunk_{len(chunks):04d}.wav")
+            with wave.open(path, "wb") as out:
+                out.setparams(audio.getparams())
+                audio.setpos(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = audio.readframes(min(COPY_BLOCK_FRAMES, remaining))
+                    out.writeframes(block)
+                    remaining -= COPY_BLOCK_FRAMES
+            chunks.append(AudioChunk(len(chunks), start / rate, end / rate, path))
+
+            if end >= total:
+                break
+            start = end - overlap
+    return chunks
+
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def _drop_repeated_prefix(previous: str, text: str, max_words: int = 20) -> str:
+    """Remove the leading words of ``text`` that repeat the trailing words of ``previous``"""
+    tail, head = _words(previous)[-max_words:], _words(text)[:max_words]
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if tail[-size:] == head[:size] and any(head[:size]):
+            return " ".join(text.split()[size:])
+    return text
+
+
+def stitch_segments(chunk_segments: List[List[Segment]], chunks: List[AudioChunk]) -> List[Segment]:
+    """Merge per-chunk segments into one absolute timeline.
+
+    Overlapping regions are split at their midpoint: a segment belongs to the
+    chunk whose side of the midpoint its own midpoint falls on. Words repeated
+    across the cut (when segment boundaries do not line up) are dropped.
+    """
+    stitched: List[Segment] = []
+    for i, (chunk, segments) in enumerate(zip(chunks, chunk_segments)):
+        lower = (chunks[i - 1].end + chunk.start) / 2 if i > 0 else float("-inf")
+        upper = (chunk.end + chunks[i + 1].start) / 2 if i + 1 < len(chunks) else float("inf")
+        first_in_chunk = True
+        for segment in segments:
+            start, end = segment.start + chunk.start, segment.end + chunk.start
+            if not lower <= (start + end) / 2 < upper:
+                continue
+            text = segment.text.strip()
+            if first_in_chunk and stitched:
+                text = _drop_repeated_prefix(stitched[-1].text, text)
+            first_in_chunk = False
+            if text:
+                stitched.append(Segment(start, end, text))
+    return stitched
+
+
+class ChunkedTranscriber:
+    """Transcribes long recordings as overlapping chunks in parallel and stitches the result"""
+
+    def __init__(self, backend: TranscriptionBackend = None, window_seconds: float = TRANSCRIPTION_CHUNK_SECONDS,
+                 overlap_seconds: float = TRANSCRIPTION_OVERLAP_SECONDS,
+                 silence_search_seconds: float = TRANSCRIPTION_SILENCE_SEARCH_SECONDS,
+                 max_concurrency: int = TRANSCRIPTION_CONCURRENCY):
+        self.backend = backend or OpenAITranscriptionBackend()
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.silence_search_seconds = silence_search_seconds
+        self.max_concurrency = max_concurrency
+
+    async def transcribe(self, file_path: str) -> Transcript:
+        with tempfile.TemporaryDirectory(prefix="chunks_") as out_dir:
+            chunks = await asyncio.to_thread(
+                split_wav, file_path, out_dir, self.window_seconds,
+                self.overlap_seconds, self.silence_search_seconds
+            )
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def transcribe_chunk(chunk: AudioChunk) -> List[Segment]:
+                async with semaphore:
+                    return await self.backend.transcribe(chunk.path)
+
+            chunk_segments = await asyncio.gather(*(transcribe_chunk(chunk) for chunk in chunks))
+
+        segments = stitch_segments(list(chunk_segments), chunks)
+        return Transcript(" ".join(segment.text for segment in segments), segments)
+
+
+def should_chunk(file_path: str) -> bool:
+    """Long or oversized WAV recordings are transcribed in chunks; other formats go whole"""
+    if os.path.splitext(file_path)[1].lower() != ".wav":
+        return False
+    try:
+        duration = wav_duration(file_path)
+    except (wave.Error, EOFError, OSError):
+        return False
+    return duration > TRANSCRIPTION_CHUNK_SECONDS or os.path.getsize(file_path) > TRANSCRIPTION_MAX_CHUNK_BYTES
+
+
+async def transcribe_recording(file_path: str) -> Transcript:
+    """Transcribe a recording, switching to chunked parallel transcription for long WAV files"""
+    if should_chunk(file_path):
+        return await ChunkedTranscriber().transcribe(file_path)
+    return Transcript(await OpenAIService.transcribe_audio(file_path))
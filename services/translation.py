@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import Meeting, Translation, TranslationChunk, TranslationSegment, next_meeting_version
+from services import openai_service
+from services.openai_service import OpenAIService
+from services.request_scheduler import CHARS_PER_TOKEN
+
+# Source text per translation request, in estimated tokens
+TRANSLATION_CHUNK_TOKENS = int(os.getenv("TRANSLATION_CHUNK_TOKENS", 1500))
+# Chunks of one translation in flight at once (also bounded by OPENAI_CHAT_CONCURRENCY)
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", 4))
+# Reuse translated chunks across meetings that contain the same text
+TRANSLATION_SEGMENT_CACHE = os.getenv("TRANSLATION_SEGMENT_CACHE", "false").lower() in ("1", "true", "yes")
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class TextChunk:
+    position: int
+    text: str
+    separator: str  # Whitespace that followed the chunk in the source, restored after translation
+
+    @property
+    def source_hash(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+def _split_keep(text: str, pattern: re.Pattern) -> Iterator[Tuple[str, str]]:
+    """(piece, separator) pairs such that joining them reproduces ``text``"""
+    position = 0
+    for match in pattern.finditer(text):
+        yield text[position:match.start()], match.group()
+        position = match.end()
+    yield text[position:], ""
+
+
+def _pieces(text: str, max_chars: int) -> Iterator[Tuple[str, str]]:
+    """Paragraphs, or the sentences (then words) of paragraphs too long for one chunk"""
+    for paragraph, paragraph_separator in _split_keep(text, _PARAGRAPH_BREAK):
+        if len(paragraph) <= max_chars:
+            yield paragraph, paragraph_separator
+            continue
+        sentences = list(_split_keep(paragraph, _SENTENCE_BREAK))
+        for index, (sentence, separator) in enumerate(sentences):
+            if index == len(sentences) - 1:
+                separator = paragraph_separator
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                if cut <= 0:
+                    yield sentence[:max_chars], ""
+                    sentence = sentence[max_chars:]
+                else:
+                    yield sentence[:cut], " "
+                    sentence = sentence[cut + 1:]
+            yield sentence, separator
+
+
+def split_translation_chunks(text: str, max_tokens: int = TRANSLATION_CHUNK_TOKENS) -> List[TextChunk]:
+    """Split text into chunks of at most ``max_tokens`` estimated tokens.
+
+    Chunks end on paragraph breaks where possible, then on sentence ends, and
+    only cut inside a sentence that is longer than a whole chunk. Joining every
+    chunk's text and separator reproduces the text (minus leading whitespace).
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    chunks, current, current_separator = [], "", ""
+    for piece, separator in _pieces(text, max_chars):
+        if not piece:
+            if current:
+                current_separator += separator
+            continue
+        if current and len(current) + len(current_separator) + len(piece) > max_chars:
+            chunks.append(TextChunk(len(chunks), current, current_separator))
+            current = ""
+        current = current + current_separator + piece if current else piece
+        current_separator = separator
+    if current:
+        chunks.append(TextChunk(len(chunks), current, current_separator))
+    return chunks
+
+
+class ChunkedTranslator:
+    """Translates long texts chunk by chunk, concurrently, resuming from stored chunks.
+
+    Every finished chunk is committed to ``translation_chunks`` straight away,
+    so a request that fails or is abandoned part-way leaves its progress behind
+    and the next request for the same meeting and language only translates the
+    missing chunks. Output is produced in source order as soon as each chunk
+    and all chunks before it are done.
+    """
+
+    def __init__(self, max_tokens: int = TRANSLATION_CHUNK_TOKENS, concurrency: int = TRANSLATION_CONCURRENCY,
+                 segment_cache: bool = TRANSLATION_SEGMENT_CACHE):
+        self.max_tokens = max_tokens
+        self.concurrency = concurrency
+        self.segment_cache = segment_cache
+
+    async def stream(self, db_session, meeting_id: int, text: str, target_language: str) -> AsyncIterator[str]:
+        """Yield the translation in order, one chunk (with its trailing whitespace) at a time"""
+        model = openai_service.TRANSLATION_MODEL
+        chunks = split_translation_chunks(text, self.max_tokens)
+        done = await self._stored_chunks(db_session, meeting_id, target_language, model, chunks)
+        if self.segment_cache:
+            done.update(await self._cached_segments(db_session, target_language, model,
+                                                    [chunk for chunk in chunks if chunk.position not in done]))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        session_lock = asyncio.Lock()
+
+        async def translate(chunk: TextChunk) -> str:
+            async with semaphore:
+                translated = await OpenAIService.translate_text(chunk.text, target_language)
+            async with session_lock:
+                await self._store_chunk(db_session, meeting_id, target_language, model, chunk, translated)
+                if self.segment_cache:
+                    await self._store_segment(db_session, target_language, model, chunk, translated)
+            return translated
+
+        tasks = {chunk.position: asyncio.create_task(translate(chunk))
+                 for chunk in chunks if chunk.position not in done}
+        try:
+            for chunk in chunks:
+                translated = done.get(chunk.position)
+                if translated is None:
+                    translated = await tasks[chunk.position]
+                yield translated + chunk.separator
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def translate(self, db_session, meeting_id: int, text: str, target_language: str) -> str:
+        return "".join([part async for part in self.stream(db_session, meeting_id, text, target_language)])
+
+    @staticmethod
+    async def _stored_chunks(db_session, meeting_id: int, target_language: str, model: str,
+                             chunks: List[TextChunk]) -> Dict[int, str]:
+        rows = (await db_session.execute(
+            select(TranslationChunk.position, TranslationChunk.source_hash, TranslationChunk.translated_text).where(
+                TranslationChunk.meeting_id == meeting_id,
+                TranslationChunk.target_language == target_language,
+                TranslationChunk.model == model,
+            )
+        )).all()
+        hashes = {chunk.position: chunk.source_hash for chunk in chunks}
+        return {row.position: row.translated_text for row in rows if hashes.get(row.position) == row.source_hash}
+
+    @staticmethod
+    async def _cached_segments(db_session, target_language: str, model: str,
+                               chunks: List[TextChunk]) -> Dict[int, str]:
+        if not chunks:
+            return {}
+        positions = {}
+        for chunk in chunks:
+            positions.setdefault(chunk.source_hash, []).append(chunk.position)
+        rows = (await db_session.execute(
+            select(TranslationSegment.source_hash, TranslationSegment.translated_text).where(
+                TranslationSegment.target_language == target_language,
+                TranslationSegment.model == model,
+                TranslationSegment.source_hash.in_(list(positions)),
+            )
+        )).all()
+        return {position: row.translated_text for row in rows for position in positions[row.source_hash]}
+
+    @staticmethod
+    async def _store_segment(db_session, target_language: str, model: str, chunk: TextChunk, translated: str):
+        db_session.add(TranslationSegment(target_language=target_language, model=model,
+                                          source_hash=chunk.source_hash, translated_text=translated))
+        try:
+            await db_session.commit()
+        except IntegrityError:
+            await db_session.rollback()
+
+    @staticmethod
+    async def _store_chunk(db_session, meeting_id: int, target_language: str, model: str,
+                           chunk: TextChunk, translated: str):
+        # A chunk left from an older transcript at the same position is replaced
+        await db_session.execute(delete(TranslationChunk).where(
+            TranslationChunk.meeting_id == meeting_id,
+            TranslationChunk.target_language == target_language,
+            TranslationChunk.model == model,
+            TranslationChunk.position == chunk.position,
+        ))
+        db_session.add(TranslationChunk(meeting_id=meeting_id, target_language=target_language, model=model,
+                                        position=chunk.position, source_hash=chunk.source_hash,
+                                        translated_text=translated))
+        try:
+            await db_session.commit()
+        except IntegrityError:
+            # Stored concurrently by another request for the same translation
+            await db_session.rollback()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the work; callers arriving while it is in
+    flight await the same result (or exception). A caller that is cancelled
+    does not cancel the work for the others.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    def _key(self, key: Hashable) -> Tuple[int, Hashable]:
+        # Futures belong to one event loop; tests run several loops in one process
+        return id(asyncio.get_running_loop()), key
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Future]:
+        return self._flights.get(self._key(key))
+
+    def start(self, key: Hashable, work: Callable[[], Awaitable]) -> asyncio.Future:
+        """Start ``work`` as a task unless ``key`` is already in flight; returns the flight either way"""
+        flight = self.in_flight(key)
+        if flight is None:
+            flight = asyncio.ensure_future(work())
+            self._track(self._key(key), flight)
+        return flight
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable]):
+        return await asyncio.shield(self.start(key, work))
+
+    def _track(self, key: Tuple[int, Hashable], flight: asyncio.Future):
+        self._flights[key] = flight
+        flight.add_done_callback(lambda _: self._flights.get(key) is flight and self._flights.pop(key))
+        # Followers see the exception; make sure an unawaited one is not reported as never retrieved
+        flight.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+
+def translation_key(meeting_id: int, target_language: str) -> Tuple[int, str, str]:
+    return meeting_id, target_language, openai_service.TRANSLATION_MODEL
+
+
+async def stored_translation(db_session, meeting_id: int, target_language: str) -> Optional[Translation]:
+    return await db_session.scalar(select(Translation).where(
+        Translation.meeting_id == meeting_id,
+        Translation.target_language == target_language,
+        Translation.model == openai_service.TRANSLATION_MODEL,
+    ).limit(1))
+
+
+async def save_translation(db_session, meeting_id: int, target_language: str, translated_text: str) -> Translation:
+    """Store a finished translation and drop the chunks it was assembled from.
+
+    If another process stored the same translation first, the unique index
+    rejects this one and the stored row is returned instead.
+    """
+    model = openai_service.TRANSLATION_MODEL
+    translation = Translation(meeting_id=meeting_id, target_language=target_language, model=model,
+                              translated_text=translated_text)
+    db_session.add(translation)
+    await db_session.execute(delete(TranslationChunk).where(
+        TranslationChunk.meeting_id == meeting_id,
+        TranslationChunk.target_language == target_language,
+        TranslationChunk.model == model,
+    ))
+    # Cached copies of the meeting's translations are now stale
+    await db_session.execute(update(Meeting).where(Meeting.id == meeting_id).values(
+        version=next_meeting_version()
+    ).execution_options(synchronize_session=False))
+    try:
+        await db_session.commit()
+    except IntegrityError:
+        await db_session.rollback()
+        return await stored_translation(db_session, meeting_id, target_language)
+    return translation
+
+
+async def get_or_translate(session_factory, meeting_id: int, transcription: str,
+                           target_language: str) -> Translation:
+    """The stored translation, or a new one; concurrent callers share a single translation.
+
+    The work runs in its own session, so it completes for the remaining
+    callers even if the request that started it goes away.
+    """
+    async def translate() -> Translation:
+        async with session_factory() as session:
+            existing = await stored_translation(session, meeting_id, target_language)
+            if existing is not None:
+                return existing
+            translated_text = await chunked_translator.translate(session, meeting_id, transcription, target_language)
+            return await save_translation(session, meeting_id, target_language, translated_text)
+
+    return await translation_flights.run(translation_key(meeting_id, target_language), translate)
+
+
+# Shared by the translation endpoints
+chunked_translator = ChunkedTranslator()
+translation_flights = SingleFlight()
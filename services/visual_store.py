@@ -0,0 +1,134 @@
+"""Content-addressed storage for visual summaries and their resized variants.
+
+Generated images live at ``<root>/<hash[:2]>/<sha256><ext>`` and are served
+from ``/api/visuals/<sha256>``. Smaller WebP variants are made on first
+request and kept beside the original as ``<sha256>.<size>.webp``. Since a URL
+names its content, the responses never change and can be cached forever.
+Resizing needs Pillow. Without it, variant URLs are not handed out, and any
+size requested is answered with the original image, which is not marked
+cacheable for good since it is not the bytes the URL names.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Defaults to a "visuals" directory beside the upload folder
+VISUAL_FOLDER = os.getenv("VISUAL_FOLDER") or os.path.join(
+    os.path.dirname(os.path.abspath(os.getenv("UPLOAD_FOLDER", "uploads"))), "visuals"
+)
+# Longest edge in pixels of each resized variant
+VISUAL_SIZES = {"thumb": 256, "medium": 512}
+VISUAL_WEBP_QUALITY = int(os.getenv("VISUAL_WEBP_QUALITY", 80))
+VISUAL_URL_PREFIX = "/api/visuals/"
+
+MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".webp": "image/webp"}
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UnsupportedImage(Exception):
+    """Raised when stored bytes are not a PNG, JPEG or WebP image"""
+
+
+def image_extension(data: bytes) -> Optional[str]:
+    """File extension for image bytes, from their signature"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def visual_url(digest: str, size: str = None) -> str:
+    return f"{VISUAL_URL_PREFIX}{digest}" + (f"?size={size}" if size else "")
+
+
+def variant_url(url: Optional[str], size: str) -> Optional[str]:
+    """The ``size`` variant of a stored visual's URL; None for remote URLs from before the store, or without Pillow"""
+    if not url or not url.startswith(VISUAL_URL_PREFIX) or Image is None:
+        return None
+    return visual_url(url[len(VISUAL_URL_PREFIX):].split("?", 1)[0], size)
+
+
+@dataclass
+class StoredVisual:
+    path: str
+    media_type: str
+    etag: str  # strong: derived from the content hash and the size served
+    size: str = "original"
+
+
+class VisualStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def _base(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def save(self, data: bytes) -> str:
+        """Store image bytes under their SHA-256 and return the hash; existing content is kept as is"""
+        extension = image_extension(data)
+        if extension is None:
+            raise UnsupportedImage("Visual summary is not a PNG, JPEG or WebP image")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._base(digest) + extension
+        if not os.path.exists(path):
+            self._write(path, lambda f: f.write(data))
+        return digest
+
+    def original(self, digest: str) -> Optional[StoredVisual]:
+        if not _DIGEST.match(digest):
+            return None
+        for extension, media_type in MEDIA_TYPES.items():
+            path = self._base(digest) + extension
+            if os.path.exists(path):
+                return StoredVisual(path, media_type, f'"{digest}"')
+        return None
+
+    def variant(self, digest: str, size: str) -> Optional[StoredVisual]:
+        """The image at ``size`` ("original" or a VISUAL_SIZES key), resizing it on first use.
+
+        Blocking file and image work; call it from a worker thread.
+        """
+        original = self.original(digest)
+        if original is None or size not in VISUAL_SIZES or Image is None:
+            return original
+        path = f"{self._base(digest)}.{size}.webp"
+        if not os.path.exists(path):
+            edge = VISUAL_SIZES[size]
+
+            def resize(f):
+                with Image.open(original.path) as image:
+                    image.thumbnail((edge, edge))
+                    image.save(f, "WEBP", quality=VISUAL_WEBP_QUALITY)
+
+            self._write(path, resize)
+        return StoredVisual(path, "image/webp", f'"{digest}-{size}"', size)
+
+    @staticmethod
+    def _write(path: str, write):
+        """Write through a temporary file, so concurrent writers and readers never see a partial file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+
+
+# Shared by the processing pipeline, which stores visuals, and the API, which serves them
+visual_store = VisualStore(VISUAL_FOLDER)
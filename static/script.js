@@ -1,6 +1,9 @@
 // Global variables
 let meetings = [];
+let nextMeetingsCursor = null;
 let currentMeeting = null;
+const STATUS_POLL_INTERVAL_MS = 2000;
+const MEETINGS_PAGE_SIZE = 50;
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
@@ -51,7 +54,7 @@ async function handleUpload(e) {
     formData.append('title', title);
     formData.append('audio_file', file);
 
-    showStatus('Uploading and processing meeting... This may take a few minutes.', 'loading');
+    showStatus('Uploading meeting...', 'loading');
 
     try {
         const response = await fetch('/api/meetings/upload', {
@@ -65,29 +68,64 @@ async function handleUpload(e) {
         }
 
         const meeting = await response.json();
-        showStatus('Meeting processed successfully!', 'success');
 
         // Reset form
         document.getElementById('uploadForm').reset();
 
-        // Reload meetings
+        // Show the pending meeting, then follow its processing
         loadMeetings();
+        await pollMeetingStatus(meeting.id);
 
     } catch (error) {
         showStatus(`Error: ${error.message}`, 'error');
     }
 }
 
+async function pollMeetingStatus(meetingId) {
+    while (true) {
+        const response = await fetch(`/api/meetings/${meetingId}/status`);
+        if (!response.ok) throw new Error('Could not fetch processing status');
+        const status = await response.json();
+
+        if (status.status === 'completed') {
+            showStatus('Meeting processed successfully!', 'success');
+            loadMeetings();
+            return;
+        }
+        if (status.status === 'partial') {
+            showStatus(`Meeting processed with some steps missing: ${status.error}`, 'success');
+            loadMeetings();
+            return;
+        }
+        if (status.status === 'failed') {
+            throw new Error(status.error || 'Processing failed');
+        }
+
+        const running = Object.entries(status.stages)
+            .filter(([, stage]) => stage.status === 'running')
+            .map(([name, stage]) => stage.attempts > 1 ? `${name}, attempt ${stage.attempts}` : name);
+        const stageText = running.length ? ` (${running.join(', ')})` : '';
+        showStatus(`Processing meeting${stageText}... This may take a few minutes.`, 'loading');
+
+        await new Promise(resolve => setTimeout(resolve, STATUS_POLL_INTERVAL_MS));
+    }
+}
+
 function showStatus(message, type) {
     const statusDiv = document.getElementById('uploadStatus');
     statusDiv.textContent = message;
     statusDiv.className = type;
 }
 
-async function loadMeetings() {
+// The list uses the slim summary endpoint; full details are fetched when a meeting is opened
+async function loadMeetings(append = false) {
     try {
-        const response = await fetch('/api/meetings');
-        meetings = await response.json();
+        const params = new URLSearchParams({ limit: MEETINGS_PAGE_SIZE });
+        if (append && nextMeetingsCursor) params.set('cursor', nextMeetingsCursor);
+        const response = await fetch(`/api/meetings?${params}`);
+        const page = await response.json();
+        nextMeetingsCursor = response.headers.get('X-Next-Cursor');
+        meetings = append ? meetings.concat(page) : page;
         displayMeetings(meetings);
     } catch (error) {
         console.error('Error loading meetings:', error);
@@ -104,15 +142,17 @@ function displayMeetings(meetingsList) {
 
     container.innerHTML = meetingsList.map(meeting => `
         <div class="meeting-card" onclick="showMeetingDetail(${meeting.id})">
+            ${meeting.visual_thumbnail_url ? `<img class="meeting-thumbnail" src="${meeting.visual_thumbnail_url}" alt="" loading="lazy">` : ''}
             <h3>${meeting.title}</h3>
             <div class="meeting-date">${formatDate(meeting.created_at)}</div>
-            ${meeting.summary ? `<div class="meeting-summary">${meeting.summary.substring(0, 200)}...</div>` : ''}
+            ${meeting.status && !['completed', 'partial'].includes(meeting.status) ? `<div class="meeting-status">${meeting.status}</div>` : ''}
+            ${meeting.summary_excerpt ? `<div class="meeting-summary">${meeting.summary_excerpt}</div>` : ''}
             <div class="meeting-stats">
-                ${meeting.action_items ? `<span class="stat"><strong>${meeting.action_items.length}</strong> Action Items</span>` : ''}
-                ${meeting.decisions ? `<span class="stat"><strong>${meeting.decisions.length}</strong> Decisions</span>` : ''}
+                ${meeting.action_item_count != null ? `<span class="stat"><strong>${meeting.action_item_count}</strong> Action Items</span>` : ''}
+                ${meeting.decision_count != null ? `<span class="stat"><strong>${meeting.decision_count}</strong> Decisions</span>` : ''}
             </div>
         </div>
-    `).join('');
+    `).join('') + (nextMeetingsCursor ? '<button class="load-more" onclick="loadMeetings(true)">Load more</button>' : '');
 }
 
 async function showMeetingDetail(meetingId) {
@@ -234,7 +274,7 @@ async function translateMeeting() {
     transcriptionDiv.innerHTML = '<div class="spinner"></div>';
 
     try {
-        const response = await fetch('/api/meetings/translate', {
+        const response = await fetch('/api/meetings/translate/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -247,15 +287,25 @@ async function translateMeeting() {
 
         if (!response.ok) throw new Error('Translation failed');
 
-        const translation = await response.json();
         transcriptionDiv.innerHTML = `
             <h4>Translated Text (${targetLanguage.toUpperCase()})</h4>
-            <p>${translation.translated_text}</p>
+            <p id="translatedText"></p>
             <hr>
             <h4>Original Transcription</h4>
             <p>${currentMeeting.transcription}</p>
         `;
 
+        // Show each translated chunk as soon as it arrives
+        const translatedText = document.getElementById('translatedText');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            translatedText.textContent += decoder.decode(value, { stream: true });
+        }
+        translatedText.textContent += decoder.decode();
+
     } catch (error) {
         transcriptionDiv.innerHTML = `<p>Error translating: ${error.message}</p>`;
     }
@@ -288,6 +338,7 @@ async function loadSimilarMeetings(meetingId) {
 
 async function searchMeetings() {
     const query = document.getElementById('searchQuery').value;
+    const mode = document.getElementById('searchMode').value;
     if (!query) return;
 
     const resultsDiv = document.getElementById('searchResults');
@@ -301,7 +352,10 @@ async function searchMeetings() {
             },
             body: JSON.stringify({
                 query: query,
-                top_k: 5
+                top_k: 5,
+                // Passage search ranks transcript chunks semantically and returns the matching text
+                mode: mode === 'passage' ? 'semantic' : mode,
+                granularity: mode === 'passage' ? 'passage' : 'meeting'
             })
         });
 
@@ -315,8 +369,8 @@ async function searchMeetings() {
         resultsDiv.innerHTML = '<h3>Search Results</h3>' + results.map(result => `
             <div class="meeting-card" onclick="showMeetingDetail(${result.meeting_id})">
                 <h4>${result.title}</h4>
-                <div class="similarity-score">Relevance: ${(result.similarity_score * 100).toFixed(1)}%</div>
-                <p>${result.excerpt}</p>
+                <div class="similarity-score">${formatRelevance(result.similarity_score, mode)}</div>
+                <p>${result.passages.length && result.passages[0].start_time != null ? `[${formatTimestamp(result.passages[0].start_time)}] ` : ''}${result.excerpt}</p>
             </div>
         `).join('');
 
@@ -325,6 +379,16 @@ async function searchMeetings() {
     }
 }
 
+// Only semantic scores are cosine similarities; keyword (BM25) and hybrid (fused rank) scores are unbounded
+function formatRelevance(score, mode) {
+    return mode === 'semantic' || mode === 'passage' ? `Relevance: ${(score * 100).toFixed(1)}%` : `Score: ${score.toFixed(3)}`;
+}
+
+function formatTimestamp(seconds) {
+    const minutes = Math.floor(seconds / 60);
+    return `${minutes}:${String(Math.floor(seconds % 60)).padStart(2, '0')}`;
+}
+
 function closeModal() {
     document.getElementById('meetingModal').style.display = 'none';
 }
@@ -9,21 +9,38 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from unittest.mock import patch, Mock, MagicMock, AsyncMock, mock_open
 import asyncio
+from datetime import datetime, timedelta
 
 # Import your application
-from main import app, get_db
-from database import Base, Meeting, Translation
+from main import app, get_db, audio_store
+from database import (Base, async_database_url, create_db_engine, create_async_db_engine, engine_options, init_db,
+                      Meeting, ReembedStaging, Translation, ActionItemRecord, DecisionRecord,
+                      encode_embedding, decode_embedding)
+from migrations import backfill_meeting_items, migrate_embeddings_to_binary
 from services.openai_service import OpenAIService
 from services.search_service import SearchService
+from services.embedding_index import EmbeddingIndex, embedding_index
+from services.ivf_index import IVFIndex
+from services.passage_index import passage_index, split_passages
+from services.pipeline import pipeline
+from services.visual_store import visual_store
+from services.result_cache import result_cache
+from services.embedding_cache import embedding_cache
+from services.transcription import ChunkedTranscriber, Segment, AudioChunk, stitch_segments
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Tests run each request on its own event loop, so async connections are not pooled across them
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base.metadata.create_all(bind=engine)
 
@@ -36,7 +53,27 @@ def override_get_db():
         db.close()
 
 
-app.dependency_overrides[get_db] = override_get_db
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+def run_with_async_db(call):
+    """Run ``call(session)`` on a new event loop with an async test session"""
+    async def run():
+        async with TestingAsyncSessionLocal() as session:
+            return await call(session)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+app.dependency_overrides[get_db] = override_get_async_db
+pipeline.session_factory = TestingSessionLocal
+pipeline.retry_delay = 0
 
 client = TestClient(app)
 
@@ -45,12 +82,22 @@ class TestMeetingIntelligencePlatform:
     """Comprehensive test suite for the Meeting Intelligence Platform"""
 
     def setup_method(self):
-        """Setup test database before each test"""
+        """Setup test database and upload folder before each test"""
         Base.metadata.create_all(bind=engine)
+        self.upload_dir = tempfile.TemporaryDirectory()
+        audio_store.root = self.upload_dir.name
+        self.visual_dir = tempfile.TemporaryDirectory()
+        visual_store.root = self.visual_dir.name
 
     def teardown_method(self):
         """Clean up test database after each test"""
         Base.metadata.drop_all(bind=engine)
+        embedding_index.reset()
+        passage_index.reset()
+        result_cache.reset_stats()
+        embedding_cache.reset()
+        self.upload_dir.cleanup()
+        self.visual_dir.cleanup()
 
     # API Endpoint Tests
     def test_home_page(self):
@@ -64,19 +111,70 @@ class TestMeetingIntelligencePlatform:
         assert response.status_code == 200
         assert response.json() == []
 
+    def test_get_meetings_slim_keyset_pages(self):
+        """Test that the meeting list pages by cursor and never loads transcripts or embeddings"""
+        from sqlalchemy import event
+        db = TestingSessionLocal()
+        base = datetime(2024, 1, 1)
+        for i in range(5):
+            db.add(Meeting(title=f"Meeting {i}", transcription="long transcript " * 100, summary="S" * 300,
+                           action_items=[{"task": "t", "owner": None, "deadline": None}] * i,
+                           embedding=[1.0, 0.0], created_at=base + timedelta(days=i // 2)))
+        db.commit()
+        db.close()
+
+        statements = []
+        capture = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            first = client.get("/api/meetings?limit=3")
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+        select = next(s for s in statements if s.lstrip().upper().startswith("SELECT"))
+        assert "transcription" not in select and "embedding" not in select
+
+        page = first.json()
+        assert [m["title"] for m in page] == ["Meeting 4", "Meeting 3", "Meeting 2"]
+        assert page[0]["action_item_count"] == 4
+        assert page[0]["summary_excerpt"] == "S" * 200 + "..."
+        assert "transcription" not in page[0]
+
+        second = client.get(f"/api/meetings?limit=3&cursor={first.headers['x-next-cursor']}")
+        assert [m["title"] for m in second.json()] == ["Meeting 1", "Meeting 0"]
+        assert "x-next-cursor" not in second.headers
+
+    def test_get_meetings_fields_selector(self):
+        """Test that fields= limits the listing to the requested fields"""
+        db = TestingSessionLocal()
+        db.add(Meeting(title="Standup", summary="Short", status="completed"))
+        db.commit()
+        db.close()
+
+        response = client.get("/api/meetings?fields=title,status")
+        assert response.status_code == 200
+        assert set(response.json()[0]) == {"id", "title", "status"}
+
+        assert client.get("/api/meetings?fields=transcription").status_code == 400
+        assert client.get("/api/meetings?cursor=not-a-cursor").status_code == 400
+
     def test_get_meeting_not_found(self):
         """Test getting non-existent meeting"""
         response = client.get("/api/meetings/999")
         assert response.status_code == 404
         assert "not found" in response.json()["detail"].lower()
 
-    @patch('aiofiles.open')
+    @patch.object(OpenAIService, 'generate_embeddings', new_callable=AsyncMock)
+    @patch.object(pipeline, 'submit')
     @patch.object(OpenAIService, 'transcribe_audio', new_callable=AsyncMock)
     @patch.object(OpenAIService, 'analyze_meeting', new_callable=AsyncMock)
     @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'draft_summary', new_callable=AsyncMock)
     @patch.object(OpenAIService, 'generate_visual_summary', new_callable=AsyncMock)
-    def test_upload_meeting_success(self, mock_visual, mock_embed, mock_analyze, mock_transcribe, mock_aio):
-        """Test successful meeting upload"""
+    def test_upload_meeting_success(self, mock_visual, mock_draft, mock_embed, mock_analyze, mock_transcribe,
+                                    mock_submit, mock_embeds):
+        """Test successful meeting upload and background processing"""
+        from benchmarks.fake_openai import fake_png
+
         # Setup return values for async mocks
         mock_transcribe.return_value = "This is a test meeting transcription"
         mock_analyze.return_value = {
@@ -85,14 +183,12 @@ class TestMeetingIntelligencePlatform:
             "decisions": [{"decision": "Test decision", "context": "Test context"}]
         }
         mock_embed.return_value = [0.1] * 1536
-        mock_visual.return_value = "https://example.com/image.png"
-
-        mock_file = AsyncMock()
-        mock_aio.return_value.__aenter__.return_value = mock_file
-        mock_aio.return_value.__aexit__.return_value = None
+        mock_embeds.side_effect = lambda texts: [[0.1] * 1536 for _ in texts]
+        mock_draft.return_value = {"summary": "Draft summary", "key_points": ["Test task"]}
+        mock_visual.return_value = fake_png(b"visual")
 
-        # Create test file content
-        test_content = b"fake audio content"
+        # Create test file content with an ID3 header
+        test_content = b"ID3fake audio content"
 
         response = client.post(
             "/api/meetings/upload",
@@ -100,12 +196,35 @@ class TestMeetingIntelligencePlatform:
             files={"audio_file": ("test.mp3", test_content, "audio/mpeg")}
         )
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert data["title"] == "Test Meeting"
+        assert data["status"] == "pending"
+        assert set(data["stages"]) == {"transcription", "analysis", "embedding", "draft", "visual", "passages"}
+        mock_submit.assert_called_once()
+        meeting_id, file_path = mock_submit.call_args[0]
+        assert meeting_id == data["id"]
+
+        # Run the queued job the way a worker would
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(pipeline.process(meeting_id, file_path))
+        loop.close()
+
+        status = client.get(f"/api/meetings/{meeting_id}/status").json()
+        assert status["status"] == "completed"
+        assert all(stage["status"] == "completed" for stage in status["stages"].values())
+        assert all(stage["duration_ms"] is not None for stage in status["stages"].values())
+
+        data = client.get(f"/api/meetings/{meeting_id}").json()
         assert data["transcription"] == "This is a test meeting transcription"
         assert data["summary"] == "Test meeting summary"
         assert len(data["action_items"]) == 1
+
+        # The generated image is served locally, and the list links its thumbnail
+        assert data["visual_summary_url"].startswith("/api/visuals/")
+        assert client.get(data["visual_summary_url"]).content == fake_png(b"visual")
+        listed = client.get("/api/meetings").json()[0]
+        assert listed["visual_thumbnail_url"] == data["visual_summary_url"] + "?size=thumb"
         assert len(data["decisions"]) == 1
 
     def test_upload_meeting_invalid_file_type(self):
@@ -135,6 +254,106 @@ class TestMeetingIntelligencePlatform:
         assert response.status_code == 413
         assert "too large" in response.json()["detail"].lower()
 
+    def test_upload_meeting_content_mismatch(self):
+        """Test upload whose bytes do not match the claimed audio format"""
+        response = client.post(
+            "/api/meetings/upload",
+            data={"title": "Test Meeting"},
+            files={"audio_file": ("test.wav", b"<html>not audio</html>", "audio/wav")}
+        )
+
+        assert response.status_code == 400
+        assert "invalid file type" in response.json()["detail"].lower()
+
+    @patch.object(pipeline, 'submit')
+    def test_upload_streams_to_disk(self, mock_submit):
+        """Test that uploads are written in chunks with a content hash"""
+        import hashlib
+        content = b"RIFF\x00\x00\x00\x00WAVE" + os.urandom(3 * 1024 * 1024)
+
+        with patch('services.audio_store.UPLOAD_CHUNK_SIZE', 256 * 1024):
+            response = client.post(
+                "/api/meetings/upload",
+                data={"title": "Streamed Meeting"},
+                files={"audio_file": ("streamed.wav", content, "audio/wav")}
+            )
+            assert response.status_code == 202
+            file_path = mock_submit.call_args[0][1]
+            with open(file_path, "rb") as f:
+                assert f.read() == content
+
+        db = next(override_get_db())
+        meeting = db.query(Meeting).filter(Meeting.id == response.json()["id"]).first()
+        assert meeting.audio_hash == hashlib.sha256(content).hexdigest()
+
+    @patch.object(pipeline, 'submit')
+    def test_upload_shorter_than_signature_check(self, mock_submit):
+        """Test that a valid file shorter than the signature check window is still stored"""
+        for content in (b"ID3abc", b"ID3abcdefgh"):
+            response = client.post(
+                "/api/meetings/upload",
+                data={"title": "Tiny Meeting"},
+                files={"audio_file": ("tiny.mp3", content, "audio/mpeg")}
+            )
+            assert response.status_code == 202
+            with open(mock_submit.call_args[0][1], "rb") as f:
+                assert f.read() == content
+
+    @patch.object(pipeline, 'submit')
+    def test_upload_rejected_while_streaming(self, mock_submit):
+        """Test that bad uploads are rejected before the rest of the body is read"""
+        import httpx
+        boundary = "upload-boundary"
+        chunk = 64 * 1024
+
+        def body(filename, head, total):
+            read = {"chunks": 0}
+
+            async def stream():
+                yield (f'--{boundary}\r\nContent-Disposition: form-data; name="title"\r\n\r\nStreamed\r\n'
+                       f'--{boundary}\r\nContent-Disposition: form-data; name="audio_file"; '
+                       f'filename="{filename}"\r\nContent-Type: audio/wav\r\n\r\n').encode() + head
+                for _ in range(total // chunk):
+                    read["chunks"] += 1
+                    yield b"\x00" * chunk
+                yield f"\r\n--{boundary}--\r\n".encode()
+            return stream(), read
+
+        async def post(stream):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+                return await http.post("/api/meetings/upload", content=stream,
+                                       headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+        # Content that is not audio is refused on its first bytes
+        stream, read = body("fake.wav", b"<html>not audio</html>", 4 * 1024 * 1024)
+        response = asyncio.run(post(stream))
+        assert response.status_code == 400
+        assert read["chunks"] <= 1
+
+        # Without a Content-Length, the size limit stops the upload as it crosses it
+        with patch.dict(os.environ, {"MAX_FILE_SIZE_MB": "1"}):
+            stream, read = body("big.wav", b"RIFF\x00\x00\x00\x00WAVE", 4 * 1024 * 1024)
+            response = asyncio.run(post(stream))
+        assert response.status_code == 413
+        assert read["chunks"] <= 1024 * 1024 // chunk + 1
+
+        # A missing field is reported like any other validation error
+        response = client.post("/api/meetings/upload", data={"title": "No file"}, files={"other": ("a.txt", b"x")})
+        assert response.status_code == 400
+        response = client.post("/api/meetings/upload", files={"title": (None, "No file")})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["body", "audio_file"]
+
+        mock_submit.assert_not_called()
+        incoming = os.path.join(audio_store.root, ".incoming")
+        assert not os.path.isdir(incoming) or os.listdir(incoming) == []
+
+    def test_search_rejects_invalid_top_k(self):
+        """Test that search requires a positive top_k"""
+        for top_k in (0, -1, None):
+            response = client.post("/api/meetings/search", json={"query": "budget", "top_k": top_k})
+            assert response.status_code == 422
+
     def test_search_meetings_no_results(self):
         """Test search with no results"""
         response = client.post(
@@ -214,6 +433,194 @@ class TestMeetingIntelligencePlatform:
         assert data["translated_text"] == "Texte traduit en français"
         assert data["target_language"] == "fr"
 
+    def test_split_translation_chunks(self):
+        """Test that translation chunks respect the token budget and paragraph and sentence breaks"""
+        from services.request_scheduler import estimate_tokens
+        from services.translation import split_translation_chunks
+        text = "First paragraph here.\n\nSecond one. It has two sentences.\n\n" + "word " * 60 + "end."
+        chunks = split_translation_chunks(text, max_tokens=10)
+
+        assert "".join(chunk.text + chunk.separator for chunk in chunks) == text
+        assert all(estimate_tokens(chunk.text) <= 10 for chunk in chunks)
+        assert chunks[0].text == "First paragraph here."
+        assert chunks[1].text == "Second one. It has two sentences."
+        # A paragraph longer than the budget is cut between words
+        assert all(chunk.text.split(" ")[0] == "word" for chunk in chunks[2:-1])
+        assert [chunk.position for chunk in chunks] == list(range(len(chunks)))
+        assert len(split_translation_chunks(text, max_tokens=1000)) == 1
+
+    @patch.object(OpenAIService, 'translate_text', new_callable=AsyncMock)
+    def test_chunked_translation_resumes(self, mock_translate):
+        """Test that a failed translation keeps finished chunks and a retry only translates the rest"""
+        from database import TranslationChunk
+        from services.translation import chunked_translator
+        calls = []
+
+        async def translate(text, language):
+            calls.append(text)
+            if text.startswith("Fourth") and len(calls) <= 4:
+                raise RuntimeError("upstream timeout")
+            return text.upper()
+
+        mock_translate.side_effect = translate
+        db = next(override_get_db())
+        meeting = Meeting(title="Long", transcription="First part.\n\nSecond part.\n\nThird part.\n\nFourth part.")
+        db.add(meeting)
+        db.commit()
+
+        with patch.object(chunked_translator, "max_tokens", 4):
+            with pytest.raises(RuntimeError):
+                client.post("/api/meetings/translate", json={"meeting_id": meeting.id, "target_language": "fr"})
+            assert db.query(TranslationChunk).count() == 3
+
+            response = client.post("/api/meetings/translate", json={"meeting_id": meeting.id, "target_language": "fr"})
+        assert response.json()["translated_text"] == "FIRST PART.\n\nSECOND PART.\n\nTHIRD PART.\n\nFOURTH PART."
+        assert calls[4:] == ["Fourth part."]
+        assert db.query(TranslationChunk).count() == 0
+
+    @patch.object(OpenAIService, 'translate_text', new_callable=AsyncMock)
+    def test_stream_translation(self, mock_translate):
+        """Test that the streaming endpoint returns the translation incrementally and stores it"""
+        from services.translation import chunked_translator
+
+        async def translate(text, language):
+            return text.upper()
+
+        mock_translate.side_effect = translate
+        db = next(override_get_db())
+        meeting = Meeting(title="Stream", transcription="One sentence. Another sentence. A third sentence.")
+        db.add(meeting)
+        db.commit()
+
+        with patch.object(chunked_translator, "max_tokens", 5):
+            with client.stream("POST", "/api/meetings/translate/stream",
+                               json={"meeting_id": meeting.id, "target_language": "de"}) as response:
+                parts = list(response.iter_text())
+        assert "".join(parts) == "ONE SENTENCE. ANOTHER SENTENCE. A THIRD SENTENCE."
+        assert mock_translate.await_count == 3
+
+        stored = client.get(f"/api/meetings/{meeting.id}/translations").json()
+        assert stored[0]["translated_text"] == "".join(parts)
+        # A stored translation is streamed back without calling the API again
+        response = client.post("/api/meetings/translate/stream", json={"meeting_id": meeting.id, "target_language": "de"})
+        assert response.text == "".join(parts)
+        assert mock_translate.await_count == 3
+
+    @patch.object(OpenAIService, 'translate_text', new_callable=AsyncMock)
+    def test_concurrent_translations_coalesce(self, mock_translate):
+        """Test that concurrent requests for one translation share a single API call and row"""
+        from services.translation import get_or_translate
+
+        async def translate(text, language):
+            await asyncio.sleep(0.05)
+            return "Bonjour"
+
+        mock_translate.side_effect = translate
+        db = next(override_get_db())
+        meeting = Meeting(title="Coalesce", transcription="Hello")
+        db.add(meeting)
+        db.commit()
+
+        async def both():
+            return await asyncio.gather(*(
+                get_or_translate(TestingAsyncSessionLocal, meeting.id, "Hello", "fr") for _ in range(3)
+            ))
+
+        loop = asyncio.new_event_loop()
+        results = loop.run_until_complete(both())
+        loop.close()
+
+        assert mock_translate.await_count == 1
+        assert {translation.id for translation in results} == {results[0].id}
+        assert db.query(Translation).count() == 1
+        assert db.query(Translation.model).scalar() == "gpt-4-turbo-preview"
+
+    @patch.object(OpenAIService, 'translate_text', new_callable=AsyncMock)
+    def test_stream_translation_survives_lead_disconnect(self, mock_translate):
+        """Test that a streamed translation completes for waiting requests after its client goes away"""
+        from main import stream_translation
+        from models import TranslationRequest
+        from services.translation import chunked_translator, get_or_translate
+
+        async def translate(text, language):
+            await asyncio.sleep(0.02)
+            return text.upper()
+
+        mock_translate.side_effect = translate
+        db = next(override_get_db())
+        meeting = Meeting(title="Disconnect", transcription="One sentence. Another sentence. A third sentence.")
+        db.add(meeting)
+        db.commit()
+        request = TranslationRequest(meeting_id=meeting.id, target_language="it")
+
+        async def run(session):
+            response = await stream_translation(request, session)
+            # Registered before the body is read, so a second request joins instead of translating again
+            follower = asyncio.ensure_future(get_or_translate(TestingAsyncSessionLocal, meeting.id,
+                                                              meeting.transcription, "it"))
+            chunks = response.body_iterator
+            first = await chunks.__anext__()
+            await chunks.aclose()  # The client disconnects after the first chunk
+            return first, await follower
+
+        with patch.object(chunked_translator, "max_tokens", 5):
+            first, translation = run_with_async_db(run)
+        assert first == "ONE SENTENCE. "
+        assert translation.translated_text == "ONE SENTENCE. ANOTHER SENTENCE. A THIRD SENTENCE."
+        assert mock_translate.await_count == 3
+        assert db.query(Translation).count() == 1
+
+    def test_translation_unique_per_model(self):
+        """Test the unique index on translations and the legacy duplicate clean-up"""
+        from sqlalchemy.exc import IntegrityError
+        from migrations import dedupe_translations
+        from services.translation import save_translation
+        db = next(override_get_db())
+        db.add(Translation(meeting_id=1, target_language="fr", model="m", translated_text="Un"))
+        db.commit()
+        db.add(Translation(meeting_id=1, target_language="fr", model="m", translated_text="Deux"))
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+
+        # Losing an insert race returns the row that won
+        with patch("services.openai_service.TRANSLATION_MODEL", "m"):
+            stored = run_with_async_db(lambda session: save_translation(session, 1, "fr", "Trois"))
+        assert stored.translated_text == "Un"
+
+        with engine.begin() as connection:
+            for text_value in ("Legacy", "Legacy again"):
+                connection.execute(text("INSERT INTO translations (meeting_id, target_language, translated_text) "
+                                        "VALUES (2, 'de', :value)"), {"value": text_value})
+        assert dedupe_translations(engine) == 1
+        assert db.query(Translation.translated_text, Translation.model).filter(Translation.meeting_id == 2).all() == \
+            [("Legacy", "gpt-4-turbo-preview")]
+
+    @patch.object(OpenAIService, 'translate_text', new_callable=AsyncMock)
+    def test_translation_segment_cache(self, mock_translate):
+        """Test that chunks shared between meetings are translated once with the segment cache"""
+        from services.translation import chunked_translator
+
+        async def translate(text, language):
+            return text.upper()
+
+        mock_translate.side_effect = translate
+        db = next(override_get_db())
+        boilerplate = "This meeting is recorded for internal use only."
+        first = Meeting(title="A", transcription=f"{boilerplate}\n\nBudget review.")
+        second = Meeting(title="B", transcription=f"{boilerplate}\n\nHiring plan.")
+        db.add_all([first, second])
+        db.commit()
+
+        with patch.object(chunked_translator, "max_tokens", 12), \
+                patch.object(chunked_translator, "segment_cache", True):
+            for meeting in (first, second):
+                client.post("/api/meetings/translate", json={"meeting_id": meeting.id, "target_language": "fr"})
+        translated = [call.args[0] for call in mock_translate.await_args_list]
+        assert translated == [boilerplate, "Budget review.", "Hiring plan."]
+        assert client.get(f"/api/meetings/{second.id}/translations").json()[0]["translated_text"] == \
+            f"{boilerplate.upper()}\n\nHIRING PLAN."
+
     def test_translate_meeting_no_transcription(self):
         """Test translation when meeting has no transcription"""
         # Create meeting without transcription
@@ -283,6 +690,106 @@ class TestMeetingIntelligencePlatform:
         assert insights["total_decisions"] == 2
         assert "John" in insights["action_items_by_owner"]
 
+    def test_cross_meeting_insights_filters(self):
+        """Test insights over every meeting filtered by date and owner, without reading transcripts"""
+        db = next(override_get_db())
+        old = Meeting(
+            title="Old", created_at=datetime(2024, 1, 1), transcription="x" * 1000,
+            action_items=[{"task": "Archive", "owner": "Ann"}], decisions=[{"decision": "Keep"}]
+        )
+        recent = Meeting(
+            title="Recent", created_at=datetime(2024, 6, 1), transcription="y" * 1000,
+            action_items=[{"task": "Ship", "owner": "Ann"}, {"task": "Review"}],
+            decisions=[{"decision": "Launch"}]
+        )
+        other = Meeting(
+            title="Other", created_at=datetime(2024, 6, 2),
+            action_items=[{"task": "Hire", "owner": "Bob"}], decisions=[]
+        )
+        db.add_all([old, recent, other])
+        db.commit()
+
+        assert client.post("/api/insights/cross-meeting").status_code == 400
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            response = client.post("/api/insights/cross-meeting?all_meetings=true")
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+        insights = response.json()
+        assert insights["total_meetings"] == 3
+        assert insights["total_action_items"] == 4
+        assert insights["total_decisions"] == 2
+        assert insights["action_item_counts_by_owner"] == {"Ann": 2, "Bob": 1, "Unassigned": 1}
+        assert [item["task"] for item in insights["action_items_by_owner"]["Ann"]] == ["Archive", "Ship"]
+        assert not any("transcription" in statement for statement in statements)
+        # Totals, counts and items are one statement (one snapshot); the meeting list is the other
+        assert len(statements) == 2
+
+        response = client.post(
+            "/api/insights/cross-meeting?all_meetings=true&start_date=2024-05-01T00:00:00&owner=Ann"
+        )
+        insights = response.json()
+        assert insights["total_meetings"] == 1
+        assert insights["meetings"][0]["title"] == "Recent"
+        assert insights["action_item_counts_by_owner"] == {"Ann": 1}
+
+        # Items without an owner are listed, and filtered, as "Unassigned"
+        insights = client.post("/api/insights/cross-meeting?all_meetings=true&owner=Unassigned").json()
+        assert insights["total_meetings"] == 1
+        assert insights["action_item_counts_by_owner"] == {"Unassigned": 1}
+        assert [item["task"] for item in insights["action_items_by_owner"]["Unassigned"]] == ["Review"]
+
+        # The lists are capped, the totals and counts are not
+        insights = client.post("/api/insights/cross-meeting?all_meetings=true&items_per_owner=1&meetings_limit=2").json()
+        assert [item["task"] for item in insights["action_items_by_owner"]["Ann"]] == ["Archive"]
+        assert insights["action_item_counts_by_owner"]["Ann"] == 2
+        assert [meeting["title"] for meeting in insights["meetings"]] == ["Other", "Recent"]
+        assert insights["total_meetings"] == 3
+        assert client.post("/api/insights/cross-meeting?all_meetings=true&items_per_owner=0").status_code == 422
+
+        response = client.post("/api/insights/cross-meeting?all_meetings=true&start_date=2025-01-01T00:00:00")
+        assert response.json()["total_meetings"] == 0
+        assert response.json()["total_action_items"] == 0
+        assert response.json()["action_items_by_owner"] == {}
+
+    def test_meeting_items_follow_json_columns(self):
+        """Test that normalized action items track edits, deletes and legacy rows"""
+        db = next(override_get_db())
+        meeting = Meeting(title="Sync", action_items=[{"task": "One", "owner": "Ann"}])
+        db.add(meeting)
+        db.commit()
+
+        meeting.action_items = [{"task": "Two", "owner": "Bob"}, {"task": "Three", "owner": "Bob"}]
+        db.commit()
+        rows = db.query(ActionItemRecord.task, ActionItemRecord.owner).order_by(ActionItemRecord.position).all()
+        assert rows == [("Two", "Bob"), ("Three", "Bob")]
+
+        db.delete(meeting)
+        db.commit()
+        assert db.query(ActionItemRecord).count() == 0
+
+        # Rows written before the item tables existed are filled in by the migration
+        with engine.begin() as connection:
+            connection.execute(
+                text("INSERT INTO meetings (title, action_items, decisions) VALUES ('Legacy', :items, :decisions)"),
+                {"items": json.dumps([{"task": "Old", "owner": "Ann"}]),
+                 "decisions": json.dumps([{"decision": "Keep"}])}
+            )
+        assert backfill_meeting_items(engine) == 1
+        assert backfill_meeting_items(engine) == 0
+        assert db.query(ActionItemRecord.task).scalar() == "Old"
+        assert db.query(DecisionRecord.decision).scalar() == "Keep"
+
+        # The pass is recorded as done, so later startups do not scan the meetings again
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO meetings (title, action_items) VALUES ('Late', :items)"),
+                               {"items": json.dumps([{"task": "Skipped"}])})
+        assert backfill_meeting_items(engine) == 0
+        assert db.query(ActionItemRecord).count() == 1
+
     # Service Tests - Using synchronous test approach
     @patch('builtins.open', new_callable=mock_open, read_data=b"fake audio")
     @patch.object(OpenAIService, 'transcribe_audio', new_callable=AsyncMock)
@@ -325,10 +832,1407 @@ class TestMeetingIntelligencePlatform:
         db.add(meeting)
         db.commit()
 
-        # Run async function in sync context
+        results = run_with_async_db(lambda session: SearchService.search_meetings("test", session))
+
+        assert len(results) > 0
+        assert results[0][0].title == "Test Meeting"
+
+    def test_embedding_index_top_k(self):
+        """Test that the embedding index ranks by cosine similarity"""
+        index = EmbeddingIndex(initial_capacity=2)
+        index.add(1, [1.0, 0.0, 0.0])
+        index.add(2, [0.0, 1.0, 0.0])
+        index.add(3, [1.0, 1.0, 0.0])
+        index.add(4, [0.0, 0.0, 1.0])
+
+        results = index.search([2.0, 0.1, 0.0], top_k=2)
+        assert [meeting_id for meeting_id, _ in results] == [1, 3]
+        assert results[0][1] == pytest.approx(0.99875, abs=1e-4)
+
+        results = index.search([1.0, 0.0, 0.0], top_k=5, exclude_ids=[1])
+        assert [meeting_id for meeting_id, _ in results][0] == 3
+        assert len(results) == 3
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_search_meetings_returns_top_k(self, mock_embed):
+        """Test that search returns only the best top_k meetings in order"""
+        mock_embed.return_value = [1.0, 0.0]
+
+        db = next(override_get_db())
+        for title, embedding in [("East", [1.0, 0.0]), ("North", [0.0, 1.0]), ("North-East", [1.0, 1.0])]:
+            db.add(Meeting(title=title, embedding=embedding))
+        db.commit()
+
+        results = run_with_async_db(lambda session: SearchService.search_meetings("east", session, top_k=2))
+
+        assert [meeting.title for meeting, _ in results] == ["East", "North-East"]
+        assert results[0][1] == pytest.approx(1.0)
+
+    def test_embedding_binary_roundtrip(self):
+        """Test binary embedding encoding in float32 and float16"""
+        vector = [0.25, -0.5, 0.125]
+
+        blob = encode_embedding(vector)
+        assert len(blob) == 8 + 3 * 4
+        decoded = decode_embedding(blob)
+        assert decoded.dtype.name == "float32"
+        assert decoded.tolist() == vector
+
+        half = decode_embedding(encode_embedding(vector, dtype="float16"))
+        assert half.dtype.name == "float16"
+        assert half.tolist() == vector
+
+        # Legacy JSON text, including the double-encoded form, still decodes
+        assert decode_embedding(json.dumps(json.dumps(vector))).tolist() == vector
+
+    def test_migrate_legacy_json_embeddings(self):
+        """Test that JSON text embeddings are rewritten as binary in place"""
+        import migrations
+        from database import encode_embedding
+        with engine.begin() as connection:
+            connection.execute(
+                text("INSERT INTO meetings (title, embedding) VALUES ('Legacy', :embedding)"),
+                {"embedding": json.dumps(json.dumps([0.1, 0.2]))}
+            )
+            connection.execute(
+                text("INSERT INTO meetings (title, embedding) VALUES ('Binary', :embedding)"),
+                {"embedding": encode_embedding([0.3, 0.4])}
+            )
+
+        # Rows already in the binary format are skipped in SQL, not read back
+        with patch.object(migrations, "_legacy_embedding", wraps=migrations._legacy_embedding) as decoded:
+            assert migrate_embeddings_to_binary(engine) == 1
+            assert decoded.call_count == 1
+            assert migrate_embeddings_to_binary(engine) == 0
+            assert decoded.call_count == 1
+
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT typeof(embedding) FROM meetings")).scalar() == "blob"
+
+        db = next(override_get_db())
+        meeting = db.query(Meeting).filter(Meeting.title == "Legacy").first()
+        assert meeting.embedding.tolist() == pytest.approx([0.1, 0.2])
+        meeting = db.query(Meeting).filter(Meeting.title == "Binary").first()
+        assert meeting.embedding.tolist() == pytest.approx([0.3, 0.4])
+
+    def test_sqlite_engine_configured_for_concurrency(self):
+        """Test WAL mode and pragmas, and that an open read does not block a writer"""
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+        with engine.connect() as reader:
+            reader.execute(text("BEGIN"))
+            assert reader.execute(text("SELECT count(*) FROM meetings")).scalar() == 0
+            with engine.begin() as writer:
+                writer.execute(text("INSERT INTO meetings (title) VALUES ('Concurrent')"))
+            # The reader keeps its snapshot until its transaction ends
+            assert reader.execute(text("SELECT count(*) FROM meetings")).scalar() == 0
+            reader.execute(text("COMMIT"))
+            assert reader.execute(text("SELECT count(*) FROM meetings")).scalar() == 1
+
+    def test_async_sessions_do_not_block_the_event_loop(self):
+        """Test that a slow query on an async session leaves the event loop free"""
+        slow_query = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 2000000) "
+                          "SELECT count(*) FROM c")
+        ticks = []
+
+        async def ticker(done):
+            while not done.is_set():
+                ticks.append(1)
+                await asyncio.sleep(0.005)
+
+        async def run(session):
+            done = asyncio.Event()
+            task = asyncio.create_task(ticker(done))
+            count = await session.scalar(slow_query)
+            done.set()
+            await task
+            return count
+
+        assert run_with_async_db(run) == 2000000
+        assert len(ticks) > 3
+
+    def test_sync_session_writes_do_not_stall_async_writers(self):
+        """Test that a pipeline write waiting on SQLite's lock leaves the event loop free for its holder"""
+        import time
+        from database import run_sync
+
+        def rename(session, title):
+            session.add(Meeting(title=title))
+            session.commit()
+
+        # A pooled connection can hold statements prepared before this test recreated the
+        # schema. Re-preparing one inside the transaction reads the FTS config first, and
+        # SQLite then fails the write at once instead of waiting for the lock.
+        engine.dispose()
+
+        async def run():
+            sync_session = TestingSessionLocal()
+            try:
+                async with TestingAsyncSessionLocal() as holder:
+                    holder.add(Meeting(title="Async writer"))
+                    await holder.flush()  # Takes the write lock until commit
+
+                    async def release():
+                        await asyncio.sleep(0.05)
+                        await holder.commit()
+
+                    started = time.perf_counter()
+                    await asyncio.gather(run_sync(sync_session, rename, "Pipeline writer"), release())
+                    return time.perf_counter() - started
+            finally:
+                sync_session.close()
+
         loop = asyncio.new_event_loop()
-        results = loop.run_until_complete(SearchService.search_meetings("test", db))
+        elapsed = loop.run_until_complete(run())
         loop.close()
 
-        assert len(results) > 0
-        assert results[0][0].title == "Test Meeting"
\ No newline at end of file
+        # Blocking the loop would hold the lock holder up for the whole busy timeout
+        assert elapsed < 1.0
+        db = next(override_get_db())
+        assert {title for title, in db.query(Meeting.title)} == {"Async writer", "Pipeline writer"}
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_search_results_never_lazy_load(self, mock_embed):
+        """Test that search loads only result columns and refuses implicit loads"""
+        from sqlalchemy.exc import InvalidRequestError
+        mock_embed.return_value = [1.0, 0.0]
+        db = next(override_get_db())
+        db.add(Meeting(title="Eager", summary="Loaded", transcription="Not loaded", embedding=[1.0, 0.0]))
+        db.commit()
+
+        async def search(session):
+            meeting, _ = (await SearchService.search_meetings("eager", session))[0]
+            assert meeting.summary == "Loaded"
+            with pytest.raises(InvalidRequestError):
+                meeting.transcription
+            return meeting.title
+
+        assert run_with_async_db(search) == "Eager"
+
+    def test_async_database_url(self):
+        """Test that the async engine addresses the same database through an asyncio driver"""
+        assert async_database_url("sqlite:///./meetings.db") == "sqlite+aiosqlite:///./meetings.db"
+        assert async_database_url("postgresql://user:secret@db/meetings") == \
+            "postgresql+asyncpg://user:secret@db/meetings"
+        assert async_database_url("postgresql+psycopg2://db/meetings") == "postgresql+asyncpg://db/meetings"
+        assert async_database_url("sqlite+aiosqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+    def test_server_engine_options(self):
+        """Test pool sizing and pre-ping for PostgreSQL, and the optional search path"""
+        options = engine_options("postgresql://user@localhost/meetings")
+        assert options["pool_pre_ping"] is True
+        assert options["pool_size"] == 10 and options["max_overflow"] == 20
+        assert "connect_args" not in options
+
+        with patch("database.DATABASE_SCHEMA", "meetings,public"):
+            options = engine_options("postgresql+psycopg://user@localhost/meetings")
+        assert options["connect_args"] == {"options": "-csearch_path=meetings,public"}
+        assert "pool_size" not in engine_options("sqlite:///./other.db")
+
+    @pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set")
+    def test_postgres_engine_round_trip(self):
+        """Test storing and searching embeddings on a local PostgreSQL server"""
+        import numpy as np
+        pg_engine = create_db_engine(os.environ["TEST_POSTGRES_URL"])
+        init_db(pg_engine)
+        PgSession = sessionmaker(bind=pg_engine)
+        db = PgSession()
+        try:
+            meeting = Meeting(title="Postgres", embedding=[1.0, 0.0, 0.0])
+            db.add(meeting)
+            db.commit()
+            assert db.get(Meeting, meeting.id).embedding.tolist() == [1.0, 0.0, 0.0]
+            if pg_engine.dialect.name == "postgresql" and os.getenv("USE_PGVECTOR"):
+                pg_async = create_async_db_engine(os.environ["TEST_POSTGRES_URL"], poolclass=NullPool)
+
+                async def rank():
+                    async with async_sessionmaker(pg_async)() as session:
+                        return await SearchService._pgvector_ranking(np.array([1.0, 0.0, 0.0]), session, 1)
+
+                ranked = asyncio.run(rank())
+                assert ranked[0][0] == meeting.id
+        finally:
+            db.close()
+            Base.metadata.drop_all(bind=pg_engine)
+            pg_engine.dispose()
+
+    def test_ivf_index_matches_exact_search(self):
+        """Test IVF search against exact search, incremental adds and persistence"""
+        import numpy as np
+        rng = np.random.default_rng(7)
+        vectors = rng.standard_normal((600, 16)).astype(np.float32)
+
+        exact = EmbeddingIndex()
+        ivf = IVFIndex(nlist=8, nprobe=2, min_train_size=500)
+        for meeting_id, vector in enumerate(vectors, start=1):
+            exact.add(meeting_id, vector)
+            ivf.add(meeting_id, vector)
+        assert ivf.is_trained
+
+        query = rng.standard_normal(16)
+        expected = [meeting_id for meeting_id, _ in exact.search(query, 10)]
+        # Probing every list is exhaustive, so results must match exactly
+        assert [meeting_id for meeting_id, _ in ivf.search(query, 10, nprobe=8)] == expected
+        assert len(ivf.search(query, 10)) == 10
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            ivf.save(path)
+            restored = IVFIndex(nlist=8, nprobe=2, min_train_size=500)
+            assert restored.load(path)
+            assert not EmbeddingIndex().load(path)
+        assert restored.is_trained
+        assert restored.search(query, 10, nprobe=3) == ivf.search(query, 10, nprobe=3)
+
+    @patch.object(OpenAIService, 'generate_embeddings', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'transcribe_audio', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'analyze_meeting', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'draft_summary', new_callable=AsyncMock)
+    def test_pipeline_retries_and_records_failure(self, mock_draft, mock_embed, mock_analyze, mock_transcribe,
+                                                  mock_embeds):
+        """Test that stages are retried and a persistent failure is recorded"""
+        mock_transcribe.side_effect = [Exception("Whisper timeout"), "Recovered transcription"]
+        mock_analyze.side_effect = Exception("GPT unavailable")
+        mock_embed.return_value = [0.1] * 8
+        mock_embeds.return_value = [[0.1] * 8]
+        mock_draft.return_value = {"summary": "Draft", "key_points": []}
+
+        db = next(override_get_db())
+        meeting = Meeting(title="Retry Meeting", audio_filename="retry.mp3")
+        db.add(meeting)
+        db.commit()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(pipeline.process(meeting.id, "retry.mp3"))
+        loop.close()
+
+        response = client.get(f"/api/meetings/{meeting.id}/status")
+        assert response.status_code == 200
+        status = response.json()
+        assert status["status"] == "failed"
+        assert "GPT unavailable" in status["error"]
+        assert status["stages"]["transcription"]["status"] == "completed"
+        assert status["stages"]["transcription"]["attempts"] == 2
+        assert status["stages"]["analysis"]["attempts"] == pipeline.max_attempts
+        # Embedding only needs the transcript, so it still ran
+        assert status["stages"]["embedding"]["status"] == "completed"
+
+    def test_meeting_status_not_found(self):
+        """Test status of a non-existent meeting"""
+        response = client.get("/api/meetings/999/status")
+        assert response.status_code == 404
+
+    def test_scheduler_retries_rate_limited_requests(self):
+        """Test that 429 responses from a fake OpenAI server are retried after Retry-After"""
+        import time
+        import httpx
+        import openai
+        from services import openai_service
+
+        calls = []
+
+        def handler(request):
+            calls.append(time.perf_counter())
+            if "quota" in request.content.decode():
+                return httpx.Response(429, json={"error": {"message": "Quota exceeded", "code": "insufficient_quota"}})
+            if len(calls) <= 2:
+                return httpx.Response(429, headers={"retry-after-ms": "50"},
+                                      json={"error": {"message": "Rate limit reached", "code": "rate_limit_exceeded"}})
+            return httpx.Response(200, json={
+                "object": "list", "model": "text-embedding-3-small",
+                "data": [{"object": "embedding", "index": 0, "embedding": [0.1, 0.2]}],
+                "usage": {"prompt_tokens": 2, "total_tokens": 2},
+            })
+
+        async def run():
+            fake_client = openai.AsyncOpenAI(
+                api_key="test", base_url="http://fake-openai/v1", max_retries=0,
+                http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            )
+            with patch.object(openai_service, "get_client", return_value=fake_client):
+                embedding = await OpenAIService.generate_embedding("hello")
+                with pytest.raises(openai.RateLimitError):
+                    await OpenAIService.generate_embedding("quota")
+            await fake_client.close()
+            return embedding, OpenAIService.scheduler_stats()
+
+        loop = asyncio.new_event_loop()
+        embedding, stats = loop.run_until_complete(run())
+        loop.close()
+
+        assert embedding == [0.1, 0.2]
+        # Two rate-limited attempts, a success, then one unretried quota error
+        assert len(calls) == 4
+        assert calls[1] - calls[0] >= 0.05 and calls[2] - calls[1] >= 0.05
+        assert stats["requests"] == 4 and stats["rate_limited"] == 3
+        assert stats["retries"] == 2 and stats["failures"] == 1
+        assert stats["waits"]["interactive"]["count"] == 4
+
+    def test_scheduler_retries_transient_failures(self):
+        """Test that 5xx responses and dropped connections are retried, and give up after max_retries"""
+        import httpx
+        import openai
+        from services.request_scheduler import RequestScheduler
+
+        outcomes = [httpx.Response(500, json={"error": {"message": "Server error"}}), httpx.ConnectError("reset"),
+                    httpx.Response(200, json={
+                        "object": "list", "model": "text-embedding-3-small",
+                        "data": [{"object": "embedding", "index": 0, "embedding": [0.5]}],
+                        "usage": {"prompt_tokens": 1, "total_tokens": 1},
+                    })]
+
+        def handler(request):
+            outcome = outcomes.pop(0) if outcomes else httpx.Response(503, json={"error": {"message": "Down"}})
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        async def run():
+            fake_client = openai.AsyncOpenAI(
+                api_key="test", base_url="http://fake-openai/v1", max_retries=0,
+                http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            )
+            scheduler = RequestScheduler({"embeddings": 2}, max_retries=2, backoff=0.001)
+
+            def embed():
+                return fake_client.embeddings.create(model="text-embedding-3-small", input=["x"])
+
+            response = await scheduler.call("embeddings", "text-embedding-3-small", embed)
+            with pytest.raises(openai.InternalServerError):
+                await scheduler.call("embeddings", "text-embedding-3-small", embed)
+            await fake_client.close()
+            return response, scheduler.stats()
+
+        loop = asyncio.new_event_loop()
+        response, stats = loop.run_until_complete(run())
+        loop.close()
+
+        assert response.data[0].embedding == [0.5]
+        # A 500 and a dropped connection before the success, then three 503s in a row
+        assert stats["requests"] == 6 and stats["transient_errors"] == 5
+        assert stats["retries"] == 4 and stats["failures"] == 1
+
+    def test_scheduler_serves_priorities_in_order(self):
+        """Test that queued OpenAI requests run interactive first, then translation, then batch"""
+        from services.request_scheduler import Priority, RequestScheduler, request_priority
+
+        order = []
+
+        async def run():
+            scheduler = RequestScheduler({"chat": 1})
+            release = asyncio.Event()
+
+            async def request(name):
+                if name == "first":
+                    await release.wait()
+                order.append(name)
+
+            def submit(name, priority):
+                return asyncio.create_task(scheduler.call("chat", "model", lambda: request(name), priority))
+
+            tasks = [submit("first", Priority.BATCH)]
+            await asyncio.sleep(0)
+            tasks.append(submit("batch", Priority.BATCH))
+            with request_priority(Priority.BATCH):
+                # Started inside batch work, so queued behind the translation despite its own priority
+                tasks.append(submit("background search", Priority.INTERACTIVE))
+            tasks.append(submit("translation", Priority.TRANSLATION))
+            tasks.append(submit("search", Priority.INTERACTIVE))
+            await asyncio.sleep(0.01)
+            stats = scheduler.stats()
+            release.set()
+            await asyncio.gather(*tasks)
+            return stats
+
+        loop = asyncio.new_event_loop()
+        stats = loop.run_until_complete(run())
+        loop.close()
+
+        assert order == ["first", "search", "translation", "batch", "background search"]
+        assert stats["in_flight"]["chat"] == 1
+        assert stats["queued"] == {"endpoint:chat": {"batch": 2, "translation": 1, "interactive": 1}}
+
+    def test_scheduler_token_budgets(self):
+        """Test per-model request and token buckets, usage correction and server pauses"""
+        import time
+        from services.request_scheduler import ModelBudget, RequestScheduler, parse_rate_limits
+
+        assert parse_rate_limits("gpt-4o=500:30000, text-embedding-3-small=3000") == {
+            "gpt-4o": (500.0, 30000.0), "text-embedding-3-small": (3000.0, 0.0)
+        }
+
+        now = [0.0]
+        budget = ModelBudget(requests_per_minute=60, tokens_per_minute=600, clock=lambda: now[0])
+        assert budget.delay(600) == 0
+        budget.requests.take(1)
+        budget.tokens.take(600)
+        # Ten tokens a second refill the empty bucket
+        assert budget.delay(60) == pytest.approx(6.0)
+        # The response reported 100 tokens used, not the 600 estimated
+        budget.tokens.give_back(500)
+        assert budget.delay(60) == pytest.approx(0.0)
+        now[0] += 1
+        budget.pause(5)
+        assert budget.delay(1) == pytest.approx(5.0)
+        now[0] += 5
+        assert budget.delay(1) == pytest.approx(0.0)
+
+        async def run():
+            scheduler = RequestScheduler({"chat": 4}, {"model": (0, 6000)})
+
+            async def request():
+                return None
+
+            await scheduler.call("chat", "model", request, tokens=6000)
+            started = time.perf_counter()
+            await scheduler.call("chat", "model", request, tokens=10)
+            return time.perf_counter() - started
+
+        loop = asyncio.new_event_loop()
+        waited = loop.run_until_complete(run())
+        loop.close()
+        # 6000 tokens a minute is 100 a second, so ten more take about 0.1s
+        assert waited >= 0.09
+
+    def test_fake_openai_server(self):
+        """Test the real request path against the offline OpenAI stand-in, including injected 429s"""
+        import httpx
+        import numpy as np
+        import openai
+        from benchmarks.fake_openai import FakeConfig, create_app, fake_embedding
+        from services import openai_service
+
+        fake_app = create_app(FakeConfig(dim=64, latency_scale=0.0, rate_limit_fraction=0.3, retry_after_ms=1, seed=3))
+        audio_path = Path(self.upload_dir.name) / "fake.mp3"
+        audio_path.write_bytes(b"ID3" + b"\x00" * 64)
+
+        async def run():
+            fake_client = openai.AsyncOpenAI(
+                api_key="fake", base_url="http://fake-openai/v1", max_retries=0,
+                http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app))
+            )
+            with patch.object(openai_service, "get_client", return_value=fake_client):
+                results = await asyncio.gather(
+                    OpenAIService.generate_embeddings(["budget forecast review", "budget forecast spend",
+                                                       "hiring interview loop"]),
+                    OpenAIService.generate_embedding("budget forecast review"),
+                    OpenAIService.analyze_meeting("We agreed to ship the beta."),
+                    OpenAIService.translate_text("Hello team", "fr"),
+                    OpenAIService.transcribe_audio(str(audio_path)),
+                    OpenAIService.generate_visual_summary("Roadmap review", ["Ship the beta"]),
+                )
+            await fake_client.close()
+            return results
+
+        loop = asyncio.new_event_loop()
+        (budget, related, hiring), single, analysis, translated, transcript, image = loop.run_until_complete(run())
+        loop.close()
+
+        # Deterministic, unit length, and closer for shared vocabulary
+        assert np.allclose(budget, single) and np.allclose(single, fake_embedding("budget forecast review", 64))
+        assert np.linalg.norm(budget) == pytest.approx(1.0, abs=1e-5)
+        assert np.dot(budget, related) > np.dot(budget, hiring)
+        assert analysis["summary"] and len(analysis["action_items"]) == 3
+        assert translated == "Hello team"
+        assert transcript.endswith(".")
+        assert image.startswith(b"\x89PNG")
+        assert fake_app.state.counts["rate_limited"] > 0
+
+    def test_seed_synthetic_meetings(self):
+        """Test that the seed tool writes processed meetings with fake-server embeddings and item rows"""
+        import numpy as np
+        from benchmarks.fake_openai import fake_embedding
+        from benchmarks.seed import seed
+
+        first_id = seed(engine, 25, dim=32, words=40, batch_size=10)
+        assert first_id == 1
+        db = next(override_get_db())
+        meetings = db.query(Meeting).order_by(Meeting.id).all()
+        assert len(meetings) == 25
+        assert {meeting.status for meeting in meetings} == {"completed"}
+        meeting = meetings[7]
+        assert np.allclose(meeting.embedding, fake_embedding(f"{meeting.title}\n{meeting.transcription}", 32))
+        assert db.query(ActionItemRecord).count() == sum(len(m.action_items) for m in meetings)
+        assert db.query(DecisionRecord).count() == sum(len(m.decisions) for m in meetings)
+
+        # Seeding again continues after the existing meetings
+        assert seed(engine, 5, dim=32, words=10) == 26
+
+    def test_api_load_report_and_baseline(self):
+        """Test the load benchmark's percentiles and its regression check against a baseline"""
+        import httpx
+        from benchmarks.api_load import compare_to_baseline, median_of_rounds, parse_mix, run_load, summarize
+
+        stats = summarize({"list": [(i / 1000, i != 100) for i in range(1, 101)], "similar": []}, elapsed=2.0)
+        assert stats == {"list": {"requests": 100, "errors": 1, "error_rate": 0.01, "rps": 50.0,
+                                  "p50_ms": 50.5, "p95_ms": 95.05, "p99_ms": 99.01}}
+
+        baseline = {"list": {**stats["list"], "p95_ms": 50.0}, "search": stats["list"]}
+        regressions = compare_to_baseline(stats, baseline, tolerance=0.25)
+        assert regressions == ["list: p95_ms 95.0 > baseline 50.0", "search: no requests were made"]
+        assert compare_to_baseline(stats, {"list": stats["list"]}) == []
+        # A noisy tail alone is not a regression
+        assert compare_to_baseline(stats, {"list": {**stats["list"], "p99_ms": 10.0}}) == []
+
+        slow = {"list": {**stats["list"], "p50_ms": 500.0}}
+        assert median_of_rounds([stats, slow, stats])["list"] == {**stats["list"], "requests": 300, "errors": 3}
+
+        with pytest.raises(ValueError):
+            parse_mix("list=1,nope=2")
+
+        db = next(override_get_db())
+        db.add(Meeting(title="Load", summary="Summary"))
+        db.commit()
+        loop = asyncio.new_event_loop()
+        results = loop.run_until_complete(run_load(
+            "http://app", parse_mix("list=1,insights=1"), duration=0.2, concurrency=2,
+            transport=httpx.ASGITransport(app=app)
+        ))
+        loop.close()
+        assert set(results) == {"list", "insights"}
+        assert results["list"]["requests"] > 0 and results["list"]["errors"] == 0
+
+    def test_metrics_endpoint(self):
+        """Test that /metrics reports request latency, query counts and rows per route template"""
+        from services.metrics import HTTP_REQUEST_SECONDS, registry
+
+        registry.clear()
+        db = next(override_get_db())
+        db.add(Meeting(title="Metrics", transcription="Text", summary="Summary"))
+        db.commit()
+
+        assert client.get("/api/meetings").status_code == 200
+        meeting_id = client.get("/api/meetings").json()[0]["id"]
+        assert client.get(f"/api/meetings/{meeting_id}").status_code == 200
+        assert client.get("/api/meetings/999999").status_code == 404
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert HTTP_REQUEST_SECONDS.count(method="GET", route="/api/meetings", status="200") == 2
+        # Paths are labelled by their template, so ids do not multiply the series
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/meetings/{meeting_id}",status="200"} 1' in body
+        assert 'route="/api/meetings/{meeting_id}",status="404"' in body
+        assert "/api/meetings/999999" not in body
+        assert 'http_request_db_queries_count{route="/api/meetings"} 2' in body
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/api/meetings",status="200",le="+Inf"} 2' in body
+        assert "# TYPE db_query_duration_seconds histogram" in body
+        assert 'db_query_duration_seconds_count{statement="select"}' in body
+        assert "db_rows_loaded_total" in body
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_server_timing_header(self, mock_embed):
+        """Test the per-request Server-Timing breakdown of a semantic search"""
+        mock_embed.return_value = [0.1] * 1536
+        db = next(override_get_db())
+        db.add(Meeting(title="Timed", transcription="Text", summary="Summary", embedding=[0.1] * 1536))
+        db.commit()
+
+        response = client.post("/api/meetings/search", json={"query": "timed"}, headers={"X-Server-Timing": "1"})
+        assert response.status_code == 200
+        timing = response.headers["server-timing"]
+        entries = {entry.split(";")[0] for entry in timing.split(", ")}
+        assert {"search.index_sync", "search.embed", "search.scan", "search.fetch", "db", "total"} <= entries
+        assert 'queries, ' in timing and "rows" in timing
+
+        # Off unless asked for (or METRICS_SERVER_TIMING=true)
+        response = client.post("/api/meetings/search", json={"query": "timed"})
+        assert "server-timing" not in response.headers
+
+    def test_openai_calls_are_timed(self):
+        """Test OpenAI call timers with model labels, outcomes and reported token usage"""
+        import httpx
+        import openai
+        from services import openai_service
+        from services.metrics import OPENAI_REQUEST_SECONDS, OPENAI_TOKENS, registry
+
+        def handler(request):
+            if b"broken" in request.content:
+                return httpx.Response(400, json={"error": {"message": "Bad request"}})
+            return httpx.Response(200, json={
+                "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "Bonjour"}}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+            })
+
+        async def run():
+            fake_client = openai.AsyncOpenAI(
+                api_key="test", base_url="http://fake-openai/v1", max_retries=0,
+                http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            )
+            with patch.object(openai_service, "get_client", return_value=fake_client), \
+                    patch.object(openai_service, "TRANSLATION_MODEL", "gpt-4o-mini"):
+                translated = await OpenAIService.translate_text("Hello", "fr")
+                with pytest.raises(openai.BadRequestError):
+                    await OpenAIService.translate_text("broken", "fr")
+            await fake_client.close()
+            return translated
+
+        registry.clear()
+        loop = asyncio.new_event_loop()
+        translated = loop.run_until_complete(run())
+        loop.close()
+
+        assert translated == "Bonjour"
+        assert OPENAI_REQUEST_SECONDS.count(endpoint="chat", model="gpt-4o-mini", outcome="ok") == 1
+        assert OPENAI_REQUEST_SECONDS.count(endpoint="chat", model="gpt-4o-mini", outcome="BadRequestError") == 1
+        assert OPENAI_TOKENS.value(model="gpt-4o-mini", type="prompt") == 12
+        assert OPENAI_TOKENS.value(model="gpt-4o-mini", type="completion") == 3
+
+    def test_sampling_profiler(self):
+        """Test the runtime-toggled sampling profiler and its debug endpoints"""
+        import threading
+        import time
+        from services.profiler import SamplingProfiler, profiler
+
+        sampler = SamplingProfiler(enabled=True)
+        done = threading.Event()
+
+        def busy_profiled_work():
+            while not done.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_profiled_work, name="busy-worker")
+        worker.start()
+        try:
+            assert sampler.start(interval_ms=2)
+            assert not sampler.start()
+            time.sleep(0.2)
+            collapsed = sampler.stop()
+        finally:
+            done.set()
+            worker.join()
+
+        assert not sampler.running and sampler.stats()["samples"] > 10
+        stacks = dict(line.rsplit(" ", 1) for line in collapsed.splitlines())
+        busy = [stack for stack in stacks if stack.startswith("busy-worker;")]
+        assert busy and all("busy_profiled_work (test_all.py)" in stack for stack in busy)
+        # The sampler never records itself
+        assert not any(stack.startswith("sampling-profiler") for stack in stacks)
+
+        assert client.post("/api/debug/profiler/start").status_code == 404
+        with patch.object(profiler, "enabled", True):
+            assert client.post("/api/debug/profiler/start", params={"interval_ms": 5}).json()["running"] is True
+            assert client.post("/api/debug/profiler/start").status_code == 409
+            time.sleep(0.05)
+            response = client.post("/api/debug/profiler/stop")
+            assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+            assert response.text.strip()
+            assert client.get("/api/debug/profiler").json()["running"] is False
+
+    def test_visual_serving(self):
+        """Test content-addressed visuals served with strong ETags, immutable caching and ranges"""
+        from benchmarks.fake_openai import fake_png
+        from services.visual_store import UnsupportedImage
+
+        image = fake_png(b"served")
+        digest = visual_store.save(image)
+        assert visual_store.save(image) == digest
+        with pytest.raises(UnsupportedImage):
+            visual_store.save(b"<html>not an image</html>")
+
+        response = client.get(f"/api/visuals/{digest}")
+        assert response.status_code == 200
+        assert response.content == image
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["etag"] == f'"{digest}"'
+        assert "immutable" in response.headers["cache-control"]
+
+        response = client.get(f"/api/visuals/{digest}", headers={"If-None-Match": f'W/"other", "{digest}"'})
+        assert response.status_code == 304 and response.content == b""
+
+        response = client.get(f"/api/visuals/{digest}", headers={"Range": "bytes=0-7"})
+        assert response.status_code == 206
+        assert response.content == image[:8]
+        assert response.headers["content-range"] == f"bytes 0-7/{len(image)}"
+        # A changed representation ignores the range and sends the whole image
+        response = client.get(f"/api/visuals/{digest}", headers={"Range": "bytes=0-7", "If-Range": '"stale"'})
+        assert response.status_code == 200 and response.content == image
+
+        assert client.get(f"/api/visuals/{digest}", params={"size": "huge"}).status_code == 400
+        assert client.get(f"/api/visuals/{'0' * 64}").status_code == 404
+        assert client.get("/api/visuals/..%2F..%2Fetc").status_code == 404
+
+        # Meetings from before the store keep their remote URL and have no thumbnail
+        db = next(override_get_db())
+        db.add(Meeting(title="Old", visual_summary_url="https://example.com/expired.png"))
+        db.commit()
+        listed = client.get("/api/meetings", params={"fields": "visual_thumbnail_url"}).json()
+        assert listed == [{"id": listed[0]["id"], "visual_thumbnail_url": None}]
+
+    def test_visual_sizes_without_pillow(self):
+        """Test that without Pillow no variant URLs are given out and fallbacks are not cached for good"""
+        from benchmarks.fake_openai import fake_png
+        from services.visual_store import variant_url, visual_url
+
+        image = fake_png(b"no pillow")
+        digest = visual_store.save(image)
+        with patch("services.visual_store.Image", None):
+            assert variant_url(visual_url(digest), "thumb") is None
+            response = client.get(f"/api/visuals/{digest}", params={"size": "thumb"})
+        assert response.status_code == 200 and response.content == image
+        assert response.headers["etag"] == f'"{digest}"'
+        assert "immutable" not in response.headers["cache-control"]
+
+    def test_visual_variants(self):
+        """Test that resized WebP variants are made once, on first request"""
+        import io
+        pytest.importorskip("PIL")
+        from PIL import Image
+        from benchmarks.fake_openai import fake_png
+
+        digest = visual_store.save(fake_png(b"variants", size=600))
+        response = client.get(f"/api/visuals/{digest}", params={"size": "thumb"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["etag"] == f'"{digest}-thumb"'
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            assert thumbnail.format == "WEBP" and max(thumbnail.size) == 256
+
+        variant = visual_store.variant(digest, "thumb")
+        modified = os.path.getmtime(variant.path)
+        assert client.get(f"/api/visuals/{digest}", params={"size": "thumb"}).content == response.content
+        assert os.path.getmtime(variant.path) == modified
+        assert client.get(f"/api/visuals/{digest}", params={"size": "medium"}).headers["etag"] == f'"{digest}-medium"'
+
+    def test_meeting_conditional_get(self):
+        """Test that an unchanged meeting is answered with 304 without reading its transcript"""
+        db = next(override_get_db())
+        meeting = Meeting(title="Cached", transcription="A long discussion. " * 200, language="en")
+        db.add(meeting)
+        db.commit()
+
+        response = client.get(f"/api/meetings/{meeting.id}")
+        assert response.status_code == 200
+        assert response.json()["transcription"] == meeting.transcription
+        etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+        assert etag.startswith('W/"') and response.headers["cache-control"] == "private, no-cache"
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            revalidated = client.get(f"/api/meetings/{meeting.id}", headers={"If-None-Match": etag})
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+        assert statements and not any("transcription" in statement for statement in statements)
+        assert client.get(f"/api/meetings/{meeting.id}",
+                          headers={"If-Modified-Since": last_modified}).status_code == 304
+
+        # Any write to the meeting gives it a new version
+        meeting.summary = "Now summarized"
+        db.commit()
+        changed = client.get(f"/api/meetings/{meeting.id}", headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.json()["summary"] == "Now summarized"
+        assert changed.headers["etag"] != etag
+        assert client.get("/api/meetings/999999", headers={"If-None-Match": etag}).status_code == 404
+
+    def test_saved_translation_changes_translations_etag(self):
+        """Test that storing a translation invalidates cached copies of the meeting's translations"""
+        from services.translation import save_translation
+
+        db = next(override_get_db())
+        meeting = Meeting(title="Versioned", transcription="Hello there.")
+        db.add(meeting)
+        db.commit()
+
+        empty = client.get(f"/api/meetings/{meeting.id}/translations")
+        assert empty.status_code == 200 and empty.json() == []
+        etag = empty.headers["etag"]
+        assert client.get(f"/api/meetings/{meeting.id}/translations",
+                          headers={"If-None-Match": etag}).status_code == 304
+
+        run_with_async_db(lambda session: save_translation(session, meeting.id, "fr", "Bonjour."))
+        response = client.get(f"/api/meetings/{meeting.id}/translations", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()[0]["translated_text"] == "Bonjour."
+        assert response.headers["etag"] != etag
+        db.refresh(meeting)
+        assert meeting.version == 2
+
+    def test_large_responses_are_compressed(self):
+        """Test that large meeting responses are gzip-compressed for clients that accept it"""
+        from services.http_cache import COMPRESS_MIN_BYTES, choose_encoding
+
+        db = next(override_get_db())
+        large = Meeting(title="Large", transcription="Quarterly planning notes. " * 500)
+        small = Meeting(title="Small", transcription="Short.")
+        db.add_all([large, small])
+        db.commit()
+        assert len(large.transcription) > COMPRESS_MIN_BYTES
+
+        response = client.get(f"/api/meetings/{large.id}", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(large.transcription) / 4
+        assert response.json()["transcription"] == large.transcription
+
+        brotli_response = client.get(f"/api/meetings/{large.id}", headers={"Accept-Encoding": "gzip, br"})
+        assert brotli_response.headers["content-encoding"] == "br"
+        assert brotli_response.json() == response.json()
+
+        identity = client.get(f"/api/meetings/{large.id}", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+        assert identity.json() == response.json()
+        assert "content-encoding" not in client.get(f"/api/meetings/{small.id}",
+                                                    headers={"Accept-Encoding": "gzip"}).headers
+
+        assert choose_encoding("gzip;q=0, identity") is None
+        assert choose_encoding("deflate, *") == "br"
+        assert choose_encoding("br;q=0, gzip") == "gzip"
+        assert choose_encoding(None) is None
+
+    def test_openai_service_requests_overlap(self):
+        """Test that concurrent OpenAI calls overlap and respect the endpoint limit"""
+        import time
+        from types import SimpleNamespace
+        from services import openai_service
+
+        in_flight = {"now": 0, "peak": 0}
+
+        async def fake_create(**kwargs):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.05)
+            in_flight["now"] -= 1
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.5, 0.5])])
+
+        fake_client = SimpleNamespace(embeddings=SimpleNamespace(create=fake_create))
+
+        async def run():
+            return await asyncio.gather(*(OpenAIService.generate_embedding(f"text {i}") for i in range(8)))
+
+        with patch.object(openai_service, 'get_client', return_value=fake_client), \
+                patch.dict(openai_service.ENDPOINT_CONCURRENCY, {"embedding": 4}):
+            loop = asyncio.new_event_loop()
+            started = time.perf_counter()
+            results = loop.run_until_complete(run())
+            elapsed = time.perf_counter() - started
+            loop.close()
+
+        assert results == [[0.5, 0.5]] * 8
+        assert in_flight["peak"] == 4
+        # Two waves of four 50ms calls, not eight sequential ones
+        assert elapsed < 0.3
+
+    @patch.object(OpenAIService, 'generate_embeddings', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'transcribe_audio', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'analyze_meeting', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'draft_summary', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'generate_visual_summary', new_callable=AsyncMock)
+    def test_pipeline_runs_stages_in_parallel(self, mock_visual, mock_draft, mock_embed, mock_analyze,
+                                              mock_transcribe, mock_embeds):
+        """Test that independent stages overlap and a visual failure keeps the rest"""
+        import time
+
+        def slow(result, delay=0.1):
+            async def call(*args, **kwargs):
+                await asyncio.sleep(delay)
+                if isinstance(result, Exception):
+                    raise result
+                return result
+            return call
+
+        mock_transcribe.return_value = "Transcript"
+        mock_analyze.side_effect = slow({"summary": "Summary", "action_items": [], "decisions": []})
+        mock_embed.side_effect = slow([0.3, 0.4])
+        mock_embeds.side_effect = slow([[0.3, 0.4]])
+        mock_draft.side_effect = slow({"summary": "Draft", "key_points": ["Ship it"]}, delay=0.05)
+        mock_visual.side_effect = slow(Exception("DALL-E rejected prompt"), delay=0.01)
+
+        db = next(override_get_db())
+        meeting = Meeting(title="Parallel Meeting", audio_filename="parallel.mp3")
+        db.add(meeting)
+        db.commit()
+
+        loop = asyncio.new_event_loop()
+        started = time.perf_counter()
+        loop.run_until_complete(pipeline.process(meeting.id, "parallel.mp3"))
+        elapsed = time.perf_counter() - started
+        loop.close()
+
+        # Analysis, embedding and draft+visual overlap instead of running back to back
+        assert elapsed < 0.25
+
+        status = client.get(f"/api/meetings/{meeting.id}/status").json()
+        assert status["status"] == "partial"
+        assert "DALL-E rejected prompt" in status["error"]
+        assert status["stages"]["visual"]["status"] == "failed"
+        assert status["stages"]["analysis"]["status"] == "completed"
+
+        data = client.get(f"/api/meetings/{meeting.id}").json()
+        assert data["summary"] == "Summary"
+        mock_visual.assert_called_with("Draft", ["Ship it"])
+
+    def test_chunked_transcription_with_fake_backend(self):
+        """Test WAV splitting, bounded parallel chunk transcription and stitching"""
+        import wave
+        import numpy as np
+
+        rate = 1000
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "long.wav")
+            # Second i of the recording carries the constant sample value i + 1, i.e. "word{i + 1}"
+            samples = np.repeat(np.arange(1, 26, dtype="<i2") * 100, rate)
+            with wave.open(path, "wb") as audio:
+                audio.setnchannels(1)
+                audio.setsampwidth(2)
+                audio.setframerate(rate)
+                audio.writeframes(samples.tobytes())
+
+            class FakeBackend:
+                def __init__(self):
+                    self.in_flight = 0
+                    self.peak = 0
+
+                async def transcribe(self, file_path):
+                    self.in_flight += 1
+                    self.peak = max(self.peak, self.in_flight)
+                    await asyncio.sleep(0.02)
+                    self.in_flight -= 1
+                    with wave.open(file_path, "rb") as chunk:
+                        values = np.frombuffer(chunk.readframes(chunk.getnframes()), dtype="<i2")
+                    return [
+                        Segment(second, second + 1, f"word{values[second * rate] // 100}")
+                        for second in range(len(values) // rate)
+                    ]
+
+            backend = FakeBackend()
+            transcriber = ChunkedTranscriber(backend, window_seconds=10, overlap_seconds=2,
+                                             silence_search_seconds=0, max_concurrency=2)
+            loop = asyncio.new_event_loop()
+            transcript = loop.run_until_complete(transcriber.transcribe(path))
+            loop.close()
+
+        assert transcript.text == " ".join(f"word{i}" for i in range(1, 26))
+        assert [segment.start for segment in transcript.segments] == list(range(25))
+        assert backend.peak == 2
+
+    def test_stitch_segments_drops_repeated_overlap_words(self):
+        """Test that words repeated across a chunk boundary are de-duplicated"""
+        chunks = [AudioChunk(0, 0.0, 10.0, "a.wav"), AudioChunk(1, 8.0, 18.0, "b.wav")]
+        segments = [
+            [Segment(0.0, 5.0, "We agreed to ship"), Segment(5.0, 9.5, "the release on Friday.")],
+            [Segment(1.0, 3.0, "on Friday. Next,"), Segment(3.0, 6.0, "budget review.")],
+        ]
+
+        stitched = stitch_segments(segments, chunks)
+
+        assert " ".join(segment.text for segment in stitched) == \
+            "We agreed to ship the release on Friday. Next, budget review."
+        assert stitched[-1].start == 11.0
+
+    @patch.object(OpenAIService, 'generate_embeddings', new_callable=AsyncMock)
+    @patch.object(pipeline, 'submit')
+    @patch.object(OpenAIService, 'transcribe_audio', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'analyze_meeting', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'draft_summary', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'generate_visual_summary', new_callable=AsyncMock)
+    def test_duplicate_upload_reuses_blob_and_results(self, mock_visual, mock_draft, mock_embed, mock_analyze,
+                                                      mock_transcribe, mock_submit, mock_embeds):
+        """Test that re-uploading the same audio reuses the stored file and cached results"""
+        from benchmarks.fake_openai import fake_png
+
+        mock_transcribe.return_value = "Same recording"
+        mock_analyze.return_value = {"summary": "Summary", "action_items": [], "decisions": []}
+        mock_embed.return_value = [0.6, 0.8]
+        mock_embeds.side_effect = lambda texts: [[0.8, 0.6] for _ in texts]
+        mock_draft.return_value = {"summary": "Draft", "key_points": ["Point"]}
+        mock_visual.return_value = fake_png(b"visual")
+        content = b"ID3" + b"same bytes" * 100
+
+        loop = asyncio.new_event_loop()
+        meeting_ids, paths = [], []
+        for title in ["Original", "Original"]:
+            response = client.post(
+                "/api/meetings/upload",
+                data={"title": title},
+                files={"audio_file": (f"{title}.mp3", content, "audio/mpeg")}
+            )
+            assert response.status_code == 202
+            meeting_id, path = mock_submit.call_args[0]
+            loop.run_until_complete(pipeline.process(meeting_id, path))
+            meeting_ids.append(meeting_id)
+            paths.append(path)
+        loop.close()
+
+        assert paths[0] == paths[1]
+        assert os.path.basename(paths[0]).startswith(os.path.basename(os.path.dirname(paths[0])))
+        stored_files = [f for _, _, files in os.walk(audio_store.root) for f in files]
+        assert len(stored_files) == 1
+
+        # The second meeting was processed without any API calls: passages through the
+        # embedding cache, every other stage through the result cache
+        for mock in (mock_transcribe, mock_analyze, mock_embed, mock_draft, mock_visual, mock_embeds):
+            assert mock.await_count == 1
+        status = client.get(f"/api/meetings/{meeting_ids[1]}/status").json()
+        assert status["status"] == "completed"
+        assert all(stage["cached"] for name, stage in status["stages"].items() if name != "passages")
+        assert client.get(f"/api/meetings/{meeting_ids[1]}").json()["summary"] == "Summary"
+
+        stats = client.get("/api/cache/stats").json()["processing"]
+        assert stats["hits"] == 5
+        assert stats["misses"] == 5
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_query_embedding_cache_tiers(self, mock_embed):
+        """Test that repeated queries are served from the memory tier, then the database tier"""
+        db = TestingSessionLocal()
+        db.add(Meeting(title="Roadmap", summary="Q3 roadmap", embedding=[1.0, 0.0]))
+        db.commit()
+        mock_embed.return_value = [1.0, 0.0]
+
+        for query in ["Product roadmap", "  product   ROADMAP "]:
+            results = run_with_async_db(lambda session: SearchService.search_meetings(query, session))
+            assert results[0][0].title == "Roadmap"
+        assert mock_embed.await_count == 1
+
+        # A fresh process only has the persisted tier
+        embedding_cache.clear_memory()
+        run_with_async_db(lambda session: SearchService.search_meetings("product roadmap", session))
+        assert mock_embed.await_count == 1
+
+        stats = client.get("/api/cache/stats").json()["embeddings"]
+        assert stats["misses"] == 1
+        assert stats["memory_hits"] == 1
+        assert stats["db_hits"] == 1
+        assert stats["db_size"] == 1
+
+        # Changing the embedding model misses the cache and drops the old rows
+        with patch('services.openai_service.EMBEDDING_MODEL', 'text-embedding-3-large'):
+            run_with_async_db(lambda session: SearchService.search_meetings("product roadmap", session))
+            assert mock_embed.await_count == 2
+            assert embedding_cache.invalidate_stale_models(db) == 1
+        db.close()
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_embedding_cache_ttl_and_lru_bounds(self, mock_embed):
+        """Test that expired entries are re-embedded and both tiers stay within their bounds"""
+        from services.embedding_cache import EmbeddingCache
+        from database import EmbeddingCacheEntry
+        cache = EmbeddingCache(max_size=2, ttl_seconds=60, max_rows=2)
+        mock_embed.return_value = [0.5, 0.5]
+        db = TestingSessionLocal()
+
+        loop = asyncio.new_event_loop()
+        for text in ["a", "b", "c"]:
+            loop.run_until_complete(cache.get_or_create(text, db))
+        assert cache.stats()["memory_size"] == 2
+        assert cache.stats()["evictions"] == 1
+
+        # Age every persisted row past the TTL
+        db.query(EmbeddingCacheEntry).update({"created_at": datetime.utcnow() - timedelta(seconds=120)})
+        db.commit()
+        cache.clear_memory()
+        loop.run_until_complete(cache.get_or_create("a", db))
+        assert mock_embed.await_count == 4
+        assert cache.stats()["expired"] == 1
+
+        assert cache.prune(db) == 2
+        assert db.query(EmbeddingCacheEntry).count() == 1
+        loop.close()
+        db.close()
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_keyword_search_without_network(self, mock_embed):
+        """Test that keyword search finds exact terms locally and tracks updates"""
+        db = TestingSessionLocal()
+        db.add(Meeting(title="Sprint review", summary="Demoed the release",
+                       transcription="We closed ticket JIRA-4521 and Priya owns the follow-up",
+                       action_items=[{"task": "Ship hotfix", "owner": "Priya", "deadline": None}]))
+        db.add(Meeting(title="Budget planning", summary="Discussed the Q3 budget", transcription="Numbers"))
+        db.commit()
+
+        response = client.post("/api/meetings/search", json={"query": "JIRA-4521", "mode": "keyword"})
+        assert response.status_code == 200
+        assert [r["title"] for r in response.json()] == ["Sprint review"]
+
+        # Action item text is indexed, and punctuation is never parsed as query syntax
+        response = client.post("/api/meetings/search", json={"query": 'hotfix "ship" AND:(', "mode": "keyword"})
+        assert [r["title"] for r in response.json()] == ["Sprint review"]
+
+        # Edits are picked up by the index triggers
+        budget = db.query(Meeting).filter(Meeting.title == "Budget planning").first()
+        budget.summary = "Priya presented the budget"
+        db.commit()
+        response = client.post("/api/meetings/search", json={"query": "priya", "mode": "keyword"})
+        assert {r["title"] for r in response.json()} == {"Sprint review", "Budget planning"}
+        mock_embed.assert_not_called()
+        db.close()
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    def test_hybrid_search_fuses_rankings(self, mock_embed):
+        """Test that hybrid search combines keyword and vector rankings and survives embedding failures"""
+        from services.keyword_index import reciprocal_rank_fusion
+        assert reciprocal_rank_fusion([[(1, 9.0), (2, 5.0)], [(2, 0.9), (3, 0.8)]])[0][0] == 2
+
+        db = TestingSessionLocal()
+        db.add(Meeting(title="Incident INC-77 postmortem", summary="Outage review", embedding=[0.0, 1.0]))
+        db.add(Meeting(title="Reliability sync", summary="Uptime goals", embedding=[1.0, 0.0]))
+        db.commit()
+        db.close()
+
+        mock_embed.return_value = [1.0, 0.0]
+        response = client.post("/api/meetings/search", json={"query": "INC-77", "mode": "hybrid", "top_k": 2})
+        # The keyword match also appears in the vector ranking, so it outranks the vector-only hit
+        assert [r["title"] for r in response.json()] == ["Incident INC-77 postmortem", "Reliability sync"]
+
+        mock_embed.side_effect = Exception("API unavailable")
+        response = client.post("/api/meetings/search", json={"query": "INC-77 postmortem", "mode": "hybrid"})
+        assert response.status_code == 200
+        assert [r["title"] for r in response.json()] == ["Incident INC-77 postmortem"]
+
+    def test_split_passages_overlap_and_times(self):
+        """Test that passages overlap, end on sentence breaks and map to segment times"""
+        segments = [{"start": i * 10.0, "end": i * 10.0 + 9.5, "text": f"Sentence number {i} is here."}
+                    for i in range(40)]
+        text = " ".join(segment["text"] for segment in segments)
+        spans = split_passages(text, size=200, overlap=50, segments=segments)
+
+        assert spans[0].start_char == 0 and spans[-1].end_char == len(text)
+        for previous, span in zip(spans, spans[1:]):
+            assert span.start_char < previous.end_char  # consecutive passages overlap
+            assert text[previous.end_char - 1] == "."
+            assert text[span.start_char - 1] == " "
+        assert spans[0].start_time == 0.0
+        assert spans[-1].end_time == segments[-1]["end"]
+
+    def test_passage_index_aggregates_per_meeting(self):
+        """Test max and sum aggregation of passage scores into meeting scores"""
+        from services.passage_index import PassageIndex
+        index = PassageIndex()
+        index.add(1, [1.0, 0.0], meeting_id=10)   # one perfect passage
+        index.add(2, [0.8, 0.6], meeting_id=20)   # several good passages
+        index.add(3, [0.8, 0.6], meeting_id=20)
+        index.add(4, [0.0, 1.0], meeting_id=20)
+
+        by_max = index.search_meetings([1.0, 0.0], top_k=2, aggregate="max")
+        assert [meeting_id for meeting_id, _, _ in by_max] == [10, 20]
+        by_sum = index.search_meetings([1.0, 0.0], top_k=2, aggregate="sum")
+        assert [meeting_id for meeting_id, _, _ in by_sum] == [20, 10]
+        assert by_sum[0][1] == pytest.approx(1.6)
+        assert [passage_id for passage_id, _ in by_sum[0][2]][:2] == [2, 3]
+
+    @patch.object(OpenAIService, 'generate_embedding', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'generate_embeddings', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'draft_summary', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'analyze_meeting', new_callable=AsyncMock)
+    @patch.object(OpenAIService, 'transcribe_audio', new_callable=AsyncMock)
+    def test_passage_search_returns_offsets(self, mock_transcribe, mock_analyze, mock_draft, mock_embeds,
+                                            mock_embed):
+        """Test that transcripts are embedded in one batch and search returns the matching passage"""
+        filler = "We talked about the weather and weekend plans at some length. " * 20
+        transcript = filler + "The budget for the data platform migration was approved. " + filler
+        mock_transcribe.return_value = transcript
+        mock_analyze.return_value = {"summary": "Weather chat", "action_items": [], "decisions": []}
+        mock_draft.return_value = {"summary": "Draft", "key_points": []}
+        mock_embeds.side_effect = lambda texts: [[1.0, 0.0] if "budget" in t else [0.0, 1.0] for t in texts]
+        mock_embed.return_value = [0.0, 1.0]
+
+        db = TestingSessionLocal()
+        meeting = Meeting(title="All hands", audio_filename="hands.mp3")
+        db.add(meeting)
+        db.commit()
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(pipeline.process(meeting.id, "hands.mp3"))
+        loop.close()
+
+        # Every passage of the transcript went out in a single embeddings request
+        assert mock_embeds.await_count == 1
+        assert len(mock_embeds.await_args[0][0]) > 2
+
+        mock_embed.return_value = [1.0, 0.0]
+        response = client.post("/api/meetings/search", json={
+            "query": "platform budget", "granularity": "passage", "aggregate": "max"
+        })
+        assert response.status_code == 200
+        result = response.json()[0]
+        best = result["passages"][0]
+        assert "budget for the data platform" in best["text"]
+        assert transcript[best["start_char"]:best["end_char"]] == best["text"]
+        assert best["score"] == pytest.approx(1.0)
+        assert result["excerpt"].startswith(best["text"][:50])
+
+        response = client.post("/api/meetings/search", json={
+            "query": "platform budget", "granularity": "passage", "mode": "keyword"
+        })
+        assert response.status_code == 400
+        db.close()
+
+    def test_neighbor_rebuild_matches_brute_force(self):
+        """Test that the chunked rebuild and incremental updates match exact top-k neighbours"""
+        import numpy as np
+        from services import neighbors
+        from services.neighbors import rebuild_neighbors, update_neighbors, get_neighbors
+        rng = np.random.default_rng(7)
+        vectors = rng.normal(size=(30, 8)).astype(np.float32)
+        db = TestingSessionLocal()
+        for i, vector in enumerate(vectors[:29]):
+            db.add(Meeting(title=f"Meeting {i}", embedding=vector.tolist()))
+        db.commit()
+
+        # A tiny block size forces many chunks
+        assert rebuild_neighbors(db, k=5, block_bytes=8 * 4 * 29) == 29
+
+        def brute_force(meeting_id, count):
+            ids = [m.id for m in db.query(Meeting.id).order_by(Meeting.id)]
+            matrix = vectors[:len(ids)] / np.linalg.norm(vectors[:len(ids)], axis=1, keepdims=True)
+            scores = matrix @ matrix[ids.index(meeting_id)]
+            order = [ids[i] for i in np.argsort(-scores) if ids[i] != meeting_id]
+            return order[:count]
+
+        first = db.query(Meeting).order_by(Meeting.id).first()
+        assert [n for n, _ in get_neighbors(db, first.id, 5)] == brute_force(first.id, 5)
+
+        # Every full list records its weakest score
+        first_floor = db.query(Meeting.neighbor_floor).filter(Meeting.id == first.id).scalar()
+        assert first_floor == pytest.approx(get_neighbors(db, first.id, 5)[-1][1])
+
+        # A new meeting joins the lists it belongs in without a rebuild, and only those are touched
+        new = Meeting(title="Newcomer", embedding=vectors[29].tolist())
+        db.add(new)
+        db.commit()
+        with patch("services.neighbors._enter_lists", wraps=neighbors._enter_lists) as entering:
+            update_neighbors(db, new.id, k=5)
+        joined = {meeting.id for meeting in db.query(Meeting.id) if new.id in brute_force(meeting.id, 5)}
+        assert joined and set(entering.call_args[0][2]) == joined
+        for meeting in db.query(Meeting.id, Meeting.neighbors_updated_at, Meeting.neighbor_floor):
+            assert meeting.neighbors_updated_at is not None
+            stored = get_neighbors(db, meeting.id, 5)
+            assert [n for n, _ in stored] == brute_force(meeting.id, 5)
+            assert meeting.neighbor_floor == pytest.approx(stored[-1][1])
+        db.close()
+
+    def test_similar_meetings_use_stored_neighbors(self):
+        """Test that the similar endpoint reads the neighbour table and recomputes stale lists"""
+        from database import MeetingNeighbor
+        db = TestingSessionLocal()
+        target = Meeting(title="Target", embedding=[1.0, 0.0])
+        close = Meeting(title="Close", embedding=[0.9, 0.1])
+        far = Meeting(title="Far", embedding=[0.0, 1.0])
+        db.add_all([target, close, far])
+        db.commit()
+
+        # No list yet: computed on demand and stored
+        response = client.get(f"/api/meetings/{target.id}/similar")
+        assert [r["title"] for r in response.json()] == ["Close", "Far"]
+        db.expire_all()
+        assert db.get(Meeting, target.id).neighbors_updated_at is not None
+
+        # A fresh list is served straight from the table
+        db.query(MeetingNeighbor).filter(MeetingNeighbor.neighbor_id == far.id).update({"score": 2.0})
+        db.commit()
+        response = client.get(f"/api/meetings/{target.id}/similar?top_k=1")
+        assert [r["title"] for r in response.json()] == ["Far"]
+        db.close()
+
+    @patch.object(OpenAIService, 'generate_embeddings', new_callable=AsyncMock)
+    def test_reembed_resumes_and_swaps_atomically(self, mock_embed):
+        """Test that re-embedding stages vectors, resumes after a failure and swaps them in at the end"""
+        from services.reembed import AdaptiveConcurrency, SOURCES, reembed, stage_embeddings
+        db = TestingSessionLocal()
+        for i in range(5):
+            db.add(Meeting(title=f"M{i}", transcription=f"talk {i}", embedding=[1.0, 0.0], embedding_version="old:1"))
+        db.add(Meeting(title="No transcript"))
+        db.commit()
+
+        calls = []
+
+        async def embed(texts):
+            calls.append(list(texts))
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return [[float(len(calls)), 1.0, 0.0] for _ in texts]
+
+        mock_embed.side_effect = embed
+        loop = asyncio.new_event_loop()
+        with pytest.raises(RuntimeError):
+            loop.run_until_complete(stage_embeddings(db, SOURCES["meetings"], "new:1", batch_size=2,
+                                                     controller=AdaptiveConcurrency(max_limit=1)))
+        assert calls[0] == ["M0\ntalk 0", "M1\ntalk 1"]
+        # The first page is checkpointed, but search still sees only the old vectors
+        assert db.query(ReembedStaging).count() == 2
+        assert {m.embedding_version for m in db.query(Meeting).filter(Meeting.transcription.isnot(None))} == {"old:1"}
+
+        # A server running through the re-embedding holds the old vectors
+        server = EmbeddingIndex()
+        server.build(db)
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("services.reembed.embedding_version", return_value="new:1"), \
+                patch("services.reembed.default_index_path", return_value=os.path.join(tmp, "index.npz")):
+            counts = loop.run_until_complete(reembed(db, ["meetings"], batch_size=2, concurrency=1))
+            # Shutting the server down must not replace the rebuilt file with its stale index
+            assert not server.save(os.path.join(tmp, "index.npz"), keep_other_stamps=True)
+            restored = EmbeddingIndex()
+            assert restored.load(os.path.join(tmp, "index.npz"))
+        loop.close()
+        assert restored.stamp and restored.stamp.startswith("new:1:")
+        assert server.dimension == 2
+        server.sync(db)
+        assert server.dimension == 3 and server.stamp == restored.stamp
+
+        assert counts == {"meetings": 5}
+        assert len(calls) == 4  # the failed page is retried, staged pages are not
+        db.expire_all()
+        meetings = db.query(Meeting).filter(Meeting.transcription.isnot(None)).all()
+        assert {m.embedding_version for m in meetings} == {"new:1"}
+        assert all(m.embedding.shape == (3,) for m in meetings)
+        assert all(m.neighbors_updated_at is not None for m in meetings)
+        assert db.query(ReembedStaging).count() == 0
+        assert len(restored) == 5 and restored.dimension == 3
+        db.close()
+
+    def test_reembed_backs_off_on_rate_limits(self):
+        """Test that a 429 halves the request concurrency while the scheduler retries the batch"""
+        import httpx
+        import openai
+        from services import openai_service
+        from services.reembed import AdaptiveConcurrency
+        calls = []
+
+        def handler(request):
+            texts = json.loads(request.content)["input"]
+            calls.append(texts)
+            if len(calls) == 1:
+                return httpx.Response(429, headers={"retry-after-ms": "10"},
+                                      json={"error": {"message": "Rate limit reached", "code": "rate_limit_exceeded"}})
+            return httpx.Response(200, json={
+                "object": "list", "model": "text-embedding-3-small",
+                "data": [{"object": "embedding", "index": i, "embedding": [float(len(text))]}
+                         for i, text in enumerate(texts)],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1},
+            })
+
+        async def run():
+            fake_client = openai.AsyncOpenAI(
+                api_key="test", base_url="http://fake-openai/v1", max_retries=0,
+                http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            )
+            with patch.object(openai_service, "get_client", return_value=fake_client):
+                embeddings = await controller.embed(["a", "bb", "ccc", "dddd", "eeeee"], batch_size=2)
+            await fake_client.close()
+            return embeddings
+
+        controller = AdaptiveConcurrency(max_limit=4)
+        loop = asyncio.new_event_loop()
+        embeddings = loop.run_until_complete(run())
+        loop.close()
+
+        assert embeddings == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+        # Three batches plus the one retry, made by the scheduler
+        assert len(calls) == 4
+        assert controller.rate_limited == 1
+        assert controller.limit < 4